@@ -1,4 +1,5 @@
 # app/__init__.py
+import click
 from flask import Flask
 from .config import Config
 from .extensions import cache
@@ -11,7 +12,50 @@ def create_app() -> Flask:
     app = Flask(__name__, template_folder="templates", static_folder="static")
     app.config.from_object(Config)
 
-        # --- Авто-создание таблиц при первом запуске ---
+    # --- БД: движок создаётся при первом обращении к ней (services.db), схема — отдельным шагом ---
+    app.cli.add_command(init_db_command)
+    if app.config.get("DB_AUTO_INIT"):
+        _init_db(app)
+
+    cache.init_app(app)
+
+    from .services import query_profiler
+    query_profiler.configure(
+        enabled=app.config.get("SQL_PROFILE"),
+        slow_ms=app.config.get("SQL_SLOW_MS"),
+        n1_threshold=app.config.get("SQL_N1_THRESHOLD"),
+    )
+    query_profiler.init_app(app)  # профиль SQL и метрики запроса (METRICS_ENABLED) — одни хуки
+
+    from .services import fragment_cache, snapshot_cache, snapshot_storage
+    from .services.board_registry import get_registry
+    snapshot_cache.configure(
+        ttl=app.config.get("SNAPSHOT_TIMELINE_TTL"),
+        lru_size=app.config.get("SNAPSHOT_LRU_SIZE"),
+    )
+    fragment_cache.configure(size=app.config.get("FRAGMENT_CACHE_SIZE"))
+    snapshot_storage.configure_from(app.config, partition_by_board=get_registry(app).partitions())
+
+    app.register_blueprint(main_bp)
+    app.register_blueprint(market_bp, url_prefix="/market")
+
+    # --- Фоновый коллектор снимков внутри веб-процесса ---
+    # Стартуем на первом запросе: родительский процесс debug-reloader'а запросов
+    # не обслуживает, так что второго потока не будет. Воркеров gunicorn несколько —
+    # коллектор запустит только взявший COLLECTOR_LOCK_FILE, остальные в standby
+    if app.config.get("COLLECTOR_MODE") == "thread":
+        from .services.collector import SnapshotCollector
+        collector = SnapshotCollector(app)
+        app.extensions["moex_collector"] = collector
+
+        @app.before_request
+        def _start_collector():
+            collector.start()
+    return app
+
+
+def _init_db(app: Flask) -> None:
+    """Старое поведение (DB_AUTO_INIT=1): таблицы и миграции при каждом старте процесса."""
     try:
         from .services.init_db import create_all_tables
         with app.app_context():
@@ -20,8 +64,9 @@ def create_app() -> Flask:
         app.logger.warning(f"DB init skipped: {e}")
 
 
-    cache.init_app(app)
-
-    app.register_blueprint(main_bp)
-    app.register_blueprint(market_bp, url_prefix="/market")
-    return app
+@click.command("init-db")
+def init_db_command():
+    """Создать таблицы и применить миграции схемы (flask --app run init-db)."""
+    from .services.init_db import create_all_tables
+    steps = create_all_tables()
+    click.echo("SQLite: таблицы созданы." + (f" Миграции: {', '.join(steps)}" if steps else ""))
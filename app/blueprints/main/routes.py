@@ -1,4 +1,5 @@
-from flask import Blueprint, render_template, current_app
+from flask import Blueprint, render_template, current_app, abort, Response
+from ...services import metrics
 
 bp = Blueprint("main", __name__)
 
@@ -18,3 +19,11 @@ def contacts():
     return render_template("contacts.html",
                            page_title="Контакты",
                            contacts=contact_info)
+
+@bp.get("/metrics")
+def metrics_page():
+    # Метрики процесса для Prometheus (text exposition format)
+    if not current_app.config.get("METRICS_ENABLED", True):
+        abort(404)
+    return Response(metrics.render(), content_type=metrics.CONTENT_TYPE,
+                    headers={"Cache-Control": "no-store"})
@@ -1,47 +1,226 @@
 # app/blueprints/market/routes.py
-from flask import Blueprint, render_template, request, jsonify, abort, current_app, g, Response
-from ...extensions import cache
-from ...services.moex_client import MoexClient
-from ...services.heatmap_service import HeatmapService
+"""
+Роуты рынка. Тяжёлые модули (SQLAlchemy и репозиторий, requests и клиент MOEX, NumPy,
+экспорт, SSE) импортируются при первом использовании, а не при старте воркера:
+create_app остаётся дешёвым, а воркер не держит в памяти то, чем не пользуется.
+"""
+from __future__ import annotations
+from typing import TYPE_CHECKING
+
+from flask import (Blueprint, render_template, request, jsonify, abort, current_app, Response, send_file,
+                   get_template_attribute)
 from ...services.search_service import SearchService
+from ...services.board_registry import get_registry
+from ...services.fragment_cache import fragments
 
-from ...services.repository import MoexRepository
 from ...services.time_utils import parse_iso_utc
+from ...services.downsample import parse_step, bucket_last, lttb
+from ...services.snapshot_stats import diff_tiles
+from ...services import json_responses
+from ...services import metrics
 
-from datetime import datetime
-import csv
-from io import StringIO
+from datetime import datetime, timezone
+
+if TYPE_CHECKING:
+    from ...services.live_stream import TileBroadcaster
+    from ...services.moex_client import MoexClient
+    from ...services.repository import MoexRepository
 
 bp = Blueprint("market", __name__, template_folder="../../templates")
 
-_heatmap = HeatmapService()
 _search = SearchService()
 
 # ---------- helpers ----------
 
+_client: MoexClient | None = None
+
+def _repo() -> MoexRepository:
+    from ...services.repository import MoexRepository
+    return MoexRepository()
+
+def _time_arg(name: str) -> datetime | None:
+    """
+    Момент из ?name=YYYY-MM-DD[ HH:MM[:SS]]: нет параметра — None, не разобрался — 400.
+    Иначе опечатка в границе молча превращает запрос в открытый диапазон (например, выгрузку «до сейчас»).
+    """
+    value = request.args.get(name)
+    if value is None or not value.strip():
+        return None
+    parsed = parse_iso_utc(value)
+    if parsed is None:
+        abort(400, description=f"{name}: expected YYYY-MM-DD or YYYY-MM-DD HH:MM, got {value!r}")
+    return parsed
+
 def _get_client() -> MoexClient:
-    if not hasattr(g, "_moex_client"):
-        g._moex_client = MoexClient(
-            timeout=current_app.config.get("HTTP_TIMEOUT", 10),
-            retries=current_app.config.get("HTTP_RETRIES", 2),
+    """Один клиент на процесс: пул соединений транспорта переиспользуется между запросами."""
+    global _client
+    if _client is None:
+        from ...services.http_transport import get_transport
+        from ...services.moex_client import MoexClient
+        cfg = current_app.config
+        _client = MoexClient(
+            timeout=cfg.get("HTTP_TIMEOUT", 10),
+            retries=cfg.get("HTTP_RETRIES", 2),
+            transport=get_transport(cfg.get("HTTP_POOL_SIZE", 10)),
+            base=cfg.get("ISS_BASE_URL"),
+            reference_cache=cfg.get("ISS_REFERENCE_CACHE", True),
+            session_roll=cfg.get("ISS_SESSION_ROLL"),
+            reference_max_age=cfg.get("ISS_REFERENCE_MAX_AGE", 0),
+            marketdata_columns=cfg.get("ISS_MARKETDATA_COLUMNS"),
         )
-    return g._moex_client
+    return _client
+
+def _get_entries(specs: list[dict], fresh: bool = False):
+    """
+    Записи кэша {"tiles", "version", "fetched_at"} сразу по нескольким бордам.
+    - свежая запись — отдаём как есть;
+    - устаревшая (старше TILES_CACHE_TTL) — отдаём сразу и ставим одно фоновое обновление;
+    - нет записи — грузим из MOEX параллельно, одновременные промахи по борду ждут одну загрузку.
+    Возвращает ({board: entry}, {board: ошибка}); у упавшего борда пустые плитки и version=None.
+    С фоновым коллектором MOEX не опрашивается совсем (fresh тоже) — см. _collected_entries.
+    """
+    from ...services import tile_cache
+    from ...services.board_fetcher import get_fetcher
+    if tile_cache.collector_enabled():
+        return _collected_entries(specs)
+    app = current_app._get_current_object()
+    client = _get_client()
+    columnar = app.config.get("TILES_COLUMNAR", False)
+    fetcher = get_fetcher(
+        max_workers=app.config.get("FETCH_MAX_WORKERS", 8),
+        timeout=app.config.get("FETCH_BOARD_TIMEOUT", 20),
+    )
+
+    def _load(spec):
+        return tile_cache.load_tiles(client, spec, columnar=columnar)
+
+    entries, misses = {}, []
+    for spec in specs:
+        cached = None if fresh else tile_cache.get_entry(spec["engine"], spec["market"], spec["board"])
+        if cached is None:
+            metrics.tiles_cache_total.inc(spec["board"], "miss")
+            misses.append(spec)
+            continue
+        entries[spec["board"]] = cached
+        if tile_cache.is_fresh(cached):
+            metrics.tiles_cache_total.inc(spec["board"], "hit")
+        else:
+            metrics.tiles_cache_total.inc(spec["board"], "stale")
+            tile_cache.refresh_in_background(app, fetcher.submit, spec, _load)
+
+    errors = {}
+    if misses:
+        def _fetch(spec):
+            with app.app_context():
+                return tile_cache.fetch_entry(spec, _load, timeout=fetcher.timeout)
+
+        loaded, errors = fetcher.fetch_many(misses, _fetch)
+        for spec in misses:
+            entries[spec["board"]] = loaded.get(spec["board"]) or {"tiles": [], "version": None}
+    return entries, errors
+
+def _collected_entries(specs: list[dict]):
+    """
+    Плитки, которые пишет коллектор: запись кэша отдаётся как есть, в том числе устаревшая
+    (обновит её следующий цикл коллектора). Если записи нет — коллектор ещё не прогрел кэш
+    или кэш сброшен, — отдаём последний снимок борда из БД; веб при этом только читает.
+    """
+    from ...services import tile_cache
+    entries, errors, missing = {}, {}, []
+    for spec in specs:
+        cached = tile_cache.get_entry(spec["engine"], spec["market"], spec["board"])
+        if cached is None:
+            metrics.tiles_cache_total.inc(spec["board"], "miss")
+            missing.append(spec)
+            continue
+        metrics.tiles_cache_total.inc(spec["board"], "hit" if tile_cache.is_fresh(cached) else "stale")
+        entries[spec["board"]] = cached
+    if missing:
+        repo = _repo()
+        try:
+            for spec in missing:
+                snap = repo.get_snapshot_by_time(spec["board"], None)
+                if snap is None:
+                    entries[spec["board"]] = {"tiles": [], "version": None}
+                    errors[spec["board"]] = "нет данных: коллектор ещё не собрал борд"
+                    continue
+                entries[spec["board"]] = {
+                    "tiles": repo.get_tiles_for_snapshot_id(snap.id, limit=None),
+                    "version": f"snapshot:{snap.id}",
+                    "fetched_at": snap.created_at.replace(tzinfo=timezone.utc).timestamp(),
+                }
+        finally:
+            repo.close()
+    return entries, errors
 
-def _cache_key(engine: str, market: str, board: str) -> str:
-    return f"board:{engine}:{market}:{board}"
+def _freshness(entries: dict) -> dict:
+    """Возраст данных по бордам: {board: {"age_sec", "stale"}} (для UI и заголовков)."""
+    from ...services import tile_cache
+    return {board: tile_cache.freshness(e) for board, e in entries.items() if e.get("version")}
 
-def _get_tiles(engine: str, market: str, board: str, fresh: bool = False):
-    key = _cache_key(engine, market, board)
-    if not fresh:
-        cached = cache.get(key)
-        if cached is not None:
-            return cached
+def _set_freshness_headers(resp, entries: dict):
+    """X-Data-Age — возраст самых старых данных (сек), X-Data-Stale: 1 — отдали устаревшие."""
+    fresh = [f for f in _freshness(entries).values() if f]
+    if fresh:
+        resp.headers["X-Data-Age"] = str(max(f["age_sec"] for f in fresh))
+        resp.headers["X-Data-Stale"] = "1" if any(f["stale"] for f in fresh) else "0"
+    return resp
+
+def _search_results(query: str, limit: int | None = None) -> list[dict]:
+    """Поиск по бордам реестра через индекс, который перестраивается только при смене данных."""
+    specs = get_registry().specs()
+    entries, _ = _get_entries(specs)
+    tiles = [t for spec in specs for t in entries[spec["board"]]["tiles"]]
+    version = ":".join(str(entries[spec["board"]]["version"]) for spec in specs)
+    return _search.search(tiles, query=query, limit=limit, version=version)
+
+def _sections(tiles: dict) -> list[dict]:
+    """
+    Секции страницы теплокарт в порядке реестра: {"board", "title", "tiles"}.
+    Сетку плиток страница не несёт: список догружается с /market/fragment/grid,
+    только когда пользователь раскрывает его (treemap остаётся основным видом).
+    """
+    return [{"board": b["board"], "title": b["title"], "tiles": tiles.get(b["board"], [])} for b in get_registry()]
+
+def _grid_html(board: str, tiles: list, version) -> str:
+    """Готовый HTML сетки борда: по версии данных берётся из кэша фрагментов (version=None — рендер без кэша)."""
+    render_grid = get_template_attribute("heatmap.html", "render_grid")
+    return fragments.get_or_render(
+        ("grid", board, version) if version is not None else None,
+        lambda: render_grid(tiles, board=board),
+    )
 
-    client = _get_client()
-    data = client.get_board_data(engine, market, board)
-    tiles = _heatmap.compute_tiles(data["rows"])
-    cache.set(key, tiles, timeout=60)
-    return tiles
+def _html_fragment(etag: str | None, render, cache_control: str) -> Response:
+    """HTML-фрагмент с ETag версии данных (как json_responses.cached_json): совпавший If-None-Match — 304 без рендера."""
+    if etag is None:
+        resp = Response(render(), mimetype="text/html")
+        resp.headers["Cache-Control"] = "no-store"
+        return resp
+    resp = Response(status=304) if request.if_none_match.contains(etag) else Response(render(), mimetype="text/html")
+    resp.set_etag(etag)
+    resp.headers["Cache-Control"] = cache_control
+    return resp
+
+def _requested_boards(repo: MoexRepository, value: str | None) -> list[str]:
+    """Борд из ?board=: любой из реестра или уже известный БД (например, найденный коллектором); иначе — весь реестр."""
+    registry = get_registry()
+    board = (value or "").upper().strip()
+    if board and (board in registry or repo.has_board(board)):
+        return [board]
+    return registry.codes()
+
+
+def _get_broadcaster() -> TileBroadcaster:
+    """Одна рассылка SSE на процесс (живёт в app.extensions)."""
+    broadcaster = current_app.extensions.get("moex_broadcaster")
+    if broadcaster is None:
+        from ...services.live_stream import TileBroadcaster
+        cfg = current_app.config
+        broadcaster = current_app.extensions.setdefault("moex_broadcaster", TileBroadcaster(
+            current_app._get_current_object(), get_registry().specs(), _get_entries,
+            interval=cfg.get("LIVE_POLL_INTERVAL", 2), queue_size=cfg.get("LIVE_QUEUE_SIZE", 100),
+        ))
+    return broadcaster
 
 # ---------- routes ----------
 
@@ -55,32 +234,26 @@ def parser_page():
         if current_app.config.get("ADMIN_TOKEN") and token != current_app.config["ADMIN_TOKEN"]:
             abort(403, description="Admin token required for fresh mode")
 
-    # ВАЖНО: получаем конфиг и плитки СНАЧАЛА
-    st = current_app.config["MARKET_STOCK"]  # {'engine','market','board'}
-    ft = current_app.config["MARKET_FUT"]
+    # ВАЖНО: получаем конфиг и плитки СНАЧАЛА (все борды реестра параллельно)
+    specs = get_registry().specs()  # [{'engine','market','board'}]
+    entries, errors = _get_entries(specs, fresh=fresh)
+    tiles = {board: e["tiles"] for board, e in entries.items()}
 
-    stock_tiles = _get_tiles(st["engine"], st["market"], st["board"], fresh=fresh)
-    fut_tiles   = _get_tiles(ft["engine"], ft["market"], ft["board"], fresh=fresh)
-
-    # Сохраняем снимки в БД только в fresh-режиме
-    if fresh:
+    # Сохраняем снимки в БД только в fresh-режиме и только если нет фонового коллектора
+    if fresh and current_app.config.get("COLLECTOR_MODE", "off") == "off":
         repo = None
         try:
-            repo = MoexRepository()
-
-            eng_s = repo._get_or_create_engine(st["engine"], st["engine"].title())
-            mkt_s = repo._get_or_create_market(eng_s, st["market"], st["market"].title())
-            brd_s = repo._get_or_create_board(mkt_s, st["board"], st["board"])
-            snap_s = repo.create_snapshot(brd_s, created_at=datetime.utcnow())
-            repo.add_items(snap_s, _heatmap.to_db_items(stock_tiles))
-
-            eng_f = repo._get_or_create_engine(ft["engine"], ft["engine"].title())
-            mkt_f = repo._get_or_create_market(eng_f, ft["market"], ft["market"].title())
-            brd_f = repo._get_or_create_board(mkt_f, ft["board"], ft["board"])
-            snap_f = repo.create_snapshot(brd_f, created_at=datetime.utcnow())
-            repo.add_items(snap_f, _heatmap.to_db_items(fut_tiles))
-
+            from ...services.heatmap_service import HeatmapService
+            heatmap = HeatmapService()
+            repo = _repo()
+            now = datetime.utcnow()
+            stats = [
+                repo.save_snapshot(spec["engine"], spec["market"], spec["board"],
+                                   heatmap.to_db_items(tiles[spec["board"]]), created_at=now)
+                for spec in specs if spec["board"] not in errors
+            ]
             repo.session.commit()
+            current_app.logger.info(f"DB snapshots saved: {stats}")
         except Exception as e:
             current_app.logger.warning(f"DB snapshot save failed: {e}")
         finally:
@@ -90,11 +263,61 @@ def parser_page():
     return render_template(
         "parser.html",
         page_title="Теплокарты MOEX",
-        stock_tiles=stock_tiles,
-        fut_tiles=fut_tiles,
+        sections=_sections(tiles),
+        errors=errors,
+        freshness=_freshness(entries),
         mode=mode
     )
 
+@bp.get("/stream")
+def stream():
+    """
+    SSE с живыми плитками: при подключении — полный снимок (event: snapshot),
+    дальше только изменившиеся плитки (event: tiles). Раз в LIVE_HEARTBEAT сек — комментарий-пинг,
+    чтобы прокси не рвали соединение, а отключившийся клиент быстрее освобождал поток.
+    """
+    broadcaster = _get_broadcaster()
+    heartbeat = current_app.config.get("LIVE_HEARTBEAT", 15)
+    sub = broadcaster.subscribe()
+
+    def _events():
+        try:
+            yield f"retry: {int(heartbeat * 1000)}\n\n"
+            while True:
+                msg = sub.get(timeout=heartbeat)
+                yield msg if msg is not None else ": ping\n\n"
+        finally:
+            broadcaster.unsubscribe(sub)
+
+    return Response(_events(), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@bp.get("/api/collector")
+def api_collector():
+    """
+    Health фонового коллектора: поток в этом процессе или статус-файл внешнего процесса.
+    Воркер в standby (коллектор работает в соседнем воркере) читает статус-файл владельца.
+    """
+    collector = current_app.extensions.get("moex_collector")
+    if collector is not None and not (collector.standby and current_app.config.get("COLLECTOR_STATUS_FILE")):
+        status = collector.status()
+    else:
+        path = current_app.config.get("COLLECTOR_STATUS_FILE")
+        max_age = 3 * current_app.config.get("COLLECTOR_INTERVAL_OFFHOURS", 900)
+        from ...services.collector import read_status_file
+        status = read_status_file(path, max_age=max_age) if path else None
+    if status is None:
+        return jsonify({"running": False, "healthy": False, "mode": current_app.config.get("COLLECTOR_MODE")}), 503
+    status["mode"] = current_app.config.get("COLLECTOR_MODE")
+    return jsonify(status), (200 if status.get("healthy") else 503)
+
+@bp.get("/api/http-stats")
+def api_http_stats():
+    """Статистика общего HTTP-транспорта: вызовы, задержки, байты до/после распаковки."""
+    from ...services.http_transport import get_transport
+    recent = request.args.get("recent", 20, type=int)
+    return jsonify(get_transport().stats(recent=recent))
+
 @bp.get("/search")
 def search_form():
     return render_template("search.html", page_title="Поиск бумаг")
@@ -102,135 +325,378 @@ def search_form():
 @bp.post("/search")
 def search_post():
     query = request.form.get("query", "")
-
-    st = current_app.config["MARKET_STOCK"]
-    ft = current_app.config["MARKET_FUT"]
-    tiles = []
-    tiles += _get_tiles(st["engine"], st["market"], st["board"], fresh=False)
-    tiles += _get_tiles(ft["engine"], ft["market"], ft["board"], fresh=False)
-
-    results = _search.search(tiles, query=query)
+    results = _search_results(query)
     return render_template("search.html", page_title="Поиск бумаг", query=query, results=results)
 
 @bp.get("/api/heatmap")
 def api_heatmap():
-    st = current_app.config["MARKET_STOCK"]
-    ft = current_app.config["MARKET_FUT"]
-    return jsonify({
-        "stocks": _get_tiles(st["engine"], st["market"], st["board"], fresh=False),
-        "futures": _get_tiles(ft["engine"], ft["market"], ft["board"], fresh=False),
-    })
+    """
+    Плитки бордов реестра — по ключам реестра ({"stocks": [...], "futures": [...]} по умолчанию).
+    ETag — из версий данных: пока кэш не обновился,
+    опрос с If-None-Match получает 304, а тело сериализуется один раз на версию.
+    """
+    boards = list(get_registry())
+    entries, errors = _get_entries(get_registry().specs())
+    etag = None if errors else "heatmap-" + "-".join(str(entries[b["board"]]["version"]) for b in boards)
+
+    def _build():
+        payload = {b["key"]: entries[b["board"]]["tiles"] for b in boards}
+        if errors:
+            payload["errors"] = errors
+        return payload
+
+    resp = json_responses.cached_json(etag, _build, f"public, max-age={current_app.config.get('API_MAX_AGE', 5)}")
+    return _set_freshness_headers(resp, entries)
+
+@bp.get("/api/treemap")
+def api_treemap():
+    """
+    Treemap борда для canvas: /market/api/treemap?board=TQBR[&source=db&at=YYYY-MM-DD[ HH:MM]]
+    Площадь — оборот, цвет — изменение; прямоугольники и цвета считаются на сервере
+    один раз на версию данных борда (версия кэша плиток или id снимка) и отдаются по ETag.
+    """
+    from ...services.treemap import build_treemap
+    cfg = current_app.config
+    width, height = cfg.get("TREEMAP_WIDTH", 1600), cfg.get("TREEMAP_HEIGHT", 900)
+    board = (request.args.get("board") or get_registry().default()).upper().strip()
+
+    if request.args.get("source") == "db":
+        at = parse_iso_utc(request.args.get("at"))
+        repo = _repo()
+        try:
+            sid = repo.find_snapshot_id(board, at)
+            if sid is None:
+                abort(404, description=f"no snapshots for {board}")
+
+            def _build():
+                tiles = repo.get_tiles_for_snapshot_id(sid, limit=None)
+                return {"board": board, "snapshot_id": sid, **build_treemap(tiles, width, height)}
+
+            return json_responses.cached_json(f"treemap-{_snapshot_tag(repo, board, sid)}-{width}x{height}", _build,
+                                              _snapshot_cache_control())
+        finally:
+            repo.close()
+
+    spec = next((s for s in get_registry().specs() if s["board"] == board), None)
+    if spec is None:
+        abort(404, description=f"unknown board {board}")
+    entries, errors = _get_entries([spec])
+    entry = entries[board]
+    version = None if errors else entry.get("version")
+    etag = f"treemap-{board}-{version}-{width}x{height}" if version is not None else None
+
+    def _build():
+        payload = {"board": board, **build_treemap(entry["tiles"], width, height)}
+        if errors:
+            payload["errors"] = errors
+        return payload
+
+    resp = json_responses.cached_json(etag, _build, f"public, max-age={cfg.get('API_MAX_AGE', 5)}")
+    return _set_freshness_headers(resp, entries)
+
+@bp.get("/fragment/grid")
+def grid_fragment():
+    """
+    Сетка плиток борда HTML-фрагментом: /market/fragment/grid?board=TQBR[&source=db&at=...]
+    Страница запрашивает её при первом раскрытии списка плиток. HTML берётся из кэша фрагментов
+    по версии данных борда (версия кэша плиток или id снимка) и отдаётся по ETag.
+    """
+    board = (request.args.get("board") or get_registry().default()).upper().strip()
+
+    if request.args.get("source") == "db":
+        at = parse_iso_utc(request.args.get("at"))
+        repo = _repo()
+        try:
+            sid = repo.find_snapshot_id(board, at)
+            if sid is None:
+                abort(404, description=f"no snapshots for {board}")
+            # Снимок после записи не меняется — его id (с поколением удалений борда) и есть версия данных
+            version = f"snapshot:{_snapshot_tag(repo, board, sid)}"
+            return _html_fragment(
+                f"grid-{version}",
+                lambda: _grid_html(board, repo.get_tiles_for_snapshot_id(sid), version),
+                _snapshot_cache_control(),
+            )
+        finally:
+            repo.close()
+
+    spec = next((s for s in get_registry().specs() if s["board"] == board), None)
+    if spec is None:
+        abort(404, description=f"unknown board {board}")
+    entries, errors = _get_entries([spec])
+    entry = entries[board]
+    version = None if errors else entry.get("version")
+    resp = _html_fragment(
+        f"grid-{board}-{version}" if version is not None else None,
+        lambda: _grid_html(board, entry["tiles"], version),
+        f"public, max-age={current_app.config.get('API_MAX_AGE', 5)}",
+    )
+    return _set_freshness_headers(resp, entries)
 
 @bp.get("/api/search")
 def api_search():
     q = request.args.get("q", "")
-    st = current_app.config["MARKET_STOCK"]
-    ft = current_app.config["MARKET_FUT"]
-    tiles = []
-    tiles += _get_tiles(st["engine"], st["market"], st["board"], fresh=False)
-    tiles += _get_tiles(ft["engine"], ft["market"], ft["board"], fresh=False)
-    return jsonify({"query": q, "results": _search.search(tiles, q)})
+    limit = request.args.get("limit", type=int)
+    return jsonify({"query": q, "results": _search_results(q, limit=limit)})
 
 @bp.get("/snapshot")
 def snapshot_latest():
     """Показывает снимок из SQLite. Поддерживает ?at=YYYY-MM-DD[ HH:MM] (UTC)."""
     at = parse_iso_utc(request.args.get("at"))
 
-    # Инициализируем, чтобы не ловить UnboundLocalError
-    stock_tiles, fut_tiles = [], []
-
-    repo = MoexRepository()
+    repo = _repo()
     try:
-        snap_tqbr = repo.get_snapshot_by_time("TQBR", at)
-        stock_tiles = repo.get_tiles_for_snapshot(snap_tqbr)
-
-        snap_rfud = repo.get_snapshot_by_time("RFUD", at)
-        fut_tiles  = repo.get_tiles_for_snapshot(snap_rfud)
+        ids = {bc: repo.find_snapshot_id(bc, at) for bc in get_registry().codes()}
+        tiles = {bc: repo.get_tiles_for_snapshot_id(sid) for bc, sid in ids.items()}
     finally:
         repo.close()
 
     # Если БД ещё пустая — показываем дружелюбный экран
-    if not stock_tiles and not fut_tiles:
+    if not any(tiles.values()):
         return render_template(
             "parser.html",
             page_title="Снимок из БД (нет данных)",
-            stock_tiles=[],
-            fut_tiles=[],
+            sections=_sections({}),
             mode="db",
         )
 
     return render_template(
         "parser.html",
         page_title=f"Снимок из БД ({'последний' if at is None else 'на момент ' + request.args.get('at','')})",
-        stock_tiles=stock_tiles,
-        fut_tiles=fut_tiles,
+        sections=_sections(tiles),
         mode="db",
     )
 
+def _snapshot_tag(repo: MoexRepository, board: str, sid: int | None) -> str:
+    """Часть ETag/версии для снимка: id + поколение удалений борда (retention/detach меняют ответ на момент)."""
+    return f"{board}.{sid}g{repo.eviction_gen(board)}"
+
+def _snapshot_cache_control() -> str:
+    """
+    Короткий max-age и для исторических моментов: retention или detach партиции может удалить
+    найденный снимок, и ответ «на момент» сменится на более ранний снимок или 404.
+    Повторные запросы дёшевы — ETag (с поколением удалений) даёт 304.
+    """
+    return f"public, max-age={current_app.config.get('API_MAX_AGE', 5)}"
+
 @bp.get("/api/snapshot")
 def api_snapshot():
-    """JSON-API: /market/api/snapshot?board=TQBR&at=YYYY-MM-DD[ HH:MM]"""
+    """
+    JSON-API: /market/api/snapshot?board=TQBR&at=YYYY-MM-DD[ HH:MM]
+    ETag — из id снимков и поколения удалений бордов.
+    """
     at = parse_iso_utc(request.args.get("at"))
-    board = (request.args.get("board") or "").upper().strip()
-    repo = MoexRepository()
+    repo = _repo()
     try:
-        def _one(bc: str):
-            snap = repo.get_snapshot_by_time(bc, at)
-            return repo.get_tiles_for_snapshot(snap)
+        boards = _requested_boards(repo, request.args.get("board"))
+        ids = {bc: repo.find_snapshot_id(bc, at) for bc in boards}
+        etag = "snapshot-" + "-".join(_snapshot_tag(repo, bc, sid) for bc, sid in ids.items())
 
-        if board in ("TQBR", "RFUD"):
-            return jsonify({board: _one(board)})
-        return jsonify({"TQBR": _one("TQBR"), "RFUD": _one("RFUD")})
+        def _build():
+            return {bc: repo.get_tiles_for_snapshot_id(sid) for bc, sid in ids.items()}
+
+        return json_responses.cached_json(etag, _build, _snapshot_cache_control())
     finally:
         repo.close()
 
-@bp.get("/snapshot.csv")
-def snapshot_csv():
-    """Экспорт последнего снимка (или на момент ?at) в CSV по обеим доскам."""
+@bp.get("/api/movers")
+def api_movers():
+    """
+    Лидеры роста/падения и оборота + ширина рынка из агрегатов снимка:
+    /market/api/movers?board=TQBR&at=YYYY-MM-DD[ HH:MM]&k=10 (по умолчанию — первый борд реестра)
+    """
+    board = (request.args.get("board") or get_registry().default()).upper().strip()
     at = parse_iso_utc(request.args.get("at"))
-    repo = MoexRepository()
+    k = max(1, min(request.args.get("k", 10, type=int), 500))
+    repo = _repo()
     try:
-        rows = []
-        for bc in ("TQBR", "RFUD"):
-            snap = repo.get_snapshot_by_time(bc, at)
-            tiles = repo.get_tiles_for_snapshot(snap)
-            for t in tiles:
-                rows.append({
-                    "board": bc,
-                    "secid": t["secid"], "name": t["name"],
-                    "last": t["last"], "change": t["change"], "valtoday": t["valtoday"],
-                })
-
-        buf = StringIO()
-        writer = csv.DictWriter(buf, fieldnames=["board", "secid", "name", "last", "change", "valtoday"])
-        writer.writeheader()
-        writer.writerows(rows)
-        data = buf.getvalue()
-        buf.close()
-
-        filename = "snapshot_latest.csv" if at is None else f"snapshot_at_{request.args.get('at','').replace(':','-').replace(' ','_')}.csv"
-        return Response(data, mimetype="text/csv",
-                        headers={"Content-Disposition": f'attachment; filename=\"{filename}\"'})
+        sid = repo.find_snapshot_id(board, at)
+        if sid is None:
+            abort(404, description=f"no snapshots for {board}")
+
+        def _build():
+            stats = repo.get_snapshot_stats(sid, top_k=k)
+            for name in ("gainers", "losers", "most_active"):
+                stats[name] = stats[name][:k]
+            stats["top_k"] = k
+            stats["created_at"] = stats["created_at"].isoformat()
+            return {"board": board, **stats}
+
+        return json_responses.cached_json(f"movers-{_snapshot_tag(repo, board, sid)}-{k}", _build,
+                                          _snapshot_cache_control())
     finally:
         repo.close()
 
+@bp.get("/api/diff")
+def api_diff():
+    """
+    Сравнение двух моментов по борду: /market/api/diff?board=TQBR&from=...&to=...&k=20
+    (to по умолчанию — последний снимок). Изменение last в % между снимками, top-K роста/падения,
+    появившиеся/пропавшие бумаги, ширина рынка и оборот на обоих концах.
+    """
+    board = (request.args.get("board") or get_registry().default()).upper().strip()
+    # Нет from — «from is required»; from/to есть, но не разобрались — 400 с самим значением (_time_arg)
+    start = _time_arg("from")
+    end = _time_arg("to")
+    if start is None:
+        abort(400, description="from is required")
+    k = max(1, min(request.args.get("k", 20, type=int), 500))
+    repo = _repo()
+    try:
+        ids = {"from": repo.find_snapshot_id(board, start), "to": repo.find_snapshot_id(board, end)}
+        if ids["from"] is None or ids["to"] is None:
+            abort(404, description=f"no snapshots for {board} at requested time")
+
+        def _build():
+            diff = diff_tiles(repo.get_tiles_for_snapshot_id(ids["from"], limit=None),
+                              repo.get_tiles_for_snapshot_id(ids["to"], limit=None), top_k=k)
+            ends = {}
+            for side, sid in ids.items():
+                st = repo.get_snapshot_stats(sid)
+                ends[side] = {key: st[key] for key in ("snapshot_id", "advancers", "decliners", "unchanged", "turnover")}
+                ends[side]["created_at"] = st["created_at"].isoformat()
+            return {"board": board, **ends, **diff}
+
+        etag = f"diff-{_snapshot_tag(repo, board, ids['from'])}.{ids['to']}-{k}"
+        return json_responses.cached_json(etag, _build, _snapshot_cache_control())
+    finally:
+        repo.close()
+
+@bp.get("/api/history")
+def api_history():
+    """
+    История цены бумаги по снимкам:
+    /market/api/history?secid=SBER&from=YYYY-MM-DD[ HH:MM]&to=...&step=5m&points=500[&board=TQBR]
+    - первая точка — значение на момент from; board по умолчанию — где бумага встречается в последний раз;
+    - по умолчанию ряд прореживается на сервере до points точек (LTTB), step — последняя точка в интервале;
+    - с ?limit= и/или ?after= — «сырые» точки постранично (next_after — курсор следующей страницы).
+    """
+    secid = (request.args.get("secid") or "").upper().strip()
+    if not secid:
+        abort(400, description="secid is required")
+    board = (request.args.get("board") or "").upper().strip() or None
+    start = _time_arg("from")
+    end = _time_arg("to")
+    step = parse_step(request.args.get("step"))
+    raw = "limit" in request.args or "after" in request.args
+    max_page = current_app.config.get("HISTORY_MAX_PAGE", 5000)
+
+    repo = _repo()
+    try:
+        # Борд определяем один раз: он же уходит в ответ, чтобы график знал, чей это ряд
+        if board is None:
+            board = repo.history_board(secid)
+        next_after = None
+        if raw:
+            limit = max(1, min(request.args.get("limit", max_page, type=int), max_page))
+            rows = repo.get_history(secid, start, end, after_id=request.args.get("after", 0, type=int), limit=limit,
+                                    board_code=board)
+            if len(rows) == limit:
+                next_after = rows[-1][0]
+        else:
+            target = request.args.get("points", current_app.config.get("HISTORY_DEFAULT_POINTS", 1000), type=int)
+            # (t, y, payload...) — для прореживания; y = last
+            series = ((r[1].replace(tzinfo=timezone.utc).timestamp(), r[2], r) for r in repo.iter_history(secid, start, end, page=max_page, board_code=board))
+            if step:
+                series = bucket_last(series, step)
+            rows = [p[2] for p in lttb(list(series), max(target, 3))]
+    finally:
+        repo.close()
+
+    return jsonify({
+        "secid": secid,
+        "board": board,
+        "from": start.isoformat() if start else None,
+        "to": end.isoformat() if end else None,
+        "step": step,
+        "count": len(rows),
+        "next_after": next_after,
+        "points": [
+            {"t": created_at.isoformat(), "last": last, "change": change, "valtoday": valtoday}
+            for _, created_at, last, change, valtoday in rows
+        ],
+    })
+
+def _export_params():
+    """Общие параметры выгрузки: boards=TQBR,RFUD (по умолчанию — реестр), at — точка во времени, from/to — диапазон."""
+    return get_registry().parse_codes(request.args.get("boards")), _time_arg("at"), _time_arg("from"), _time_arg("to")
+
+@bp.get("/snapshot.csv")
+def snapshot_csv():
+    """
+    Экспорт снимка в CSV потоком (память не зависит от размера выгрузки):
+    - ?at=... — снимок на момент (по умолчанию последний), формат как раньше;
+    - ?from=...&to=... — все снимки за период, с колонкой snapshot_at;
+    - ?boards=TQBR,RFUD — какие борды; ?gzip=1 — сжатие на лету.
+    """
+    from ...services import export_service
+    boards, at, start, end = _export_params()
+    chunks = export_service.iter_csv(export_service.iter_rows(boards, at=at, start=start, end=end),
+                                     export_service.fields_for(start, end))
+    filename = export_service.export_filename(at, start, end)
+
+    headers = {"Content-Disposition": f'attachment; filename="{filename}"'}
+    if request.args.get("gzip") == "1":
+        headers["Content-Disposition"] = f'attachment; filename="{filename}.gz"'
+        return Response(export_service.gzip_stream(chunks), mimetype="application/gzip", headers=headers)
+    return Response(chunks, mimetype="text/csv", headers=headers)
+
+def _export_jobs():
+    from ...services import export_service
+    cfg = current_app.config
+    return export_service.get_jobs(cfg["EXPORT_DIR"], cfg.get("EXPORT_WORKERS", 2), cfg.get("EXPORT_TTL", 86400))
+
+@bp.post("/api/exports")
+def api_export_create():
+    """
+    Фоновая выгрузка: /market/api/exports?format=csv|csv.gz|parquet&from=...&to=...&boards=...
+    Сразу отвечает 202 с id задания; статус — GET /api/exports/<id>, файл — .../download.
+    """
+    boards, at, start, end = _export_params()
+    try:
+        status = _export_jobs().submit(request.args.get("format", "csv.gz"), boards, at=at, start=start, end=end)
+    except ValueError as e:
+        abort(400, description=str(e))
+    except RuntimeError as e:
+        abort(501, description=str(e))
+    return jsonify(status), 202
+
+@bp.get("/api/exports/<job_id>")
+def api_export_status(job_id: str):
+    status = _export_jobs().status(job_id)
+    if status is None:
+        abort(404)
+    return jsonify(status)
+
+@bp.get("/api/exports/<job_id>/download")
+def api_export_download(job_id: str):
+    jobs = _export_jobs()
+    status = jobs.status(job_id)
+    if status is None:
+        abort(404)
+    if status["state"] != "done":
+        return jsonify(status), 409
+    fmt = status["format"]
+    mimetype = {"csv": "text/csv", "csv.gz": "application/gzip", "parquet": "application/vnd.apache.parquet"}[fmt]
+    return send_file(jobs.output_path(job_id, fmt), mimetype=mimetype, as_attachment=True,
+                     download_name=f"export_{job_id}.{fmt}")
+
 @bp.get("/snapshots")
 def snapshots_list():
     """
-    Страница со списком последних снимков в БД (по двум доскам).
+    Страница со списком последних снимков в БД (по бордам реестра).
     У каждой строки — кнопка 'Показать' → /market/snapshot?at=YYYY-MM-DD HH:MM:SS
     """
-    repo = MoexRepository()
+    repo = _repo()
     try:
-        tqbr = repo.list_snapshots("TQBR", limit=100)
-        rfud = repo.list_snapshots("RFUD", limit=100)
+        boards = [{"board": b["board"], "title": b["title"], "rows": repo.list_snapshots(b["board"], limit=100)}
+                  for b in get_registry()]
     finally:
         repo.close()
 
     return render_template(
         "snapshots.html",
         page_title="Снимки из БД",
-        tqbr=tqbr,
-        rfud=rfud,
+        boards=boards,
     )
 
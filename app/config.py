@@ -12,13 +12,134 @@ class Config:
     CACHE_TYPE = "SimpleCache"
     CACHE_DEFAULT_TIMEOUT = 60  # сек, дефолтный TTL для кэша
 
+    # БД (URL — FLASK_DB_URL, по умолчанию файл flaskparsermoex.sqlite3 в корне). Схема создаётся отдельным
+    # шагом — flask --app run init-db или python -m scripts.create_db; DB_AUTO_INIT=1 — как раньше, на каждом старте
+    DB_AUTO_INIT = os.environ.get("DB_AUTO_INIT", "0") == "1"
+
     # Админ-токен для тяжёлых запросов (например, история по многим тикерам)
     ADMIN_TOKEN = os.environ.get("FLASK_ADMIN_TOKEN", "")
 
-    # Настройки рынков: (TQBR — акции, RFUD — фьючерсы)
-    MARKET_STOCK = {"engine": "stock", "market": "shares", "board": "TQBR"}
-    MARKET_FUT = {"engine": "futures", "market": "forts", "board": "RFUD"}
+    # Реестр бордов (см. services.board_registry): что показывают страницы и API, что собирает коллектор.
+    # BOARDS — "engine/market/BOARD[:ключ[:Заголовок]]" через ";"; BOARDS_FILE — то же JSON-файлом
+    # (там же можно задать борду свою схему партиций). По умолчанию — акции TQBR и фьючерсы RFUD.
+    BOARDS = os.environ.get("BOARDS", "stock/shares/TQBR:stocks:Акции;futures/forts/RFUD:futures:Фьючерсы")
+    BOARDS_FILE = os.environ.get("BOARDS_FILE", "")
+
+    # Адрес ISS (можно подменить зеркалом или локальной заглушкой benchmarks.stub_iss)
+    ISS_BASE_URL = os.environ.get("ISS_BASE_URL", "https://iss.moex.com/iss")
+    # Справочные данные бордов (SHORTNAME, PREVPRICE, PREVSETTLEPRICE) кэшируются на торговый день:
+    # опрос тянет только marketdata (ISS_MARKETDATA_COLUMNS). ISS_SESSION_ROLL — время МСК смены дня,
+    # "HH:MM" для всех и engine=HH:MM для отдельных рынков; ISS_REFERENCE_MAX_AGE — перечитывать
+    # справочник ещё и не реже раза в N секунд (0 — только при смене дня).
+    ISS_REFERENCE_CACHE = os.environ.get("ISS_REFERENCE_CACHE", "1") == "1"
+    ISS_SESSION_ROLL = os.environ.get("ISS_SESSION_ROLL", "06:00,futures=19:05")
+    ISS_REFERENCE_MAX_AGE = float(os.environ.get("ISS_REFERENCE_MAX_AGE", 0))
+    ISS_MARKETDATA_COLUMNS = os.environ.get("ISS_MARKETDATA_COLUMNS", "SECID,LAST,VALTODAY,VOLTODAY")
 
     # Таймауты & ретраи для HTTP
     HTTP_TIMEOUT = 10
     HTTP_RETRIES = 2
+    # Размер пула keep-alive соединений общего HTTP-транспорта
+    HTTP_POOL_SIZE = int(os.environ.get("HTTP_POOL_SIZE", 10))
+
+    # Параллельная загрузка бордов: размер пула и таймаут на один борд (сек)
+    FETCH_MAX_WORKERS = int(os.environ.get("FETCH_MAX_WORKERS", 8))
+    FETCH_BOARD_TIMEOUT = float(os.environ.get("FETCH_BOARD_TIMEOUT", 20))
+
+    # Колоночный расчёт плиток (NumPy); без NumPy автоматически остаётся построчный
+    TILES_COLUMNAR = os.environ.get("TILES_COLUMNAR", "1") == "1"
+
+    # TTL плиток в общем кэше (сек): столько данные считаются свежими
+    # (с коллектором свежесть считается от его интервала, а веб MOEX не опрашивает — см. tile_cache)
+    TILES_CACHE_TTL = 60
+    # Где хранить плитки: memory — кэш процесса (CACHE_TYPE); file — каталог TILE_STORE_DIR,
+    # общий для всех воркеров машины; redis — TILE_STORE_URL (redis://...), общий для нескольких машин.
+    # С COLLECTOR_MODE=process вместо memory берётся file: плитки пишет другой процесс
+    TILE_STORE = os.environ.get("TILE_STORE", "memory")
+    TILE_STORE_DIR = os.environ.get("TILE_STORE_DIR", os.path.join(os.path.dirname(os.path.dirname(__file__)), "instance", "tiles"))
+    TILE_STORE_URL = os.environ.get("TILE_STORE_URL", "")
+    # Сколько всего (сек) можно отдавать устаревшие плитки, пока идёт фоновое обновление
+    # или MOEX недоступен; дальше запись выпадает из кэша и запрос ждёт загрузку
+    TILES_STALE_MAX_AGE = int(os.environ.get("TILES_STALE_MAX_AGE", 600))
+
+    # Сколько секунд клиент может не перепроверять /api/heatmap и /api/snapshot (дальше — ETag/304)
+    API_MAX_AGE = int(os.environ.get("API_MAX_AGE", 5))
+
+    # Time-travel по снимкам: как часто таймлайн проверяет новые снимки других процессов (сек)
+    # и сколько декодированных снимков держать в LRU
+    SNAPSHOT_TIMELINE_TTL = float(os.environ.get("SNAPSHOT_TIMELINE_TTL", 5))
+    SNAPSHOT_LRU_SIZE = int(os.environ.get("SNAPSHOT_LRU_SIZE", 64))
+    # Кэш готового HTML сеток плиток по (борд, версия данных); 0 — рендерить каждый раз
+    FRAGMENT_CACHE_SIZE = int(os.environ.get("FRAGMENT_CACHE_SIZE", 64))
+    # Treemap (/market/api/treemap): раскладка считается на сервере в этих координатах,
+    # клиент масштабирует её под ширину canvas с сохранением пропорций
+    TREEMAP_WIDTH = int(os.environ.get("TREEMAP_WIDTH", 1600))
+    TREEMAP_HEIGHT = int(os.environ.get("TREEMAP_HEIGHT", 900))
+
+    # Хранение снимков: full — все строки в каждом снимке; delta — ключевой кадр раз в
+    # SNAPSHOT_KEYFRAME_EVERY снимков, между ними только изменившиеся строки.
+    # SNAPSHOT_DEDUP — не писать снимок, совпадающий по содержимому с предыдущим.
+    SNAPSHOT_STORAGE = os.environ.get("SNAPSHOT_STORAGE", "full")
+    SNAPSHOT_KEYFRAME_EVERY = int(os.environ.get("SNAPSHOT_KEYFRAME_EVERY", 30))
+    SNAPSHOT_DEDUP = os.environ.get("SNAPSHOT_DEDUP", "1") == "1"
+    # Строки снимков лежат в отдельных таблицах: board — по таблице на борд, month — на борд и месяц
+    # (старый месяц отцепляется целиком: python -m scripts.partitions detach --before YYYY-MM)
+    SNAPSHOT_PARTITION = os.environ.get("SNAPSHOT_PARTITION", "month")
+    # Агрегаты снимка (breadth, оборот, лидеры) считаются при записи; сколько лидеров хранить
+    SNAPSHOT_TOP_K = int(os.environ.get("SNAPSHOT_TOP_K", 20))
+
+    # История по бумаге: размер страницы (keyset) и число точек после прореживания по умолчанию
+    HISTORY_MAX_PAGE = 5000
+    HISTORY_DEFAULT_POINTS = int(os.environ.get("HISTORY_DEFAULT_POINTS", 1000))
+
+    # Живые теплокарты (SSE /market/stream): период опроса плиток одной рассылкой на процесс,
+    # пинг для простаивающих соединений и размер очереди клиента (переполнилась — полный ресинк)
+    LIVE_POLL_INTERVAL = float(os.environ.get("LIVE_POLL_INTERVAL", 2))
+    LIVE_HEARTBEAT = float(os.environ.get("LIVE_HEARTBEAT", 15))
+    LIVE_QUEUE_SIZE = int(os.environ.get("LIVE_QUEUE_SIZE", 100))
+
+    # Retention снимков: ступени «возраст:шаг» (all — хранить всё), архив вытесненных снимков
+    # и как часто коллектор запускает проход (сек, 0 — только вручную: python -m scripts.retention)
+    RETENTION_TIERS = os.environ.get("RETENTION_TIERS", "7d:all,30d:5m,*:1h")
+    ARCHIVE_DIR = os.environ.get("ARCHIVE_DIR", os.path.join(os.path.dirname(os.path.dirname(__file__)), "archive"))
+    RETENTION_INTERVAL = int(os.environ.get("RETENTION_INTERVAL", 0))
+
+    # Экспорт снимков: каталог для фоновых выгрузок, число потоков, которые их пишут,
+    # и сколько секунд хранить готовый файл (потом он удаляется вместе со статусом)
+    EXPORT_DIR = os.environ.get("EXPORT_DIR", os.path.join(os.path.dirname(os.path.dirname(__file__)), "exports"))
+    EXPORT_WORKERS = int(os.environ.get("EXPORT_WORKERS", 2))
+    EXPORT_TTL = int(os.environ.get("EXPORT_TTL", 86400))
+
+    # Метрики Prometheus на /metrics (латентность MOEX и роутов, кэш плиток, SQL, запись снимков)
+    METRICS_ENABLED = os.environ.get("METRICS_ENABLED", "1") == "1"
+
+    # Профилировщик SQL: запросы дольше SQL_SLOW_MS — в лог с EXPLAIN QUERY PLAN; одна форма запроса
+    # SQL_N1_THRESHOLD+ раз за HTTP-запрос — предупреждение о N+1. SQL_PROFILE_HEADERS — сводка
+    # в заголовках X-SQL-* / Server-Timing (по умолчанию только при DEBUG)
+    SQL_PROFILE = os.environ.get("SQL_PROFILE", "1") == "1"
+    SQL_SLOW_MS = float(os.environ.get("SQL_SLOW_MS", 200))
+    SQL_N1_THRESHOLD = int(os.environ.get("SQL_N1_THRESHOLD", 10))
+    SQL_PROFILE_HEADERS = os.environ.get("SQL_PROFILE_HEADERS", "0") == "1"
+
+    # Фоновый коллектор снимков: off | thread (поток в веб-процессе) | process (scripts.run_collector).
+    # В режимах thread/process снимки пишет только коллектор, /parser?mode=fresh БД не трогает.
+    COLLECTOR_MODE = os.environ.get("COLLECTOR_MODE", "off")
+    COLLECTOR_INTERVAL_TRADING = int(os.environ.get("COLLECTOR_INTERVAL_TRADING", 60))
+    COLLECTOR_INTERVAL_OFFHOURS = int(os.environ.get("COLLECTOR_INTERVAL_OFFHOURS", 900))
+    # Кроме бордов реестра коллектор может собирать борды из справочника ISS:
+    # COLLECTOR_DISCOVER — engine или engine/market через запятую (пусто — только заданные борды),
+    # COLLECTOR_PRIMARY_ONLY — только основные борды рынков (иначе их сотни).
+    COLLECTOR_DISCOVER = os.environ.get("COLLECTOR_DISCOVER", "")
+    COLLECTOR_PRIMARY_ONLY = os.environ.get("COLLECTOR_PRIMARY_ONLY", "1") == "1"
+    COLLECTOR_DISCOVER_TTL = int(os.environ.get("COLLECTOR_DISCOVER_TTL", 86400))
+    # Общий лимит запросов к ISS в секунду и одновременных соединений с хостом (не больше HTTP_POOL_SIZE),
+    # дедлайн всего цикла (сек) и сколько бордов писать в БД одной транзакцией
+    ISS_RATE_LIMIT = float(os.environ.get("ISS_RATE_LIMIT", 10))
+    ISS_MAX_CONCURRENCY = int(os.environ.get("ISS_MAX_CONCURRENCY", 8))
+    COLLECTOR_CYCLE_TIMEOUT = float(os.environ.get("COLLECTOR_CYCLE_TIMEOUT", 30))
+    COLLECTOR_BATCH_SIZE = int(os.environ.get("COLLECTOR_BATCH_SIZE", 10))
+    # Файл статуса внешнего коллектора (для /market/api/collector)
+    COLLECTOR_STATUS_FILE = os.environ.get("COLLECTOR_STATUS_FILE", "")
+    # COLLECTOR_MODE=thread под gunicorn с несколькими воркерами: коллектор запускает только воркер,
+    # взявший эту блокировку (flock; пусто — без блокировки, на Windows её нет)
+    COLLECTOR_LOCK_FILE = os.environ.get("COLLECTOR_LOCK_FILE", os.path.join(os.path.dirname(os.path.dirname(__file__)), "instance", "collector.lock"))
@@ -0,0 +1,81 @@
+# app/services/board_fetcher.py
+"""
+Параллельная загрузка нескольких бордов.
+Ограниченный пул потоков на процесс; у каждого борда свой таймаут,
+упавший/зависший борд не валит остальные — возвращаем частичный результат.
+"""
+
+from __future__ import annotations
+import logging
+import math
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, Iterable, Tuple
+
+log = logging.getLogger(__name__)
+
+
+class BoardFetcher:
+    """
+    fetch_many(specs, load) -> (results, errors)
+    specs: [{'engine','market','board'}, ...]; load(spec) выполняется в пуле.
+    results: {board: значение}, errors: {board: текст ошибки}.
+    """
+
+    def __init__(self, max_workers: int = 8, timeout: float = 20.0) -> None:
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="board-fetch")
+
+    def fetch_many(
+        self,
+        specs: Iterable[Dict[str, str]],
+        load: Callable[[Dict[str, str]], Any],
+        timeout: float | None = None,
+    ) -> Tuple[Dict[str, Any], Dict[str, str]]:
+        specs = list(specs)
+        results: Dict[str, Any] = {}
+        errors: Dict[str, str] = {}
+        if not specs:
+            return results, errors
+
+        per_board = self.timeout if timeout is None else timeout
+        # Если бордов больше, чем потоков, последние ждут очереди — даём им на это «волны»
+        waves = math.ceil(len(specs) / self.max_workers)
+        started = time.monotonic()
+        futures = {self._pool.submit(load, spec): spec["board"] for spec in specs}
+        done, pending = wait(futures, timeout=per_board * waves)
+
+        for fut in done:
+            board = futures[fut]
+            try:
+                results[board] = fut.result()
+            except Exception as exc:
+                log.warning("board %s fetch failed: %s", board, exc)
+                errors[board] = str(exc) or exc.__class__.__name__
+        for fut in pending:
+            # Поток нельзя прервать, но ответ страницы его больше не ждёт
+            fut.cancel()
+            errors[futures[fut]] = f"timeout after {per_board:.0f}s"
+        log.debug("fetched %s boards in %.1f ms (errors: %s)",
+                  len(specs), (time.monotonic() - started) * 1000.0, list(errors))
+        return results, errors
+
+    def submit(self, fn: Callable[..., Any], *args: Any):
+        """Фоновая задача в том же пуле (например, обновление устаревшего борда)."""
+        return self._pool.submit(fn, *args)
+
+
+_fetcher: BoardFetcher | None = None
+_fetcher_lock = threading.Lock()
+
+
+def get_fetcher(max_workers: int = 8, timeout: float = 20.0) -> BoardFetcher:
+    """Один пул на процесс; параметры берутся при первом вызове."""
+    global _fetcher
+    if _fetcher is None:
+        with _fetcher_lock:
+            if _fetcher is None:
+                _fetcher = BoardFetcher(max_workers=max_workers, timeout=timeout)
+    return _fetcher
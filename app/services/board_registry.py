@@ -0,0 +1,123 @@
+# app/services/board_registry.py
+"""
+Реестр бордов: что показывает сайт (теплокарты, снимки, выгрузки), что собирает коллектор
+и что по умолчанию берут скрипты. Борды больше не зашиты в код — они описаны данными:
+
+- BOARDS — строка "engine/market/BOARD[:ключ[:Заголовок]]" через ";", например
+  "stock/shares/TQBR:stocks:Акции;futures/forts/RFUD:futures:Фьючерсы";
+  ключ — имя борда в JSON /api/heatmap (по умолчанию код в нижнем регистре);
+- BOARDS_FILE — JSON-файл со списком объектов {"engine", "market", "board", "key", "title",
+  "partition"}; если задан, BOARDS не используется.
+  partition — разбиение строк снимков борда (board | month), по умолчанию SNAPSHOT_PARTITION.
+
+Порядок в реестре — порядок секций на странице. Модуль лёгкий (без БД и сети):
+его импортируют роуты при старте воркера.
+"""
+
+from __future__ import annotations
+import json
+from typing import Any, Dict, Iterable, List, Mapping, Optional
+
+from .snapshot_storage import PARTITION_SCHEMES
+
+DEFAULT_BOARDS = "stock/shares/TQBR:stocks:Акции;futures/forts/RFUD:futures:Фьючерсы"
+
+
+def _board(engine: str, market: str, board: str, key: str | None = None, title: str | None = None,
+           partition: str | None = None) -> Dict[str, Any]:
+    if not (engine and market and board):
+        raise ValueError(f"bad board spec: {engine}/{market}/{board}")
+    if partition is not None and partition not in PARTITION_SCHEMES:
+        raise ValueError(f"unknown partition scheme for {board}: {partition}")
+    board = board.strip().upper()
+    return {
+        "engine": engine.strip().lower(),
+        "market": market.strip().lower(),
+        "board": board,
+        "key": (key or board.lower()).strip(),
+        "title": (title or board).strip(),
+        "partition": partition,
+    }
+
+
+def parse_boards(spec: str) -> List[Dict[str, Any]]:
+    """'stock/shares/TQBR:stocks:Акции;futures/forts/RFUD' -> список описаний бордов."""
+    boards = []
+    for part in spec.split(";"):
+        part = part.strip()
+        if not part:
+            continue
+        path, _, rest = part.partition(":")
+        key, _, title = rest.partition(":")
+        fields = path.split("/")
+        if len(fields) != 3:
+            raise ValueError(f"bad board spec: {part!r} (ожидается engine/market/BOARD)")
+        boards.append(_board(*fields, key=key or None, title=title or None))
+    return boards
+
+
+def load_boards(path: str) -> List[Dict[str, Any]]:
+    """Борды из JSON-файла BOARDS_FILE."""
+    with open(path, encoding="utf-8") as f:
+        items = json.load(f)
+    return [
+        _board(it["engine"], it["market"], it["board"], key=it.get("key"), title=it.get("title"),
+               partition=it.get("partition"))
+        for it in items
+    ]
+
+
+class BoardRegistry:
+    def __init__(self, boards: Iterable[Dict[str, Any]]) -> None:
+        self.boards: List[Dict[str, Any]] = list(boards)
+        if not self.boards:
+            raise ValueError("board registry is empty")
+        self._by_code = {b["board"]: b for b in self.boards}
+        if len(self._by_code) != len(self.boards):
+            raise ValueError("duplicate board in registry")
+
+    @classmethod
+    def from_config(cls, cfg: Mapping[str, Any] | type) -> "BoardRegistry":
+        get = cfg.get if isinstance(cfg, Mapping) else (lambda name, default=None: getattr(cfg, name, default))
+        path = get("BOARDS_FILE")
+        return cls(load_boards(path) if path else parse_boards(get("BOARDS") or DEFAULT_BOARDS))
+
+    def __contains__(self, code: str) -> bool:
+        return code in self._by_code
+
+    def __iter__(self):
+        return iter(self.boards)
+
+    def get(self, code: str) -> Optional[Dict[str, Any]]:
+        return self._by_code.get(code)
+
+    def codes(self) -> List[str]:
+        return [b["board"] for b in self.boards]
+
+    def default(self) -> str:
+        """Борд по умолчанию для API с одним бордом (movers, diff)."""
+        return self.boards[0]["board"]
+
+    def specs(self) -> List[Dict[str, str]]:
+        """{engine, market, board} — формат загрузчиков плиток, коллектора и репозитория."""
+        return [{"engine": b["engine"], "market": b["market"], "board": b["board"]} for b in self.boards]
+
+    def partitions(self) -> Dict[str, str]:
+        """Схемы разбиения, заданные бордам явно: {код: board | month}."""
+        return {b["board"]: b["partition"] for b in self.boards if b["partition"]}
+
+    def parse_codes(self, value: str | None) -> List[str]:
+        """'TQBR,rfud' -> ["TQBR", "RFUD"]; пусто — все борды реестра."""
+        codes = [c.strip().upper() for c in (value or "").split(",") if c.strip()]
+        return codes or self.codes()
+
+
+def get_registry(app=None) -> BoardRegistry:
+    """Реестр приложения (app.extensions["moex_boards"]); создаётся из конфига при первом обращении."""
+    if app is None:
+        from flask import current_app
+        app = current_app._get_current_object()
+    registry = app.extensions.get("moex_boards")
+    if registry is None:
+        registry = app.extensions.setdefault("moex_boards", BoardRegistry.from_config(app.config))
+    return registry
@@ -0,0 +1,298 @@
+# app/services/bulk_collector.py
+"""
+Массовый сбор бордов на asyncio: десятки бордов ISS за один цикл.
+
+- discover_boards — список бордов из справочника ISS (/iss/index.json) с фильтром
+  по engine/market (например "stock/shares,stock/bonds,currency/selt,futures/forts");
+- RateLimiter — token bucket: не больше rate HTTP-запросов в секунду, включая повторы и
+  дочитывание справочника (LimitedTransport берёт токен на каждый запрос; burst=1 — ровный
+  темп, без пачки запросов на старте цикла);
+- HostLimiter — не больше max_concurrency одновременных загрузок с одного хоста;
+- BulkCollector.run — загрузка всех бордов с дедлайном на борд и на весь цикл;
+  готовые борды пачками по batch_size уходят в on_batch (запись в БД), пока остальные
+  ещё грузятся. on_batch выполняется в отдельном потоке и строго по очереди —
+  писатель SQLite один, а цикл событий продолжает качать.
+
+HTTP остаётся синхронным общим транспортом (пул keep-alive, gzip, метрики): загрузка
+борда выполняется в пуле потоков размером с лимит на хост, планирование и пачки — на asyncio.
+Поток нельзя отменить извне, поэтому дедлайны соблюдает сам поток: таймаут борда отсчитывается
+с момента, когда воркер взял задачу (ожидание в очереди пула не в счёт), не выходит за дедлайн
+цикла и передаётся вниз таймаутом каждого HTTP-запроса. Новых зависимостей нет.
+"""
+
+from __future__ import annotations
+import asyncio
+import copy
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+from .moex_client import MoexClient
+from .tile_cache import load_tiles
+
+log = logging.getLogger(__name__)
+
+Batch = List[Tuple[Dict[str, str], List[Dict[str, Any]]]]
+
+
+def parse_board_filter(spec: str) -> List[Tuple[str, Optional[str]]]:
+    """'stock/shares,futures' -> [("stock", "shares"), ("futures", None)]."""
+    out = []
+    for part in spec.split(","):
+        part = part.strip().lower()
+        if part:
+            engine, _, market = part.partition("/")
+            out.append((engine, market or None))
+    return out
+
+
+def discover_boards(index: Iterable[Dict[str, Any]], board_filter: List[Tuple[str, Optional[str]]],
+                    primary_only: bool = True) -> List[Dict[str, str]]:
+    """Борды справочника ISS, подходящие под фильтр: только торгуемые (и основные, если primary_only)."""
+    specs, seen = [], set()
+    for b in index:
+        if not b["is_traded"] or (primary_only and not b["is_primary"]):
+            continue
+        if not any(b["engine"] == e and (m is None or b["market"] == m) for e, m in board_filter):
+            continue
+        if b["board"] in seen:
+            continue
+        seen.add(b["board"])
+        specs.append({"engine": b["engine"], "market": b["market"], "board": b["board"]})
+    return specs
+
+
+class DeadlineExceeded(TimeoutError):
+    """Дедлайн борда (или цикла) истёк: токена не дождались или время на запросы кончилось."""
+
+
+class RateLimiter:
+    """
+    Token bucket, общий для потоков пула: acquire() резервирует следующий слот и спит до него.
+    Токен может уйти в минус — это очередь резерваций, запросы идут строго по одному в 1/rate сек.
+    """
+
+    def __init__(self, rate: float, burst: int = 1) -> None:
+        self.rate = float(rate)
+        self.burst = float(max(1, burst))
+        self._tokens = self.burst
+        self._updated: float | None = None
+        self._lock = threading.Lock()
+
+    def acquire(self, deadline: float | None = None) -> bool:
+        """Взять токен; False — он освободится только после deadline (time.monotonic), ничего не резервируем."""
+        if self.rate <= 0:
+            return True
+        with self._lock:
+            now = time.monotonic()
+            if self._updated is not None:
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            wait = max(0.0, (1 - self._tokens) / self.rate)
+            if deadline is not None and now + wait > deadline:
+                return False
+            self._tokens -= 1
+        if wait:
+            time.sleep(wait)
+        return True
+
+
+class LimitedTransport:
+    """
+    Обёртка HTTP-транспорта для массового сбора: каждый вызов get_json — и повторы MoexClient,
+    и дочитывание справочника — берёт токен RateLimiter. Дедлайн загрузки борда задаётся
+    на поток (deadline()), и каждый запрос получает таймаут не больше оставшегося времени;
+    пауза перед повтором тоже не выходит за дедлайн.
+    """
+
+    def __init__(self, transport, limiter: RateLimiter) -> None:
+        self.transport = transport
+        self.limiter = limiter
+        self._local = threading.local()
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.transport, name)  # pool_size, stats() — как у обёрнутого транспорта
+
+    @contextmanager
+    def deadline(self, at: float, reason: str) -> Iterator[None]:
+        self._local.deadline, self._local.reason = at, reason
+        try:
+            yield
+        finally:
+            self._local.deadline = self._local.reason = None
+
+    def _remaining(self) -> float | None:
+        deadline = getattr(self._local, "deadline", None)
+        return None if deadline is None else deadline - time.monotonic()
+
+    def get_json(self, url: str, params: Optional[Dict[str, Any]] = None, timeout: float | None = None) -> Any:
+        deadline = getattr(self._local, "deadline", None)
+        if not self.limiter.acquire(deadline):
+            raise DeadlineExceeded(self._local.reason)
+        remaining = self._remaining()
+        if remaining is not None:
+            if remaining <= 0:
+                raise DeadlineExceeded(self._local.reason)
+            timeout = remaining if timeout is None else min(timeout, remaining)
+        return self.transport.get_json(url, params=params, timeout=timeout)
+
+    def backoff(self, attempt: int) -> float:
+        pause = self.transport.backoff(attempt)
+        remaining = self._remaining()
+        return pause if remaining is None else max(0.0, min(pause, remaining))
+
+
+class HostLimiter:
+    """Семафор на хост: не больше limit одновременных запросов к одному серверу."""
+
+    def __init__(self, limit: int) -> None:
+        self.limit = max(1, int(limit))
+        self._sems: Dict[str, asyncio.Semaphore] = {}
+
+    def __call__(self, url: str) -> asyncio.Semaphore:
+        host = urlsplit(url).netloc
+        sem = self._sems.get(host)
+        if sem is None:
+            sem = self._sems[host] = asyncio.Semaphore(self.limit)
+        return sem
+
+
+class BulkCollector:
+    def __init__(
+        self,
+        client: MoexClient,
+        rate: float = 10.0,
+        max_concurrency: int = 8,
+        board_timeout: float = 10.0,
+        cycle_timeout: float = 20.0,
+        batch_size: int = 10,
+        columnar: bool = False,
+    ) -> None:
+        # Больше потоков, чем соединений в пуле транспорта, не даст параллелизма — только очередь в urllib3
+        self.max_concurrency = max(1, min(int(max_concurrency), getattr(client.transport, "pool_size", max_concurrency)))
+        self.rate = rate
+        self.limiter = RateLimiter(rate)
+        self.transport = LimitedTransport(client.transport, self.limiter)
+        # Копия клиента со своим транспортом: кэш справочника (словарь и лок) общий с исходным клиентом
+        self.client = copy.copy(client)
+        self.client.transport = self.transport
+        self.board_timeout = board_timeout
+        self.cycle_timeout = cycle_timeout
+        self.batch_size = max(1, int(batch_size))
+        self.columnar = columnar
+        self._pool = ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix="bulk-fetch")
+
+    def close(self) -> None:
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+    def run(self, specs: List[Dict[str, str]], on_batch: Callable[[Batch], None] | None = None) -> Dict[str, Any]:
+        """Синхронная обёртка для потока коллектора: один цикл в собственном event loop."""
+        return asyncio.run(self.run_async(specs, on_batch))
+
+    async def run_async(self, specs: List[Dict[str, str]],
+                        on_batch: Callable[[Batch], None] | None = None) -> Dict[str, Any]:
+        """
+        Один цикл по всем specs. Возвращает {"loaded": {board: tiles}, "errors": {board: текст},
+        "durations_ms": {board: мс}, "elapsed_ms": ..., "batches": ...}.
+        """
+        started = time.perf_counter()
+        loop = asyncio.get_running_loop()
+        hosts = HostLimiter(self.max_concurrency)
+        loaded: Dict[str, Any] = {}
+        errors: Dict[str, str] = {}
+        durations: Dict[str, float] = {}
+        queue: asyncio.Queue = asyncio.Queue()
+
+        cycle_deadline = time.monotonic() + self.cycle_timeout
+
+        async def _fetch(spec: Dict[str, str]):
+            url = self.client._board_url(spec["engine"], spec["market"], spec["board"])
+            async with hosts(url):
+                tiles, ms = await loop.run_in_executor(self._pool, self._load, spec, cycle_deadline)
+                durations[spec["board"]] = ms
+                return tiles
+
+        async def _writer() -> int:
+            batches = 0
+            while True:
+                batch = await queue.get()
+                if batch is None:
+                    return batches
+                batches += 1
+                try:
+                    await asyncio.to_thread(on_batch, batch)
+                except Exception as exc:  # ошибка записи пачки не останавливает загрузку остальных
+                    log.warning("bulk collector: batch write failed: %s", exc)
+                    for spec, _ in batch:
+                        errors[spec["board"]] = f"write failed: {exc}"
+
+        writer = asyncio.create_task(_writer()) if on_batch is not None else None
+        tasks = {asyncio.create_task(_fetch(spec)): spec for spec in specs}
+        batch: Batch = []
+        pending = set(tasks)
+        deadline = loop.time() + self.cycle_timeout
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, timeout=max(0.0, deadline - loop.time()),
+                                                   return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    break
+                for task in done:
+                    spec = tasks[task]
+                    exc = task.exception()
+                    if exc is not None:
+                        errors[spec["board"]] = str(exc) or exc.__class__.__name__
+                        continue
+                    loaded[spec["board"]] = task.result()
+                    batch.append((spec, loaded[spec["board"]]))
+                    # Проверка на каждом борде: за один wait может завершиться больше batch_size задач
+                    if len(batch) >= self.batch_size and writer is not None:
+                        queue.put_nowait(batch)
+                        batch = []
+        finally:
+            # Потоки этих бордов сами упрутся в дедлайн цикла (таймауты запросов не длиннее него)
+            for task in pending:
+                task.cancel()
+                errors[tasks[task]["board"]] = f"cycle deadline {self.cycle_timeout:g}s"
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
+            batches = 0
+            if writer is not None:
+                if batch:
+                    queue.put_nowait(batch)
+                queue.put_nowait(None)
+                batches = await writer
+
+        for board, err in errors.items():
+            if board not in loaded:
+                log.warning("bulk collector: board %s failed: %s", board, err)
+        return {
+            "loaded": loaded,
+            "errors": errors,
+            "durations_ms": durations,
+            "elapsed_ms": round((time.perf_counter() - started) * 1000.0, 1),
+            "batches": batches,
+        }
+
+    def _load(self, spec: Dict[str, str], cycle_deadline: float) -> Tuple[List[Dict[str, Any]], float]:
+        """Загрузка борда в потоке пула: (плитки, мс). Таймаут борда — с этого момента, не дольше цикла."""
+        started = time.monotonic()
+        if started + self.board_timeout <= cycle_deadline:
+            deadline, reason = started + self.board_timeout, f"timeout after {self.board_timeout:g}s"
+        else:
+            deadline, reason = cycle_deadline, f"cycle deadline {self.cycle_timeout:g}s"
+        if deadline <= started:
+            raise DeadlineExceeded(reason)  # задача дождалась воркера, когда цикл уже кончился
+        try:
+            with self.transport.deadline(deadline, reason):
+                tiles = load_tiles(self.client, spec, self.columnar)
+        except Exception as exc:
+            # MoexClient заворачивает ошибку последнего повтора в RuntimeError — сообщаем про дедлайн
+            if time.monotonic() >= deadline and not isinstance(exc, DeadlineExceeded):
+                raise DeadlineExceeded(reason) from exc
+            raise
+        return tiles, round((time.monotonic() - started) * 1000.0, 1)
@@ -0,0 +1,347 @@
+# app/services/collector.py
+"""
+Фоновый сборщик снимков.
+Опрашивает борды реестра (BOARDS) по расписанию (отдельные интервалы для торговой
+сессии и для нерабочего времени), пишет снимки в БД и прогревает кэш плиток —
+веб-запросам остаётся только читать.
+С COLLECTOR_DISCOVER к ним добавляются борды из справочника ISS (акции, облигации,
+валюта, фьючерсы, опционы...): загрузка идёт через bulk_collector с общим лимитом
+запросов в секунду и лимитом соединений на хост, запись — пачками.
+
+Работает либо потоком внутри веб-процесса (COLLECTOR_MODE=thread), либо отдельным
+процессом (COLLECTOR_MODE=process): python -m scripts.run_collector. Во втором случае
+плитки идут в общее хранилище (TILE_STORE=file|redis; memory заменяется на file),
+иначе веб их не увидит. С включённым коллектором веб MOEX не опрашивает.
+"""
+
+from __future__ import annotations
+import errno
+import json
+import logging
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, List
+
+from flask import Flask
+
+from . import query_profiler
+from .board_registry import get_registry
+from .bulk_collector import BulkCollector, discover_boards, parse_board_filter
+from .heatmap_service import HeatmapService
+from .http_transport import get_transport
+from .moex_client import MoexClient
+from .repository import MoexRepository
+from .retention import RetentionJob, parse_tiers
+from .tile_cache import store_tiles
+from .time_utils import is_trading_time
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows: межпроцессной блокировки нет, thread — только с одним воркером
+    fcntl = None
+
+log = logging.getLogger(__name__)
+
+
+class SnapshotCollector:
+    """
+    Один цикл = все борды: MOEX (параллельно) -> плитки -> кэш -> снимок в БД.
+    Состояние по каждому борду доступно через status() (для health-check).
+    """
+
+    def __init__(self, app: Flask, boards: List[Dict[str, str]] | None = None) -> None:
+        self.app = app
+        cfg = app.config
+        self.boards = boards or get_registry(app).specs()
+        self.interval_trading = int(cfg.get("COLLECTOR_INTERVAL_TRADING", 60))
+        self.interval_offhours = int(cfg.get("COLLECTOR_INTERVAL_OFFHOURS", 900))
+        self.status_file = cfg.get("COLLECTOR_STATUS_FILE") or None
+        # COLLECTOR_MODE=thread: один коллектор на машину, сколько бы воркеров ни было (см. start)
+        self.lock_file = cfg.get("COLLECTOR_LOCK_FILE") or None
+        self._lock_fd: int | None = None
+        self._lock_retry_at = 0.0
+        self.standby = False  # блокировку держит коллектор другого процесса
+        self.client = MoexClient(
+            timeout=cfg.get("HTTP_TIMEOUT", 10),
+            retries=cfg.get("HTTP_RETRIES", 2),
+            transport=get_transport(cfg.get("HTTP_POOL_SIZE", 10)),
+            base=cfg.get("ISS_BASE_URL"),
+            reference_cache=cfg.get("ISS_REFERENCE_CACHE", True),
+            session_roll=cfg.get("ISS_SESSION_ROLL"),
+            reference_max_age=cfg.get("ISS_REFERENCE_MAX_AGE", 0),
+            marketdata_columns=cfg.get("ISS_MARKETDATA_COLUMNS"),
+        )
+        self._heatmap = HeatmapService()
+        # Справочник ISS: какие борды собирать помимо заданных (перечитывается раз в COLLECTOR_DISCOVER_TTL)
+        self.board_filter = parse_board_filter(cfg.get("COLLECTOR_DISCOVER", ""))
+        self.primary_only = bool(cfg.get("COLLECTOR_PRIMARY_ONLY", True))
+        self.discover_ttl = float(cfg.get("COLLECTOR_DISCOVER_TTL", 86400))
+        self._discovered: List[Dict[str, str]] | None = None
+        self._discovered_at = 0.0
+        self.bulk = BulkCollector(
+            self.client,
+            rate=float(cfg.get("ISS_RATE_LIMIT", 10)),
+            max_concurrency=int(cfg.get("ISS_MAX_CONCURRENCY", 8)),
+            board_timeout=float(cfg.get("FETCH_BOARD_TIMEOUT", 20)),
+            cycle_timeout=float(cfg.get("COLLECTOR_CYCLE_TIMEOUT", 30)),
+            batch_size=int(cfg.get("COLLECTOR_BATCH_SIZE", 10)),
+            columnar=cfg.get("TILES_COLUMNAR", False),
+        )
+        # Retention в отдельном потоке: долгий проход не задерживает циклы сбора
+        self.retention_interval = int(cfg.get("RETENTION_INTERVAL", 0))
+        self._retention_thread: threading.Thread | None = None
+        self._retention_at = time.monotonic()
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+        self._lock = threading.Lock()
+        self._started_at: float | None = None
+        self._cycles = 0
+        self._cycle_error: str | None = None  # ошибка последнего цикла целиком (не отдельного борда)
+        self._cycle_failures = 0
+        self._boards_state: Dict[str, Dict[str, Any]] = {
+            b["board"]: {"last_ok": None, "last_error": None, "failures": 0, "items": 0, "duration_ms": None}
+            for b in self.boards
+        }
+
+    # -------- расписание --------
+
+    def current_interval(self, now_utc: datetime | None = None) -> int:
+        return self.interval_trading if is_trading_time(now_utc) else self.interval_offhours
+
+    # -------- один проход --------
+
+    def target_boards(self) -> List[Dict[str, str]]:
+        """Заданные борды + найденные в справочнике ISS (если включено COLLECTOR_DISCOVER)."""
+        if not self.board_filter:
+            return self.boards
+        if self._discovered is None or time.monotonic() - self._discovered_at > self.discover_ttl:
+            try:
+                index = self.bulk.client.get_boards_index()  # под тем же лимитом запросов, что и борды
+                self._discovered = discover_boards(index, self.board_filter, primary_only=self.primary_only)
+                self._discovered_at = time.monotonic()
+                log.info("collector: discovered %s boards", len(self._discovered))
+            except Exception as exc:
+                # Без справочника собираем то, что нашли в прошлый раз (или хотя бы заданные борды)
+                log.warning("collector: board discovery failed: %s", exc)
+        known = {b["board"] for b in self.boards}
+        return self.boards + [b for b in self._discovered or [] if b["board"] not in known]
+
+    def run_once(self) -> None:
+        """
+        Один цикл: все борды грузятся из MOEX конкурентно (bulk_collector), готовые пачками
+        пишутся в кэш и БД — одна транзакция на пачку, у всех снимков цикла одно время.
+        Ошибка одного борда не мешает остальным.
+        """
+        created_at = datetime.utcnow()
+        write_ms: Dict[str, float] = {}
+
+        def _write(batch) -> None:
+            write_ms.update(self._write_batch(batch, created_at))
+
+        result = self.bulk.run(self.target_boards(), on_batch=_write)
+        for code, err in result["errors"].items():
+            self._fail(code, err)
+        for code, ms in write_ms.items():
+            if code not in result["errors"]:
+                self._update(code, duration_ms=round(result["durations_ms"].get(code, 0) + ms, 1))
+        log.debug("collector: cycle %s boards in %s ms, %s batches",
+                  len(result["loaded"]), result["elapsed_ms"], result["batches"])
+        self._cycles += 1
+        self._write_status()
+
+    def _write_batch(self, batch, created_at: datetime) -> Dict[str, float]:
+        """Пачка (spec, tiles): кэш плиток + снимки одной транзакцией. Возвращает {борд: мс записи}."""
+        with self.app.app_context():
+            repo = MoexRepository()
+            try:
+                with query_profiler.profile(f"collector:batch[{len(batch)}]", units=len(batch)):
+                    for spec, tiles in batch:
+                        store_tiles(spec["engine"], spec["market"], spec["board"], tiles)
+                    written = repo.save_snapshots(
+                        [(spec, self._heatmap.to_db_items(tiles)) for spec, tiles in batch], created_at=created_at,
+                    )
+                    repo.session.commit()
+            except Exception:
+                repo.session.rollback()
+                raise
+            finally:
+                repo.close()
+        now = time.time()
+        for stats in written:
+            self._update(stats["board"], last_ok=now, last_error=None, failures=0, items=stats["items"])
+        return {stats["board"]: stats["elapsed_ms"] for stats in written}
+
+    def _fail(self, code: str, exc: Any) -> None:
+        log.warning("collector: board %s failed: %s", code, exc)
+        with self._lock:
+            state = self._state(code)
+            state["last_error"] = str(exc)
+            state["failures"] += 1
+
+    def _update(self, code: str, **fields: Any) -> None:
+        with self._lock:
+            self._state(code).update(fields)
+
+    def _state(self, code: str) -> Dict[str, Any]:
+        # Борды из справочника появляются в статусе по мере первого опроса
+        return self._boards_state.setdefault(code, {
+            "last_ok": None, "last_error": None, "failures": 0, "items": 0, "duration_ms": None,
+        })
+
+    # -------- жизненный цикл --------
+
+    def run_forever(self) -> None:
+        """Блокирующий цикл до stop(). Следующий проход — через интервал от начала текущего."""
+        self._started_at = time.time()
+        log.info("collector: started for %s", [b["board"] for b in self.boards])
+        while not self._stop.is_set():
+            cycle_started = time.monotonic()
+            try:
+                self.run_once()
+                self._maybe_run_retention()
+                self._cycle_error = None
+            except Exception as exc:
+                # Упавший цикл не должен молча завершать поток: ошибка — в лог и статус, дальше — по расписанию
+                log.exception("collector: cycle failed")
+                with self._lock:
+                    self._cycle_error = f"{exc.__class__.__name__}: {exc}"
+                    self._cycle_failures += 1
+                self._write_status()
+            delay = self.current_interval() - (time.monotonic() - cycle_started)
+            self._stop.wait(max(delay, 1.0))
+        log.info("collector: stopped after %s cycles", self._cycles)
+
+    def _maybe_run_retention(self) -> None:
+        if not self.retention_interval or time.monotonic() - self._retention_at < self.retention_interval:
+            return
+        if self._retention_thread and self._retention_thread.is_alive():
+            return
+        self._retention_at = time.monotonic()
+        cfg = self.app.config
+        job = RetentionJob(parse_tiers(cfg.get("RETENTION_TIERS", "7d:all,30d:5m,*:1h")), cfg.get("ARCHIVE_DIR"))
+
+        def _run():
+            try:
+                job.run()
+            except Exception as exc:
+                log.warning("collector: retention failed: %s", exc)
+
+        self._retention_thread = threading.Thread(target=_run, name="moex-retention", daemon=True)
+        self._retention_thread.start()
+
+    def _acquire_process_lock(self) -> bool:
+        """
+        Exclusive flock на COLLECTOR_LOCK_FILE. С COLLECTOR_MODE=thread коллектор заводит каждый
+        веб-воркер; опрашивать MOEX и писать снимки будет только взявший блокировку, остальные
+        ждут в standby и пробуют снова раз в минуту (ядро снимает flock, если владелец умер).
+        """
+        if self._lock_fd is not None or fcntl is None or not self.lock_file:
+            return True
+        now = time.monotonic()
+        if now < self._lock_retry_at:
+            return False
+        self._lock_retry_at = now + 60.0
+        os.makedirs(os.path.dirname(os.path.abspath(self.lock_file)), exist_ok=True)
+        fd = os.open(self.lock_file, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError as exc:
+            os.close(fd)
+            if exc.errno not in (errno.EAGAIN, errno.EACCES):
+                raise
+            if not self.standby:
+                log.warning("collector: %s is held by another process, pid %s stays in standby "
+                            "(several workers with COLLECTOR_MODE=thread; use COLLECTOR_MODE=process)",
+                            self.lock_file, os.getpid())
+            self.standby = True
+            return False
+        self._lock_fd, self.standby = fd, False
+        return True
+
+    def _release_process_lock(self) -> None:
+        fd, self._lock_fd = self._lock_fd, None
+        if fd is not None:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+            os.close(fd)
+
+    def start(self) -> "SnapshotCollector":
+        """Запуск в фоновом daemon-потоке (если этот процесс — владелец блокировки коллектора)."""
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return self
+            if not self._acquire_process_lock():
+                return self
+            self._stop.clear()
+            self._thread = threading.Thread(target=self.run_forever, name="moex-collector", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self, timeout: float | None = 30.0) -> None:
+        """Просим цикл завершиться; текущий борд дописывается, дальше не идём."""
+        self._stop.set()
+        if self._thread and self._thread is not threading.current_thread():
+            self._thread.join(timeout)
+        with self._lock:
+            self._release_process_lock()
+
+    # -------- health --------
+
+    def status(self) -> Dict[str, Any]:
+        """
+        Состояние для health-check. lag_sec — сколько секунд назад борд
+        успешно обновлялся; борд считается отстающим, если лаг > 3 интервалов.
+        """
+        now = time.time()
+        interval = self.current_interval()
+        boards = {}
+        with self._lock:
+            for code, st in self._boards_state.items():
+                lag = None if st["last_ok"] is None else round(now - st["last_ok"], 1)
+                boards[code] = {
+                    **st,
+                    "lag_sec": lag,
+                    "healthy": lag is not None and lag <= 3 * interval,
+                }
+        return {
+            # Поток мог завершиться сам — «работает» только живой цикл
+            "running": (not self._stop.is_set() and self._started_at is not None
+                        and (self._thread is None or self._thread.is_alive())),
+            "pid": os.getpid(),
+            "started_at": self._started_at,
+            "cycles": self._cycles,
+            "standby": self.standby,
+            "cycle_failures": self._cycle_failures,
+            "last_cycle_error": self._cycle_error,
+            "interval_sec": interval,
+            "trading_time": is_trading_time(),
+            "healthy": all(b["healthy"] for b in boards.values()),
+            "boards": boards,
+            "updated_at": now,
+        }
+
+    def _write_status(self) -> None:
+        """Для отдельного процесса: статус пишется в файл, веб читает его в /api/collector."""
+        if not self.status_file:
+            return
+        tmp = f"{self.status_file}.tmp"
+        try:
+            with open(tmp, "w", encoding="utf-8") as fh:
+                json.dump(self.status(), fh, ensure_ascii=False)
+            os.replace(tmp, self.status_file)
+        except (OSError, TypeError, ValueError) as exc:  # диск или несериализуемое значение в статусе
+            log.warning("collector: cannot write status file: %s", exc)
+
+
+def read_status_file(path: str, max_age: float | None = None) -> Dict[str, Any] | None:
+    """Статус внешнего коллектора из файла. Устаревший файл => healthy=False."""
+    try:
+        with open(path, encoding="utf-8") as fh:
+            status = json.load(fh)
+    except (OSError, ValueError):
+        return None
+    if max_age is not None and time.time() - status.get("updated_at", 0) > max_age:
+        status["healthy"] = False
+        status["running"] = False
+    return status
@@ -4,13 +4,23 @@
 Включаем:
 - check_same_thread=False — чтобы ORM не ругалась при работе из Flask-потоков,
 - timeout и WAL — чтобы реже ловить 'database is locked'.
+- метрики SQL (время запросов, удержание блокировки записи) — см. metrics;
+- профилировщик (N+1, медленные запросы с планом) — см. query_profiler.
+
+Движок создаётся лениво — при первом обращении (get_engine() или первая сессия SessionLocal),
+а не при импорте: воркер, который ещё не ходил в БД, не держит ни движка, ни соединений.
+URL — FLASK_DB_URL (или файл по умолчанию); скрипт может подменить его через configure() до первого обращения.
+Схему при старте не проверяем — это отдельный шаг: flask init-db или python -m scripts.create_db.
 """
 
 from __future__ import annotations
 import os
+import threading
 from sqlalchemy import create_engine, event
 from sqlalchemy.orm import sessionmaker, scoped_session, DeclarativeBase
 
+from . import query_profiler
+
 # Файл БД храним в корне репо
 DEFAULT_DB_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), "..", "flaskparsermoex.sqlite3")
 DEFAULT_DB_URL = f"sqlite:///{os.path.abspath(DEFAULT_DB_PATH)}"
@@ -36,13 +46,46 @@ def make_engine(db_url: str | None = None):
     @event.listens_for(engine, "connect")
     def _set_sqlite_pragma(dbapi_conn, _):
         cur = dbapi_conn.cursor()
+        # Для новой БД: место от удалённых снимков можно вернуть PRAGMA incremental_vacuum
+        # (у существующего файла режим меняется только после VACUUM — см. scripts.retention)
+        cur.execute("PRAGMA auto_vacuum=INCREMENTAL;")
         cur.execute("PRAGMA journal_mode=WAL;")
         cur.execute("PRAGMA synchronous=NORMAL;")
         cur.close()
 
+    query_profiler.attach(engine)  # SQL-метрики и профиль — один общий слушатель
     return engine
 
 
-ENGINE = make_engine()
-# scoped_session — безопасен для многопоточности Flask
-SessionLocal = scoped_session(sessionmaker(bind=ENGINE, autoflush=False, autocommit=False))
+_engine = None
+_db_url: str | None = None
+_engine_lock = threading.Lock()
+
+
+def configure(db_url: str | None) -> None:
+    """URL БД для движка процесса; действует, пока движок ещё не создан."""
+    global _db_url
+    if db_url and _engine is not None and str(_engine.url) != db_url:
+        raise RuntimeError(f"engine already created for {_engine.url}")
+    _db_url = db_url or None
+
+
+def get_engine():
+    """Движок процесса (создаётся при первом вызове)."""
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                _engine = make_engine(_db_url)
+    return _engine
+
+
+_session_factory = sessionmaker(autoflush=False, autocommit=False)
+
+
+def _new_session():
+    return _session_factory(bind=get_engine())
+
+
+# scoped_session — безопасен для многопоточности Flask; движок подключается при первой сессии
+SessionLocal = scoped_session(_new_session)
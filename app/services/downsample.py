@@ -0,0 +1,78 @@
+# app/services/downsample.py
+"""
+Прореживание временных рядов на сервере, чтобы график не получал десятки тысяч точек.
+- bucket_last — «последняя точка в каждом интервале step» (свечи без OHLC);
+- lttb — Largest-Triangle-Three-Buckets: сохраняет форму ряда при заданном числе точек.
+Точка — кортеж (t_seconds, y, *payload); payload переносится как есть.
+"""
+
+from __future__ import annotations
+import re
+from typing import Iterable, List, Sequence, Tuple
+
+Point = Tuple  # (t_seconds: float, y: float | None, *payload)
+
+_STEP_RE = re.compile(r"^\s*(\d+)\s*([smhd]?)\s*$", re.IGNORECASE)
+_STEP_UNITS = {"": 1, "s": 1, "m": 60, "h": 3600, "d": 86400}
+
+
+def parse_step(step: str | None) -> int | None:
+    """'300' / '5m' / '1h' / '1d' -> секунды; пусто или мусор -> None."""
+    if not step:
+        return None
+    m = _STEP_RE.match(step)
+    if not m:
+        return None
+    seconds = int(m.group(1)) * _STEP_UNITS[m.group(2).lower()]
+    return seconds or None
+
+
+def bucket_last(points: Iterable[Point], step: int) -> List[Point]:
+    """Последняя точка в каждом интервале [k*step, (k+1)*step). Вход отсортирован по времени."""
+    out: List[Point] = []
+    current = None
+    for p in points:
+        bucket = int(p[0] // step)
+        if out and bucket == current:
+            out[-1] = p
+        else:
+            out.append(p)
+            current = bucket
+    return out
+
+
+def lttb(points: Sequence[Point], threshold: int) -> List[Point]:
+    """
+    Largest-Triangle-Three-Buckets (Steinarsson, 2013). Первая и последняя точки сохраняются,
+    из каждого промежуточного бакета берётся точка с наибольшей площадью треугольника.
+    Точки с y=None в расчёт не берутся.
+    """
+    data = [p for p in points if p[1] is not None]
+    n = len(data)
+    if threshold >= n or threshold < 3:
+        return list(data)
+
+    sampled = [data[0]]
+    every = (n - 2) / (threshold - 2)
+    a = 0
+    for i in range(threshold - 2):
+        # Средняя точка следующего бакета
+        avg_start = int((i + 1) * every) + 1
+        avg_end = min(int((i + 2) * every) + 1, n)
+        span = avg_end - avg_start
+        avg_x = sum(p[0] for p in data[avg_start:avg_end]) / span
+        avg_y = sum(p[1] for p in data[avg_start:avg_end]) / span
+
+        # Текущий бакет
+        start = int(i * every) + 1
+        end = int((i + 1) * every) + 1
+        ax, ay = data[a][0], data[a][1]
+        best, best_area = start, -1.0
+        for j in range(start, end):
+            area = abs((ax - avg_x) * (data[j][1] - ay) - (ax - data[j][0]) * (avg_y - ay))
+            if area > best_area:
+                best, best_area = j, area
+        sampled.append(data[best])
+        a = best
+    sampled.append(data[-1])
+    return sampled
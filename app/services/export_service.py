@@ -0,0 +1,302 @@
+# app/services/export_service.py
+"""
+Экспорт снимков из БД: CSV (в т.ч. gzip) и Parquet.
+- строки идут генератором прямо из потокового запроса репозитория:
+  память не растёт с размером выгрузки (в памяти — один снимок и его ключевой кадр);
+- CSV отдаётся кусками по batch строк, gzip сжимает поток на лету;
+- большие выгрузки можно запускать фоновым заданием (ExportJobs): результат пишется
+  в файл в EXPORT_DIR, статус — в <job_id>.json рядом, его видит любой воркер;
+  завершённые задания (файл + статус) удаляются через EXPORT_TTL секунд.
+
+Parquet требует pyarrow (необязательная зависимость).
+"""
+
+from __future__ import annotations
+import csv
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from io import StringIO
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # pragma: no cover - pyarrow необязателен
+    pa = None
+    pq = None
+
+from .repository import MoexRepository
+
+log = logging.getLogger(__name__)
+
+POINT_FIELDS = ["board", "secid", "name", "last", "change", "valtoday"]
+RANGE_FIELDS = ["board", "snapshot_at", "secid", "name", "last", "change", "valtoday"]
+FORMATS = ("csv", "csv.gz", "parquet")
+
+
+def export_filename(at: datetime | None = None, start: datetime | None = None, end: datetime | None = None,
+                    ext: str = "csv") -> str:
+    """Имя файла для Content-Disposition — только из разобранных дат, не из сырых параметров запроса."""
+    def stamp(dt: datetime) -> str:
+        return f"{dt:%Y-%m-%d_%H-%M-%S}"
+
+    if start is not None or end is not None:
+        return f"snapshots_{stamp(start) if start else 'begin'}_{stamp(end) if end else 'now'}.{ext}"
+    return f"snapshot_at_{stamp(at)}.{ext}" if at is not None else f"snapshot_latest.{ext}"
+
+
+def fields_for(start: datetime | None, end: datetime | None) -> List[str]:
+    """Точка во времени — прежний формат CSV; диапазон — с колонкой snapshot_at."""
+    return RANGE_FIELDS if (start is not None or end is not None) else POINT_FIELDS
+
+
+def iter_rows(boards: Iterable[str], at: datetime | None = None,
+              start: datetime | None = None, end: datetime | None = None) -> Iterator[Dict[str, Any]]:
+    """
+    Строки экспорта по бордам. Без start/end — снимок на момент at (последний, если at=None),
+    иначе — все снимки в [start, end]. Сессию генератор открывает и закрывает сам,
+    поэтому его можно отдавать в потоковый Response или в фоновое задание.
+    """
+    ranged = start is not None or end is not None
+    repo = MoexRepository()
+    try:
+        for bc in boards:
+            if not ranged:
+                for t in repo.get_tiles_for_snapshot_id(repo.find_snapshot_id(bc, at), limit=None):
+                    yield {"board": bc, "secid": t["secid"], "name": t["name"],
+                           "last": t["last"], "change": t["change"], "valtoday": t["valtoday"]}
+                continue
+            for _, created_at, tiles in repo.iter_snapshot_tiles(bc, start=start, end=end):
+                snapshot_at = created_at.isoformat(sep=" ")
+                for t in tiles:
+                    yield {"board": bc, "snapshot_at": snapshot_at, "secid": t["secid"], "name": t["name"],
+                           "last": t["last"], "change": t["change"], "valtoday": t["valtoday"]}
+    finally:
+        repo.close()
+
+
+def iter_csv(rows: Iterable[Dict[str, Any]], fields: List[str], batch: int = 1000) -> Iterator[str]:
+    """CSV кусками по batch строк: заголовок первым куском, дальше данные."""
+    buf = StringIO()
+    writer = csv.DictWriter(buf, fieldnames=fields, extrasaction="ignore")
+    writer.writeheader()
+    n = 0
+    for row in rows:
+        writer.writerow(row)
+        n += 1
+        if n >= batch:
+            yield buf.getvalue()
+            buf.seek(0)
+            buf.truncate()
+            n = 0
+    tail = buf.getvalue()
+    if tail:
+        yield tail
+
+
+def gzip_stream(chunks: Iterable[str], level: int = 6) -> Iterator[bytes]:
+    """Потоковое gzip-сжатие (wbits=31 — gzip-заголовок), без буферизации всего ответа."""
+    comp = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = comp.compress(chunk.encode("utf-8"))
+        if data:
+            yield data
+    yield comp.flush()
+
+
+def write_parquet(rows: Iterable[Dict[str, Any]], fields: List[str], path: str, row_group: int = 50_000) -> int:
+    """Parquet по row group'ам: в памяти держится не больше row_group строк. Возвращает число строк."""
+    if pa is None:
+        raise RuntimeError("Parquet export requires pyarrow (pip install pyarrow)")
+    types = {"last": pa.float64(), "change": pa.float64(), "valtoday": pa.float64()}
+    schema = pa.schema([(f, types.get(f, pa.string())) for f in fields])
+    total = 0
+    with pq.ParquetWriter(path, schema, compression="zstd") as writer:
+        batch: Dict[str, list] = {f: [] for f in fields}
+        for row in rows:
+            for f in fields:
+                batch[f].append(row.get(f))
+            total += 1
+            if len(batch[fields[0]]) >= row_group:
+                writer.write_table(pa.table(batch, schema=schema))
+                batch = {f: [] for f in fields}
+        if batch[fields[0]] or total == 0:
+            writer.write_table(pa.table(batch, schema=schema))
+    return total
+
+
+def write_export(fmt: str, boards: List[str], path: str, at: datetime | None = None,
+                 start: datetime | None = None, end: datetime | None = None) -> int:
+    """Выгрузка в файл в нужном формате. Возвращает число строк."""
+    fields = fields_for(start, end)
+    counter = {"rows": 0}
+
+    def _counted():
+        for row in iter_rows(boards, at=at, start=start, end=end):
+            counter["rows"] += 1
+            yield row
+
+    if fmt == "parquet":
+        return write_parquet(_counted(), fields, path)
+    chunks = iter_csv(_counted(), fields)
+    if fmt == "csv.gz":
+        with open(path, "wb") as f:
+            for data in gzip_stream(chunks):
+                f.write(data)
+    else:
+        with open(path, "w", encoding="utf-8", newline="") as f:
+            for chunk in chunks:
+                f.write(chunk)
+    return counter["rows"]
+
+
+class ExportJobs:
+    """
+    Фоновые выгрузки: submit() сразу возвращает job_id, файл пишется в пуле потоков.
+    Статус хранится в файле <job_id>.json рядом с результатом (атомарная замена),
+    поэтому опрашивать задание можно с любого воркера, у которого тот же EXPORT_DIR.
+    Завершённые задания старше ttl секунд удаляются (cleanup, не чаще раза в минуту при submit).
+    """
+
+    CLEANUP_EVERY = 60.0
+
+    def __init__(self, directory: str, max_workers: int = 2, ttl: float = 86400) -> None:
+        self.directory = directory
+        self.ttl = ttl
+        os.makedirs(directory, exist_ok=True)
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="export")
+        self._cleaned_at = 0.0
+
+    # -------- файлы --------
+
+    def _status_path(self, job_id: str) -> str:
+        return os.path.join(self.directory, f"{job_id}.json")
+
+    def output_path(self, job_id: str, fmt: str) -> str:
+        return os.path.join(self.directory, f"{job_id}.{fmt}")
+
+    def _write_status(self, job_id: str, status: Dict[str, Any]) -> None:
+        path = self._status_path(job_id)
+        tmp = f"{path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(status, f, ensure_ascii=False)
+        os.replace(tmp, path)
+
+    def status(self, job_id: str) -> Optional[Dict[str, Any]]:
+        # job_id приходит из URL — пускаем только то, что генерирует submit()
+        if not job_id or not all(c in "0123456789abcdef" for c in job_id):
+            return None
+        try:
+            with open(self._status_path(job_id), encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def cleanup(self, now: float | None = None) -> int:
+        """
+        Удаляет задания, завершённые (done/failed) больше ttl секунд назад: результат и статус.
+        Незавершённое задание, чей статус не обновлялся 2*ttl, считается брошенным (процесс умер)
+        и удаляется вместе с недописанным .part. Возвращает число удалённых заданий.
+        """
+        now = time.time() if now is None else now
+        removed = 0
+        for name in os.listdir(self.directory):
+            if not name.endswith(".json"):
+                continue
+            job_id = name[:-len(".json")]
+            status = self.status(job_id)
+            try:
+                mtime = os.path.getmtime(self._status_path(job_id))
+            except OSError:
+                continue
+            if status is None:
+                expired = now - mtime > self.ttl  # битый статус
+            elif status.get("state") in ("done", "failed"):
+                expired = now - status.get("finished_at", mtime) > self.ttl
+            else:
+                expired = now - mtime > 2 * self.ttl
+            if not expired:
+                continue
+            fmt = (status or {}).get("format")
+            paths = [self.output_path(job_id, fmt), f"{self.output_path(job_id, fmt)}.part"] if fmt in FORMATS else []
+            for path in paths + [self._status_path(job_id)]:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+            removed += 1
+        if removed:
+            log.info("export: removed %s expired jobs from %s", removed, self.directory)
+        return removed
+
+    def _maybe_cleanup(self) -> None:
+        if time.monotonic() - self._cleaned_at < self.CLEANUP_EVERY:
+            return
+        self._cleaned_at = time.monotonic()
+        try:
+            self.cleanup()
+        except OSError as e:
+            log.warning("export: cleanup of %s failed: %s", self.directory, e)
+
+    # -------- задания --------
+
+    def submit(self, fmt: str, boards: List[str], at: datetime | None = None,
+               start: datetime | None = None, end: datetime | None = None) -> Dict[str, Any]:
+        if fmt not in FORMATS:
+            raise ValueError(f"unknown export format: {fmt}")
+        if fmt == "parquet" and pa is None:
+            raise RuntimeError("Parquet export requires pyarrow (pip install pyarrow)")
+        self._maybe_cleanup()
+        job_id = uuid.uuid4().hex
+        status = {
+            "id": job_id,
+            "state": "queued",
+            "format": fmt,
+            "boards": boards,
+            "at": at.isoformat() if at else None,
+            "from": start.isoformat() if start else None,
+            "to": end.isoformat() if end else None,
+            "created_at": time.time(),
+        }
+        self._write_status(job_id, status)
+        self._pool.submit(self._run, job_id, dict(status), at, start, end)
+        return status
+
+    def _run(self, job_id: str, status: Dict[str, Any], at, start, end) -> None:
+        path = self.output_path(job_id, status["format"])
+        tmp = f"{path}.part"
+        status["state"] = "running"
+        self._write_status(job_id, status)
+        t0 = time.perf_counter()
+        try:
+            rows = write_export(status["format"], status["boards"], tmp, at=at, start=start, end=end)
+            os.replace(tmp, path)
+            status.update(state="done", rows=rows, bytes=os.path.getsize(path))
+        except Exception as e:
+            log.exception("export %s failed", job_id)
+            status.update(state="failed", error=str(e))
+            if os.path.exists(tmp):
+                os.remove(tmp)
+        status["duration_ms"] = round((time.perf_counter() - t0) * 1000, 1)
+        status["finished_at"] = time.time()
+        self._write_status(job_id, status)
+
+
+_jobs: ExportJobs | None = None
+_jobs_lock = threading.Lock()
+
+
+def get_jobs(directory: str, max_workers: int = 2, ttl: float = 86400) -> ExportJobs:
+    """Один пул фоновых выгрузок на процесс."""
+    global _jobs
+    with _jobs_lock:
+        if _jobs is None:
+            _jobs = ExportJobs(directory, max_workers=max_workers, ttl=ttl)
+        return _jobs
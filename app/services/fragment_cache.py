@@ -0,0 +1,61 @@
+# app/services/fragment_cache.py
+"""
+Кэш готовых HTML-фрагментов страниц (сетка плиток борда из heatmap.html).
+Ключ — (вид фрагмента, борд, версия данных): версия плиток из tile_cache (хэш содержимого)
+или id снимка из БД. Пока данные борда не изменились, сетку заново не рендерят — фрагмент
+общий для всех запросов и пользователей процесса, новая версия вытесняет старые по LRU.
+Без версии (борд с ошибкой загрузки) фрагмент рендерится каждый раз и не кэшируется.
+"""
+
+from __future__ import annotations
+import threading
+from collections import OrderedDict
+from typing import Callable, Hashable, Optional
+
+from . import metrics
+
+
+class FragmentCache:
+    def __init__(self, maxsize: int = 64) -> None:
+        self.maxsize = maxsize
+        self._lock = threading.Lock()
+        self._data: "OrderedDict[Hashable, str]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get_or_render(self, key: Optional[Hashable], render: Callable[[], str]) -> str:
+        """Фрагмент по ключу; при промахе — render() и запись в кэш (key=None — не кэшировать)."""
+        if key is None or self.maxsize <= 0:
+            return render()
+        with self._lock:
+            html = self._data.get(key)
+            if html is not None:
+                self._data.move_to_end(key)
+                self.hits += 1
+        if html is not None:
+            metrics.fragment_cache_total.inc(key[0], "hit")
+            return html
+        # Рендер без лока: одновременный промах по тому же ключу отрендерит фрагмент дважды, не больше
+        html = render()
+        with self._lock:
+            self.misses += 1
+            self._data[key] = html
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+        metrics.fragment_cache_total.inc(key[0], "miss")
+        return html
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+
+# Общий на процесс экземпляр; размер задаёт create_app через configure()
+fragments = FragmentCache()
+
+
+def configure(size: int | None = None) -> None:
+    if size is not None:
+        fragments.maxsize = size
+        fragments.clear()
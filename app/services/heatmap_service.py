@@ -1,6 +1,11 @@
 from typing import Dict, List, Any
 from math import isnan
 
+try:  # NumPy — необязательная зависимость для колоночного пути
+    import numpy as np
+except ImportError:  # pragma: no cover
+    np = None
+
 class HeatmapService:
     """
     Строит модель данных для теплокарт:
@@ -41,6 +46,62 @@ class HeatmapService:
             })
         return tiles
 
+    # -------- колоночный путь --------
+
+    def compute_tile_columns(self, cols: Dict[str, list], size: int) -> "TileColumns":
+        """
+        То же, что compute_tiles, но над колонками ISS (см. MoexClient.get_board_columns):
+        base_price/change считаются векторно с NaN-масками, словари по строкам
+        создаёт только TileColumns.to_dicts() — на границе с JSON/шаблоном.
+        Без NumPy считает поэлементно, результат тот же.
+        """
+        empty = [None] * size
+        secid = cols.get("SECID", empty)
+        shortname = cols.get("SHORTNAME", empty)
+        names = [(sh or s or "")[:18] for sh, s in zip(shortname, secid)]
+        valtoday = [v or w for v, w in zip(cols.get("VALTODAY", empty), cols.get("VOLTODAY", empty))]
+
+        if np is None:
+            tiles = self.compute_tiles([
+                {"SECID": s, "SHORTNAME": sh, "LAST": l, "PREVPRICE": p, "PREVSETTLEPRICE": ps}
+                for s, sh, l, p, ps in zip(secid, shortname, cols.get("LAST", empty),
+                                           cols.get("PREVPRICE", empty), cols.get("PREVSETTLEPRICE", empty))
+            ])
+            return TileColumns(secid, names, [t["last"] for t in tiles], [t["base_price"] for t in tiles],
+                               [t["change"] for t in tiles], valtoday)
+
+        last = self._float_column(cols.get("LAST"), size)
+        prev = self._float_column(cols.get("PREVPRICE"), size)
+        prev_settle = self._float_column(cols.get("PREVSETTLEPRICE"), size)
+
+        base = np.where(np.isnan(prev), prev_settle, prev)
+        # Те же условия, что в compute_tiles: base и last — не NaN и не ноль
+        valid = (base == base) & (base != 0) & (last == last) & (last != 0)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            change = (last - base) / base * 100.0
+
+        return TileColumns(
+            secid,
+            names,
+            self._nan_to_none(last, last == last),
+            self._nan_to_none(base, base == base),
+            self._nan_to_none(change, valid),
+            valtoday,
+        )
+
+    def _float_column(self, col: list | None, size: int):
+        """Колонка -> float64 (None -> NaN); нечисловые значения разбираем как _safe."""
+        if col is None:
+            return np.full(size, np.nan)
+        try:
+            return np.array(col, dtype=float)
+        except (TypeError, ValueError):
+            return np.array([self._safe(x) for x in col], dtype=float)
+
+    @staticmethod
+    def _nan_to_none(values, mask) -> list:
+        return [v if ok else None for v, ok in zip(values.tolist(), mask.tolist())]
+
     def to_db_items(self, tiles: list[dict]) -> list[dict]:
         """
         Приводит плитки к списку словарей с ключами, которые ожидает репозиторий:
@@ -57,3 +118,27 @@ class HeatmapService:
             }
             for t in tiles
         ]
+
+
+class TileColumns:
+    """Плитки борда в колоночном виде. В словари превращаются только в to_dicts()."""
+
+    __slots__ = ("secid", "name", "last", "base_price", "change", "valtoday")
+
+    def __init__(self, secid, name, last, base_price, change, valtoday) -> None:
+        self.secid = secid
+        self.name = name
+        self.last = last
+        self.base_price = base_price
+        self.change = change
+        self.valtoday = valtoday
+
+    def __len__(self) -> int:
+        return len(self.secid)
+
+    def to_dicts(self) -> List[Dict[str, Any]]:
+        """Тот же формат (и порядок ключей), что у HeatmapService.compute_tiles."""
+        return [
+            {"secid": s, "name": n, "shortname": n, "last": l, "base_price": b, "change": c, "valtoday": v}
+            for s, n, l, b, c, v in zip(self.secid, self.name, self.last, self.base_price, self.change, self.valtoday)
+        ]
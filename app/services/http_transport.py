@@ -0,0 +1,114 @@
+# app/services/http_transport.py
+"""
+Общий на процесс HTTP-транспорт для ISS MOEX.
+- requests.Session с пулом keep-alive соединений (без TCP+TLS рукопожатия на каждый вызов)
+- явное согласование сжатия (gzip/deflate)
+- экспоненциальный backoff с джиттером для повторов
+- статистика по вызовам: задержка, байты «по проводу» и после распаковки
+"""
+
+from __future__ import annotations
+import random
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+
+class HttpTransport:
+    def __init__(
+        self,
+        pool_size: int = 10,
+        backoff_base: float = 0.25,
+        backoff_cap: float = 5.0,
+        history: int = 200,
+    ) -> None:
+        self.pool_size = pool_size
+        self.backoff_base = backoff_base
+        self.backoff_cap = backoff_cap
+
+        self.session = requests.Session()
+        # Повторы делает MoexClient (со своим backoff), urllib3 их не дублирует
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers.update({
+            "Accept": "application/json",
+            "Accept-Encoding": "gzip, deflate",
+            "User-Agent": "FlaskParserMOEX",
+        })
+
+        self._lock = threading.Lock()
+        self._recent: deque = deque(maxlen=history)
+        self._totals = {"calls": 0, "errors": 0, "bytes_wire": 0, "bytes_decoded": 0, "latency_ms": 0.0}
+
+    def get_json(self, url: str, params: Optional[Dict[str, Any]] = None, timeout: float = 10) -> Any:
+        """GET + разбор JSON. Ошибки (сеть, HTTP-статус) пробрасываются наверх."""
+        started = time.perf_counter()
+        status, wire, decoded = None, 0, 0
+        try:
+            resp = self.session.get(url, params=params, timeout=timeout)
+            status = resp.status_code
+            body = resp.content
+            decoded = len(body)
+            # tell() у urllib3 — сколько байт прочитано из сокета, т.е. до распаковки
+            wire = resp.raw.tell() if resp.raw is not None else decoded
+            resp.raise_for_status()
+            data = resp.json()
+        except Exception:
+            self._record(url, status, started, wire, decoded, ok=False)
+            raise
+        self._record(url, status, started, wire, decoded, ok=True)
+        return data
+
+    def backoff(self, attempt: int) -> float:
+        """Пауза перед повтором №attempt (с 0): full jitter, U(0, min(cap, base * 2^attempt))."""
+        return random.uniform(0, min(self.backoff_cap, self.backoff_base * (2 ** attempt)))
+
+    # -------- статистика --------
+
+    def _record(self, url: str, status: int | None, started: float, wire: int, decoded: int, ok: bool) -> None:
+        latency = (time.perf_counter() - started) * 1000.0
+        with self._lock:
+            t = self._totals
+            t["calls"] += 1
+            t["errors"] += 0 if ok else 1
+            t["bytes_wire"] += wire
+            t["bytes_decoded"] += decoded
+            t["latency_ms"] += latency
+            self._recent.append({
+                "url": url, "status": status, "ok": ok,
+                "latency_ms": round(latency, 1), "bytes_wire": wire, "bytes_decoded": decoded,
+                "at": time.time(),
+            })
+
+    def stats(self, recent: int = 20) -> Dict[str, Any]:
+        with self._lock:
+            t = dict(self._totals)
+            last = list(self._recent)[-recent:] if recent else []
+        calls = t["calls"] or 1
+        return {
+            **t,
+            "latency_ms": round(t["latency_ms"], 1),
+            "avg_latency_ms": round(t["latency_ms"] / calls, 1),
+            "compression_ratio": round(t["bytes_decoded"] / t["bytes_wire"], 2) if t["bytes_wire"] else None,
+            "pool_size": self.pool_size,
+            "recent": last,
+        }
+
+
+_transport: HttpTransport | None = None
+_transport_lock = threading.Lock()
+
+
+def get_transport(pool_size: int = 10) -> HttpTransport:
+    """Один транспорт (и пул соединений) на процесс; pool_size учитывается при первом вызове."""
+    global _transport
+    if _transport is None:
+        with _transport_lock:
+            if _transport is None:
+                _transport = HttpTransport(pool_size=pool_size)
+    return _transport
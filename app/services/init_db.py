@@ -1,6 +1,11 @@
 # app/services/init_db.py
-"""Создание всех таблиц в базе."""
-from .db import ENGINE, Base
+"""Создание всех таблиц в базе + доводка схемы существующих файлов (flask init-db, scripts.create_db)."""
+from .db import get_engine, Base
+from .migrations import upgrade
+from . import models  # noqa: F401 — регистрирует модели в Base.metadata
 
-def create_all_tables() -> None:
-    Base.metadata.create_all(bind=ENGINE)
+def create_all_tables() -> list[str]:
+    """Создаёт недостающие таблицы и применяет миграции; возвращает выполненные шаги миграций."""
+    engine = get_engine()
+    Base.metadata.create_all(bind=engine)
+    return upgrade(engine)
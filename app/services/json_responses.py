@@ -0,0 +1,70 @@
+# app/services/json_responses.py
+"""
+Готовые JSON-ответы с ETag.
+Тело ответа сериализуется один раз на версию данных и хранится в небольшом LRU
+по ETag; запрос с совпадающим If-None-Match получает 304 без сериализации вообще.
+
+ETag строится из версий данных (tile_cache.tiles_version, id снимков), поэтому
+его можно посчитать, не собирая payload.
+"""
+
+from __future__ import annotations
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Optional
+
+from flask import Response, current_app, request
+
+
+class SerializedLRU:
+    """LRU: etag -> готовые байты JSON."""
+
+    def __init__(self, maxsize: int = 128) -> None:
+        self.maxsize = maxsize
+        self._lock = threading.Lock()
+        self._data: "OrderedDict[str, bytes]" = OrderedDict()
+
+    def get(self, etag: str) -> Optional[bytes]:
+        with self._lock:
+            body = self._data.get(etag)
+            if body is not None:
+                self._data.move_to_end(etag)
+            return body
+
+    def put(self, etag: str, body: bytes) -> None:
+        with self._lock:
+            self._data[etag] = body
+            self._data.move_to_end(etag)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+
+bodies = SerializedLRU()
+
+
+def dumps(payload: Any) -> bytes:
+    """Ровно те же байты, что отдал бы jsonify (провайдер JSON приложения)."""
+    return current_app.json.response(payload).get_data()
+
+
+def cached_json(etag: Optional[str], build: Callable[[], Any], cache_control: str) -> Response:
+    """
+    JSON-ответ по версии данных. etag=None — данные неполные (например, борд не загрузился):
+    отдаём как обычно, без ETag и без кэширования тела.
+    """
+    if etag is None:
+        resp = Response(dumps(build()), mimetype="application/json")
+        resp.headers["Cache-Control"] = "no-store"
+        return resp
+
+    if request.if_none_match.contains(etag):
+        resp = Response(status=304)
+    else:
+        body = bodies.get(etag)
+        if body is None:
+            body = dumps(build())
+            bodies.put(etag, body)
+        resp = Response(body, mimetype="application/json")
+    resp.set_etag(etag)
+    resp.headers["Cache-Control"] = cache_control
+    return resp
@@ -0,0 +1,189 @@
+# app/services/live_stream.py
+"""
+Живое обновление теплокарт через Server-Sent Events.
+
+Один TileBroadcaster на процесс: фоновый поток раз в interval секунд читает
+плитки бордов (кэш -> при промахе MOEX), и только если версия данных сменилась,
+считает дельту по плиткам (изменились last/change, появились/пропали бумаги),
+сериализует её ОДИН раз и раскладывает готовую строку по очередям подписчиков.
+Сотни открытых дашбордов не ходят ни в кэш, ни в БД — они только читают свою очередь.
+
+Новый подписчик сначала получает полный снимок (event: snapshot), дальше — дельты
+(event: tiles). Медленный клиент, у которого переполнилась очередь, не тормозит
+остальных: его очередь сбрасывается и он получает полный снимок заново.
+"""
+
+from __future__ import annotations
+import json
+import logging
+import queue
+import threading
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from flask import Flask
+
+log = logging.getLogger(__name__)
+
+# Загрузчик записей кэша: specs -> ({board: {"tiles", "version"}}, {board: ошибка})
+EntriesLoader = Callable[[List[Dict[str, str]]], Tuple[Dict[str, Dict[str, Any]], Dict[str, str]]]
+
+
+def sse_message(event: str, data: str, msg_id: int | None = None) -> str:
+    """Одно SSE-сообщение; data — уже сериализованный JSON (без переводов строк)."""
+    head = f"id: {msg_id}\n" if msg_id is not None else ""
+    return f"{head}event: {event}\ndata: {data}\n\n"
+
+
+def _dumps(obj: Any) -> str:
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":"), default=str)
+
+
+def tile_delta(old: Dict[str, Dict[str, Any]], tiles: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], List[str]]:
+    """(изменившиеся/новые плитки, secid пропавших) между прошлым состоянием и новыми плитками."""
+    changed = []
+    seen = set()
+    for t in tiles:
+        secid = t["secid"]
+        seen.add(secid)
+        prev = old.get(secid)
+        if prev is None or prev.get("last") != t.get("last") or prev.get("change") != t.get("change"):
+            changed.append(t)
+    removed = [secid for secid in old if secid not in seen]
+    return changed, removed
+
+
+class Subscription:
+    """Очередь готовых SSE-строк одного клиента."""
+
+    def __init__(self, maxsize: int) -> None:
+        self._queue: "queue.Queue[str]" = queue.Queue(maxsize=maxsize)
+        self.resyncs = 0
+
+    def offer(self, msg: str) -> bool:
+        try:
+            self._queue.put_nowait(msg)
+            return True
+        except queue.Full:
+            return False
+
+    def reset(self, full_msg: str) -> None:
+        """Клиент отстал: выкидываем накопленные дельты, оставляем один полный снимок."""
+        while True:
+            try:
+                self._queue.get_nowait()
+            except queue.Empty:
+                break
+        self._queue.put_nowait(full_msg)
+        self.resyncs += 1
+
+    def get(self, timeout: float) -> Optional[str]:
+        try:
+            return self._queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class TileBroadcaster:
+    def __init__(self, app: Flask, specs: List[Dict[str, str]], load_entries: EntriesLoader,
+                 interval: float = 2.0, queue_size: int = 100) -> None:
+        self.app = app
+        self.specs = specs
+        self.load_entries = load_entries
+        self.interval = interval
+        self.queue_size = queue_size
+        self._lock = threading.Lock()
+        self._subs: List[Subscription] = []
+        self._state: Dict[str, Dict[str, Dict[str, Any]]] = {}  # board -> secid -> tile
+        self._versions: Dict[str, Optional[str]] = {}
+        self._full_msg: Optional[str] = None
+        self._seq = 0
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.published = 0
+
+    # -------- подписчики --------
+
+    def subscribe(self) -> Subscription:
+        sub = Subscription(self.queue_size)
+        with self._lock:
+            if self._full_msg is not None:
+                sub.offer(self._full_msg)
+            self._subs.append(sub)
+        self._ensure_thread()
+        self._wake.set()
+        return sub
+
+    def unsubscribe(self, sub: Subscription) -> None:
+        with self._lock:
+            if sub in self._subs:
+                self._subs.remove(sub)
+
+    @property
+    def subscribers(self) -> int:
+        with self._lock:
+            return len(self._subs)
+
+    # -------- рассылка --------
+
+    def publish(self, entries: Dict[str, Dict[str, Any]]) -> int:
+        """
+        Новые записи {board: {"tiles", "version"}} -> одна дельта на всех подписчиков.
+        Борд без версии (не загрузился) пропускаем, а не «удаляем» все его плитки.
+        Возвращает число разосланных изменений плиток.
+        """
+        with self._lock:
+            boards: Dict[str, Dict[str, Any]] = {}
+            for board, entry in entries.items():
+                version = entry.get("version")
+                if version is None or version == self._versions.get(board):
+                    continue
+                old = self._state.get(board, {})
+                changed, removed = tile_delta(old, entry["tiles"])
+                self._state[board] = {t["secid"]: t for t in entry["tiles"]}
+                self._versions[board] = version
+                if changed or removed or not old:
+                    boards[board] = {"version": version, "tiles": changed, "removed": removed}
+            if not boards:
+                return 0
+
+            self._seq += 1
+            full = {"seq": self._seq, "boards": {
+                b: {"version": self._versions[b], "tiles": list(tiles.values())} for b, tiles in self._state.items()
+            }}
+            self._full_msg = sse_message("snapshot", _dumps(full), self._seq)
+            delta_msg = sse_message("tiles", _dumps({"seq": self._seq, "boards": boards}), self._seq)
+            for sub in self._subs:
+                if not sub.offer(delta_msg):
+                    sub.reset(self._full_msg)
+            self.published += 1
+            return sum(len(b["tiles"]) + len(b["removed"]) for b in boards.values())
+
+    # -------- фоновый опрос --------
+
+    def _ensure_thread(self) -> None:
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="moex-live-stream", daemon=True)
+            self._thread.start()
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            # Без подписчиков никуда не ходим — ждём первого
+            if not self.subscribers:
+                self._wake.wait()
+                self._wake.clear()
+                continue
+            try:
+                with self.app.app_context():
+                    entries, _ = self.load_entries(self.specs)
+                self.publish(entries)
+            except Exception as exc:
+                log.warning("live stream: poll failed: %s", exc)
+            self._stop.wait(self.interval)
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._wake.set()
@@ -0,0 +1,219 @@
+# app/services/metrics.py
+"""
+Метрики процесса в текстовом формате Prometheus (GET /metrics), без внешних зависимостей.
+- Counter — монотонный счётчик, Histogram — фиксированные корзины + сумма + количество;
+  наблюдение = bisect по корзинам под коротким локом, поэтому метрики можно не выключать.
+- Метки — кортеж значений в порядке labelnames; держим кардинальность низкой
+  (борд, исход, endpoint, а не URL/secid).
+
+Что меряется:
+- moex_request_seconds{board,outcome} — загрузка борда из ISS (с повторами), outcome=ok|error;
+- moex_reference_total{board,result} — справочные данные борда: hit (опрос только marketdata),
+  refresh (полный ответ: смена торгового дня), new_securities (дочитан справочник);
+- tiles_cache_total{board,result} — hit|stale|miss при выдаче плиток;
+- fragment_cache_total{fragment,result} — hit|miss кэша готового HTML (сетки плиток);
+- http_request_seconds{endpoint,method,status} — латентность роутов;
+- db_statement_seconds{op} — каждый SQL; db_statements_per_request / db_seconds_per_request;
+- db_write_lock_seconds — от первой записи в транзакции до commit/rollback
+  (столько SQLite держит блокировку записи);
+- snapshot_items{board,kind} / snapshot_write_seconds{board} — размер и время записи снимков.
+
+Счётчики живут в памяти процесса: при нескольких воркерах Prometheus опрашивает каждый.
+"""
+
+from __future__ import annotations
+import bisect
+import threading
+import time
+from typing import Dict, Iterable, List, Sequence, Tuple
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+SIZE_BUCKETS = (0, 10, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 25000)
+COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 250, 1000)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _fmt(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()) -> None:
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()) -> None:
+        super().__init__(name, help, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, *labels: str, amount: float = 1) -> None:
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, *labels: str) -> float:
+        with self._lock:
+            return self._values.get(labels, 0)
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return self.header() + [f"{self.name}{_labels(self.labelnames, k)} {_fmt(v)}" for k, v in items]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (),
+                 buckets: Iterable[float] = LATENCY_BUCKETS) -> None:
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # метки -> [счётчики по корзинам (+Inf последней), сумма]
+        self._values: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, value: float, *labels: str) -> None:
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(labels)
+            if state is None:
+                state = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            state[0][i] += 1
+            state[1] += value
+
+    def count(self, *labels: str) -> int:
+        with self._lock:
+            state = self._values.get(labels)
+            return sum(state[0]) if state else 0
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = sorted((k, (list(v[0]), v[1])) for k, v in self._values.items())
+        lines = self.header()
+        for labels, (counts, total) in items:
+            cumulative = 0
+            for bound, n in zip(self.buckets + (float("inf"),), counts):
+                cumulative += n
+                le = 'le="' + _fmt(bound) + '"'
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, labels)} {_fmt(total)}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, labels)} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self) -> None:
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._register(Counter(name, help, labelnames))
+
+    def histogram(self, name: str, help: str, labelnames: Sequence[str] = (),
+                  buckets: Iterable[float] = LATENCY_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, help, labelnames, buckets))
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines: List[str] = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+moex_request_seconds = REGISTRY.histogram(
+    "moex_request_seconds", "ISS MOEX board load latency including retries", ("board", "outcome"))
+moex_retries_total = REGISTRY.counter(
+    "moex_retries_total", "Retried ISS MOEX requests", ("board",))
+moex_reference_total = REGISTRY.counter(
+    "moex_reference_total", "Board polls by reference data source (hit, refresh, new_securities)", ("board", "result"))
+tiles_cache_total = REGISTRY.counter(
+    "tiles_cache_total", "Tile cache lookups by result (hit, stale, miss)", ("board", "result"))
+fragment_cache_total = REGISTRY.counter(
+    "fragment_cache_total", "Rendered HTML fragment cache lookups (hit, miss)", ("fragment", "result"))
+http_request_seconds = REGISTRY.histogram(
+    "http_request_seconds", "HTTP request latency by route", ("endpoint", "method", "status"))
+db_statement_seconds = REGISTRY.histogram(
+    "db_statement_seconds", "SQL statement latency", ("op",))
+db_statements_per_request = REGISTRY.histogram(
+    "db_statements_per_request", "SQL statements executed per HTTP request", buckets=COUNT_BUCKETS)
+db_seconds_per_request = REGISTRY.histogram(
+    "db_seconds_per_request", "Time spent in SQL per HTTP request")
+db_write_lock_seconds = REGISTRY.histogram(
+    "db_write_lock_seconds", "Time from first write statement to commit/rollback (SQLite write lock)")
+snapshot_items = REGISTRY.histogram(
+    "snapshot_items", "Rows per saved snapshot (kind=all: items in, stored: rows written)",
+    ("board", "kind"), buckets=SIZE_BUCKETS)
+snapshot_write_seconds = REGISTRY.histogram(
+    "snapshot_write_seconds", "save_snapshot duration (before commit)", ("board",))
+snapshots_skipped_total = REGISTRY.counter(
+    "snapshots_skipped_total", "Snapshots not written because content did not change", ("board",))
+
+
+# ---------- SQL и HTTP-запросы ----------
+# События движка и before/after_request слушает один раз query_profiler (attach/init_app):
+# каждый SQL замеряется однажды, а время и счётчики уходят и в профиль, и сюда.
+
+_WRITE_OPS = {"insert", "update", "delete", "replace"}
+
+
+def _op(statement: str) -> str:
+    word = statement.lstrip()[:8].split(None, 1)
+    op = word[0].lower() if word else ""
+    return op if op in _WRITE_OPS or op in ("select", "pragma", "with") else "other"
+
+
+def observe_statement(info: dict, statement: str, elapsed: float) -> None:
+    """Один выполненный SQL; info — conn.info соединения (там же отметка начала блокировки записи)."""
+    op = _op(statement)
+    db_statement_seconds.observe(elapsed, op)
+    if op in _WRITE_OPS:
+        info.setdefault("metrics_write_started", time.perf_counter() - elapsed)
+
+
+def end_transaction(info: dict) -> None:
+    """commit/rollback: сколько держали блокировку записи SQLite."""
+    started = info.pop("metrics_write_started", None)
+    if started is not None:
+        db_write_lock_seconds.observe(time.perf_counter() - started)
+
+
+def observe_request(endpoint: str, method: str, status: str, seconds: float,
+                    statements: int, sql_seconds: float) -> None:
+    """Итог HTTP-запроса: латентность роута, число SQL и время в SQL."""
+    http_request_seconds.observe(seconds, endpoint, method, status)
+    db_statements_per_request.observe(statements)
+    db_seconds_per_request.observe(sql_seconds)
+
+
+def render() -> str:
+    return REGISTRY.render()
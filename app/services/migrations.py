@@ -0,0 +1,57 @@
+# app/services/migrations.py
+"""
+Лёгкие миграции схемы для уже существующих SQLite-файлов.
+create_all() создаёт только недостающие таблицы, поэтому новые колонки
+и индексы старых таблиц доводим здесь (идемпотентно).
+"""
+
+from __future__ import annotations
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Engine as SAEngine
+
+# (таблица, колонка, DDL-определение)
+COLUMNS = [
+    ("snapshots", "kind", "VARCHAR NOT NULL DEFAULT 'full'"),
+    ("snapshots", "base_id", "INTEGER REFERENCES snapshots(id)"),
+    ("snapshots", "content_hash", "VARCHAR"),
+    ("snapshots", "items_count", "INTEGER"),
+    ("snapshots", "stats_json", "TEXT"),
+    ("snapshots", "part", "VARCHAR"),
+    ("boards", "evict_gen", "INTEGER NOT NULL DEFAULT 0"),
+]
+
+INDEXES = [
+    "CREATE INDEX IF NOT EXISTS ix_snapshots_base_id ON snapshots (base_id)",
+    "CREATE INDEX IF NOT EXISTS ix_snapshots_part ON snapshots (part)",
+]
+
+# Только для общей таблицы строк из старых версий (новые БД её не создают — строки в партициях)
+LEGACY_INDEXES = [
+    "CREATE INDEX IF NOT EXISTS ix_item_security_snapshot "
+    "ON snapshot_items (security_id, snapshot_id, last, change_pct, valtoday)",
+]
+
+
+def upgrade(engine: SAEngine) -> list[str]:
+    """Добавляет недостающие колонки/индексы и заполняет items_count. Возвращает список шагов."""
+    done: list[str] = []
+    insp = inspect(engine)
+    legacy = insp.has_table("snapshot_items")
+    with engine.begin() as conn:
+        for table, column, ddl in COLUMNS:
+            existing = {c["name"] for c in insp.get_columns(table)}
+            if column not in existing:
+                conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}"))
+                done.append(f"{table}.{column}")
+        for ddl in INDEXES + (LEGACY_INDEXES if legacy else []):
+            conn.execute(text(ddl))
+        if not legacy:
+            return done
+        filled = conn.execute(text(
+            "UPDATE snapshots SET items_count = "
+            "(SELECT COUNT(*) FROM snapshot_items WHERE snapshot_items.snapshot_id = snapshots.id) "
+            "WHERE items_count IS NULL"
+        )).rowcount
+        if filled:
+            done.append(f"snapshots.items_count backfilled: {filled}")
+    return done
@@ -4,13 +4,15 @@ ORM-модели проекта. Связи:
 Engine 1--N Market
 Market 1--N Board
 Board 1--N Snapshot
-Snapshot 1--N SnapshotItem
-Security 1--N SnapshotItem
+Snapshot 1--N строки снимка, Security 1--N строки снимка
+
+Строки снимков — не ORM-модель: они лежат в таблицах-партициях по борду (и месяцу),
+имя таблицы снимка — в Snapshot.part (см. partitions).
 """
 
 from __future__ import annotations
 from datetime import datetime
-from sqlalchemy import String, Integer, Float, ForeignKey, DateTime, UniqueConstraint
+from sqlalchemy import String, Integer, ForeignKey, DateTime, UniqueConstraint, Text
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 from .db import Base
 
@@ -46,6 +48,8 @@ class Board(Base):
     market_id: Mapped[int] = mapped_column(ForeignKey("markets.id"), nullable=False)
     code: Mapped[str] = mapped_column(String, nullable=False)   # 'TQBR', 'RFUD'
     title: Mapped[str | None] = mapped_column(String)
+    # +1 при каждом удалении снимков борда (retention, dedup, detach) — сигнал кэшам других процессов
+    evict_gen: Mapped[int] = mapped_column(Integer, nullable=False, default=0, server_default="0")
 
     market: Mapped["Market"] = relationship(back_populates="boards")
     snapshots: Mapped[list["Snapshot"]] = relationship(back_populates="board")
@@ -60,8 +64,6 @@ class Security(Base):
     secid: Mapped[str] = mapped_column(String, unique=True, nullable=False)
     shortname: Mapped[str | None] = mapped_column(String)
 
-    items: Mapped[list["SnapshotItem"]] = relationship(back_populates="security")
-
 
 class Snapshot(Base):
     __tablename__ = "snapshots"
@@ -71,25 +73,17 @@ class Snapshot(Base):
     created_at: Mapped[datetime] = mapped_column(DateTime, nullable=False, default=datetime.utcnow)
     source: Mapped[str | None] = mapped_column(String, default="moex_iss")  # можно писать 'moex_iss_cache' и т.п.
 
+    # Хранение: 'full' — все строки (ключевой кадр), 'delta' — только изменившиеся относительно base_id
+    kind: Mapped[str] = mapped_column(String, nullable=False, default="full", server_default="full")
+    base_id: Mapped[int | None] = mapped_column(ForeignKey("snapshots.id"), index=True)
+    content_hash: Mapped[str | None] = mapped_column(String)  # для пропуска одинаковых снимков
+    items_count: Mapped[int | None] = mapped_column(Integer)  # логическое число бумаг (у delta строк меньше)
+    stats_json: Mapped[str | None] = mapped_column(Text)      # агрегаты при записи (см. snapshot_stats)
+    # Таблица со строками снимка (партиция); NULL — общая snapshot_items из старых версий
+    part: Mapped[str | None] = mapped_column(String, index=True)
+
     board: Mapped["Board"] = relationship(back_populates="snapshots")
-    items: Mapped[list["SnapshotItem"]] = relationship(back_populates="snapshot", cascade="all, delete-orphan")
+    base: Mapped["Snapshot | None"] = relationship(remote_side="Snapshot.id")
 
     __table_args__ = (UniqueConstraint("board_id", "created_at", name="uq_snapshot_board_time"),)
 
-
-class SnapshotItem(Base):
-    __tablename__ = "snapshot_items"
-
-    id: Mapped[int] = mapped_column(Integer, primary_key=True)
-    snapshot_id: Mapped[int] = mapped_column(ForeignKey("snapshots.id"), nullable=False)
-    security_id: Mapped[int] = mapped_column(ForeignKey("securities.id"), nullable=False)
-
-    last: Mapped[float | None] = mapped_column(Float)       # текущая цена
-    base_price: Mapped[float | None] = mapped_column(Float) # PREVPRICE/PREVSETTLEPRICE
-    change_pct: Mapped[float | None] = mapped_column(Float)
-    valtoday: Mapped[float | None] = mapped_column(Float)   # оборот
-
-    snapshot: Mapped["Snapshot"] = relationship(back_populates="items")
-    security: Mapped["Security"] = relationship(back_populates="items")
-
-    __table_args__ = (UniqueConstraint("snapshot_id", "security_id", name="uq_item_snapshot_security"),)
@@ -1,6 +1,33 @@
+import threading
 import time
-from typing import Dict, List, Any, Optional
-import requests
+from datetime import time as dtime
+from typing import Dict, List, Any, Optional, Tuple
+from .http_transport import HttpTransport, get_transport
+from .time_utils import session_day
+from . import metrics
+
+# Колонки таблиц ISS. Справочные (securities) меняются раз в торговый день, рыночные
+# (marketdata) — при каждом опросе; по умолчанию из marketdata берём только то, что идёт в плитки.
+SECURITIES_COLUMNS = "SECID,SHORTNAME,PREVPRICE,PREVSETTLEPRICE"
+MARKETDATA_COLUMNS = "SECID,LAST,VALTODAY,VOLTODAY"
+
+# Смена торгового дня (МСК), после которой справочные данные перечитываются:
+# утром — фондовый и валютный рынки, вечером после клиринга — срочный.
+DEFAULT_SESSION_ROLL = "06:00,futures=19:05"
+
+
+def parse_session_roll(spec: str | None) -> Dict[str, dtime]:
+    """'06:00,futures=19:05' -> {"*": 06:00, "futures": 19:05} (engine=HH:MM переопределяет общее время)."""
+    out = {"*": dtime(0, 0)}
+    for part in (spec or DEFAULT_SESSION_ROLL).split(","):
+        part = part.strip()
+        if not part:
+            continue
+        engine, _, hhmm = part.rpartition("=")
+        hours, _, minutes = hhmm.partition(":")
+        out[engine.strip().lower() or "*"] = dtime(int(hours), int(minutes or 0))
+    return out
+
 
 class MoexClient:
     """
@@ -9,24 +36,46 @@ class MoexClient:
     - Чёткие методы: get_board_data(...) для securities+marketdata
     - Малые, предсказуемые ответы (dict/list)
     - Повторы (retries) и таймауты контролируем параметрами
+    - HTTP идёт через общий на процесс транспорт (пул keep-alive соединений, gzip)
+    - Справочные данные борда (securities) кэшируются на торговый день: опрос тянет
+      только marketdata и склеивает её со справочником в памяти
     """
 
     BASE = "https://iss.moex.com/iss"
+    # Не чаще этого (сек) перечитываем справочник из-за незнакомых SECID в marketdata
+    NEW_SECURITIES_MIN_INTERVAL = 60.0
 
-    def __init__(self, timeout: int = 10, retries: int = 2) -> None:
+    def __init__(self, timeout: int = 10, retries: int = 2, transport: HttpTransport | None = None,
+                 base: str | None = None, reference_cache: bool = True, session_roll: str | None = None,
+                 reference_max_age: float = 0.0, marketdata_columns: str | None = None) -> None:
         self.timeout = timeout
         self.retries = retries
+        self.transport = transport or get_transport()
+        # Другой адрес ISS (зеркало, локальная заглушка для бенчмарков)
+        self.base = (base or self.BASE).rstrip("/")
+        self.reference_cache = reference_cache
+        self.session_roll = parse_session_roll(session_roll)
+        # Страховка поверх смены дня: перечитывать справочник не реже (сек); 0 — только при смене дня
+        self.reference_max_age = float(reference_max_age or 0)
+        self.marketdata_columns = marketdata_columns or MARKETDATA_COLUMNS
+        # (engine, market, board) -> {"day", "fetched_at", "checked_at", "securities", "rows", "secids"}
+        self._reference: Dict[tuple, Dict[str, Any]] = {}
+        self._reference_lock = threading.Lock()
 
-    def _request(self, url: str, params: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    def _request(self, url: str, params: Optional[Dict[str, Any]] = None, board: str = "") -> Dict[str, Any]:
         last_exc = None
+        started = time.perf_counter()
         for attempt in range(self.retries + 1):
             try:
-                resp = requests.get(url, params=params, timeout=self.timeout)
-                resp.raise_for_status()
-                return resp.json()
+                data = self.transport.get_json(url, params=params, timeout=self.timeout)
+                metrics.moex_request_seconds.observe(time.perf_counter() - started, board, "ok")
+                return data
             except Exception as exc:
                 last_exc = exc
-                time.sleep(0.5 * attempt + 0.1)
+                if attempt < self.retries:
+                    metrics.moex_retries_total.inc(board)
+                    time.sleep(self.transport.backoff(attempt))
+        metrics.moex_request_seconds.observe(time.perf_counter() - started, board, "error")
         raise RuntimeError(f"MOEX request failed: {url} params={params} err={last_exc}")
 
     def get_board_data(
@@ -36,33 +85,185 @@ class MoexClient:
         Возвращает объединённые таблицы securities + marketdata для указанного борда.
         Собираем только нужные колонки — так быстрее и понятнее.
         """
-        url = f"{self.BASE}/engines/{engine}/markets/{market}/boards/{board}/securities.json"
-        params = {
+        data, ref = self._board_payload(engine, market, board)
+        # Строки справочника из кэша уже разобраны в словари — собираем только marketdata
+        return {"rows": self.merge_rows(data, ref["rows"] if ref else None)}
+
+    def get_board_columns(self, engine: str, market: str, board: str) -> Dict[str, Any]:
+        """
+        То же, что get_board_data, но в колоночном виде:
+        {"columns": {"SECID": [...], "LAST": [...], ...}, "size": n}.
+        Словари по строкам не создаются — это для колоночного пути HeatmapService.
+        """
+        return self.merge_columns(self._board_payload(engine, market, board)[0])
+
+    def get_boards_index(self) -> List[Dict[str, Any]]:
+        """
+        Справочник бордов ISS (/iss/index.json): [{engine, market, board, title, is_traded, is_primary}, ...].
+        Из index.json берём только таблицы engines/markets/boards.
+        """
+        data = self._request(f"{self.base}/index.json", params={
+            "iss.only": "engines,markets,boards",
+            "iss.meta": "off",
+            "engines.columns": "id,name",
+            "markets.columns": "id,market_name",
+            "boards.columns": "engine_id,market_id,boardid,board_title,is_traded,is_primary",
+        }, board="index")
+        return self.merge_boards_index(data)
+
+    @staticmethod
+    def merge_boards_index(data: Dict[str, Any]) -> List[Dict[str, Any]]:
+        def rows(table: str) -> List[Dict[str, Any]]:
+            return [dict(zip(data[table]["columns"], row)) for row in data[table]["data"]]
+
+        engines = {r["id"]: r["name"] for r in rows("engines")}
+        markets = {r["id"]: r["market_name"] for r in rows("markets")}
+        boards = []
+        for r in rows("boards"):
+            engine, market = engines.get(r["engine_id"]), markets.get(r["market_id"])
+            if engine is None or market is None:
+                continue
+            boards.append({
+                "engine": engine,
+                "market": market,
+                "board": r["boardid"],
+                "title": r.get("board_title"),
+                "is_traded": bool(r.get("is_traded")),
+                "is_primary": bool(r.get("is_primary")),
+            })
+        return boards
+
+    # -------- разбор ответа ISS --------
+
+    def _board_url(self, engine: str, market: str, board: str) -> str:
+        return f"{self.base}/engines/{engine}/markets/{market}/boards/{board}/securities.json"
+
+    @staticmethod
+    def _board_params(marketdata_columns: str = MARKETDATA_COLUMNS) -> Dict[str, str]:
+        return {
             "iss.only": "securities,marketdata",
             "iss.meta": "off",
-            # Можно дополнять колонки по необходимости
-            "securities.columns": "SECID,SHORTNAME,PREVPRICE,PREVSETTLEPRICE",
-            "marketdata.columns": "SECID,LAST,OPEN,LOW,HIGH,VALTODAY,VOLTODAY",
+            "securities.columns": SECURITIES_COLUMNS,
+            "marketdata.columns": marketdata_columns,
         }
-        data = self._request(url, params=params)
 
-        # Преобразуем в список словарей по строкам
-        sec_cols = data["securities"]["columns"]
-        sec_rows = data["securities"]["data"]
+    # -------- справочные данные: кэш на торговый день --------
+
+    def _board_payload(self, engine: str, market: str, board: str) -> Tuple[Dict[str, Any], Optional[Dict[str, Any]]]:
+        """
+        (таблицы securities + marketdata борда, запись кэша справочника или None).
+        Со включённым кэшем полный ответ запрашивается раз в торговый день (и при появлении
+        новых бумаг), остальные опросы — только marketdata: справочные колонки (SHORTNAME,
+        PREVPRICE, PREVSETTLEPRICE) за день не меняются, а занимают большую часть ответа.
+        """
+        url = self._board_url(engine, market, board)
+        if not self.reference_cache:
+            return self._request(url, params=self._board_params(self.marketdata_columns), board=board), None
+
+        key = (engine, market, board)
+        day = session_day(roll_msk=self.session_roll.get(engine, self.session_roll["*"]))
+        now = time.monotonic()
+        with self._reference_lock:
+            ref = self._reference.get(key)
+        if ref is None or ref["day"] != day or (
+                self.reference_max_age and now - ref["fetched_at"] > self.reference_max_age):
+            metrics.moex_reference_total.inc(board, "refresh")
+            data = self._request(url, params=self._board_params(self.marketdata_columns), board=board)
+            return data, self._remember(key, day, data["securities"])
+
+        data = self._request(url, params={
+            "iss.only": "marketdata",
+            "iss.meta": "off",
+            "marketdata.columns": self.marketdata_columns,
+        }, board=board)
+        if "securities" in data:  # сервер не учёл iss.only — справочник заодно обновим
+            return data, self._remember(key, day, data["securities"])
+
+        # Новые бумаги среди дня: дочитываем только securities, не чаще NEW_SECURITIES_MIN_INTERVAL
+        md = data["marketdata"]
+        md_secid = md["columns"].index("SECID")
+        if any(row[md_secid] not in ref["secids"] for row in md["data"]) \
+                and now - ref["checked_at"] > self.NEW_SECURITIES_MIN_INTERVAL:
+            metrics.moex_reference_total.inc(board, "new_securities")
+            sec = self._request(url, params={
+                "iss.only": "securities",
+                "iss.meta": "off",
+                "securities.columns": SECURITIES_COLUMNS,
+            }, board=board)["securities"]
+            ref = self._remember(key, day, sec)
+        else:
+            metrics.moex_reference_total.inc(board, "hit")
+        return {"securities": ref["securities"], "marketdata": md}, ref
+
+    def _remember(self, key: tuple, day, securities: Dict[str, Any]) -> Dict[str, Any]:
+        columns = securities["columns"]
+        now = time.monotonic()
+        rows = [dict(zip(columns, row)) for row in securities["data"]]
+        ref = {
+            "day": day,
+            "fetched_at": now,
+            "checked_at": now,
+            "securities": securities,
+            "rows": rows,
+            "secids": frozenset(r["SECID"] for r in rows),
+        }
+        with self._reference_lock:
+            self._reference[key] = ref
+        return ref
+
+    def reset_reference(self, board: str | None = None) -> None:
+        """Сбросить кэш справочных данных (одного борда или всех)."""
+        with self._reference_lock:
+            for key in [k for k in self._reference if board is None or k[2] == board]:
+                del self._reference[key]
+
+    @staticmethod
+    def merge_rows(data: Dict[str, Any], securities: List[Dict[str, Any]] | None = None) -> List[Dict[str, Any]]:
+        """
+        securities + marketdata -> список словарей по строкам (marketdata перекрывает securities).
+        securities — уже разобранные строки справочника (кэш клиента); они не меняются, в ответ идут копии.
+        """
+        if securities is None:
+            sec_cols = data["securities"]["columns"]
+            securities = [dict(zip(sec_cols, row)) for row in data["securities"]["data"]]
         md_cols = data["marketdata"]["columns"]
         md_rows = data["marketdata"]["data"]
 
-        securities = [dict(zip(sec_cols, row)) for row in sec_rows]
-        marketdata = [dict(zip(md_cols, row)) for row in md_rows]
-
-        # Индексируем marketdata по SECID
-        md_index = {row["SECID"]: row for row in marketdata}
+        # Индексируем marketdata по SECID (строки ISS как есть, без промежуточных словарей)
+        md_secid = md_cols.index("SECID")
+        md_index = {row[md_secid]: row for row in md_rows}
 
         # Склеиваем инфо по каждой бумаге
         merged: List[Dict[str, Any]] = []
         for s in securities:
-            secid = s["SECID"]
-            md = md_index.get(secid, {})
-            merged.append({**s, **md})
+            row = dict(s)
+            md = md_index.get(s["SECID"])
+            if md is not None:
+                row.update(zip(md_cols, md))
+            merged.append(row)
+
+        return merged
+
+    @staticmethod
+    def merge_columns(data: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        securities + marketdata -> колонки в порядке securities.
+        Семантика как у merge_rows: колонки marketdata перекрывают одноимённые из securities,
+        у бумаг без marketdata её колонки заполняются None.
+        """
+        sec_cols = data["securities"]["columns"]
+        sec_rows = data["securities"]["data"]
+        md_cols = data["marketdata"]["columns"]
+        md_rows = data["marketdata"]["data"]
+
+        columns: Dict[str, list] = {name: list(col) for name, col in zip(sec_cols, zip(*sec_rows))} \
+            if sec_rows else {name: [] for name in sec_cols}
 
-        return {"rows": merged}
+        md_secid = md_cols.index("SECID")
+        md_index = {row[md_secid]: i for i, row in enumerate(md_rows)}
+        positions = [md_index.get(secid) for secid in columns.get("SECID", [])]
+        for j, name in enumerate(md_cols):
+            if name == "SECID":
+                continue
+            columns[name] = [None if p is None else md_rows[p][j] for p in positions]
+        return {"columns": columns, "size": len(sec_rows)}
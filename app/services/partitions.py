@@ -0,0 +1,132 @@
+# app/services/partitions.py
+"""
+Партиции строк снимков. Вместо одной общей snapshot_items у каждого борда свои таблицы:
+- SNAPSHOT_PARTITION=board — snapshot_items_<board_id>, одна на борд;
+- SNAPSHOT_PARTITION=month — snapshot_items_<board_id>_<YYYYMM>, на борд и календарный месяц (UTC).
+Схему можно задать и отдельному борду (partition в реестре бордов).
+
+Таблица, в которой лежат строки снимка, записана в snapshots.part (NULL — общая
+snapshot_items из старых версий, её переносит scripts.partitions migrate). Поэтому смена
+схемы не ломает чтение уже записанного, а частый борд не раздувает индексы остальных.
+Дельта всегда лежит в той же партиции, что и её ключевой кадр (на границе партиции
+пишется новый кадр), — старую партицию можно отцепить целиком: DROP TABLE вместо
+построчного DELETE (см. MoexRepository.detach_partition).
+"""
+
+from __future__ import annotations
+import re
+import threading
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import Column, Float, ForeignKey, Index, Integer, MetaData, Table, UniqueConstraint, event, text
+from sqlalchemy.orm import Session
+
+from .models import Security, Snapshot
+from .snapshot_storage import STORAGE
+
+LEGACY = "snapshot_items"
+_NAME = re.compile(r"^snapshot_items_(\d+)(?:_(\d{4})(\d{2}))?$")
+
+# Таблицы партиций — в отдельной MetaData: create_all() их не создаёт, они появляются при первой записи
+_metadata = MetaData()
+_tables: Dict[str, Table] = {}
+_tables_lock = threading.Lock()
+
+# Таблицы, которые точно есть в БД (по URL). Созданные в транзакции попадают сюда только после
+# commit — откат CREATE TABLE не должен оставить в кэше несуществующую таблицу.
+_CREATED: Dict[str, set] = {}
+_PENDING_KEY = "moex_pending_partitions"
+
+
+def item_table(name: str) -> Table:
+    """Core-таблица строк снимков с именем name (партиция или общая snapshot_items)."""
+    table = _tables.get(name)
+    if table is not None:
+        return table
+    with _tables_lock:
+        table = _tables.get(name)
+        if table is None:
+            # У общей таблицы — прежние имена ограничений и индексов, у партиций — с именем таблицы
+            uq, ix = (("uq_item_snapshot_security", "ix_item_security_snapshot") if name == LEGACY
+                      else (f"uq_{name}_snapshot_security", f"ix_{name}_security_snapshot"))
+            table = Table(
+                name, _metadata,
+                Column("id", Integer, primary_key=True),
+                Column("snapshot_id", ForeignKey(Snapshot.__table__.c.id), nullable=False),
+                Column("security_id", ForeignKey(Security.__table__.c.id), nullable=False),
+                Column("last", Float),
+                Column("base_price", Float),
+                Column("change_pct", Float),
+                Column("valtoday", Float),
+                UniqueConstraint("snapshot_id", "security_id", name=uq),
+                # Покрывающий индекс для истории по бумаге: выборка идёт только по индексу
+                Index(ix, "security_id", "snapshot_id", "last", "change_pct", "valtoday"),
+            )
+            _tables[name] = table
+    return table
+
+
+def scheme_for(board_code: str) -> str:
+    return STORAGE["partition_by_board"].get(board_code) or STORAGE["partition"]
+
+
+def partition_name(board_id: int, board_code: str, created_at: datetime) -> str:
+    """Партиция для нового снимка борда."""
+    if scheme_for(board_code) == "month":
+        return f"snapshot_items_{board_id}_{created_at:%Y%m}"
+    return f"snapshot_items_{board_id}"
+
+
+def parse_name(name: str) -> Optional[Tuple[int, Optional[str]]]:
+    """'snapshot_items_3_202510' -> (3, '2025-10'); 'snapshot_items_3' -> (3, None); иначе None."""
+    m = _NAME.match(name)
+    if m is None:
+        return None
+    return int(m.group(1)), (f"{m.group(2)}-{m.group(3)}" if m.group(2) else None)
+
+
+def period_overlaps(period: Optional[str], start: datetime | None, end: datetime | None) -> bool:
+    """Может ли партиция месяца period ('YYYY-MM') содержать снимки из [start, end]."""
+    if period is None:
+        return True
+    month = period.replace("-", "")
+    return ((start is None or month >= f"{start:%Y%m}") and (end is None or month <= f"{end:%Y%m}"))
+
+
+def _db_key(session: Session) -> str:
+    return str(session.get_bind().url)
+
+
+def ensure_table(session: Session, name: str) -> Table:
+    """Таблица партиции (создаётся в текущей транзакции, если её ещё нет)."""
+    table = item_table(name)
+    db_key = _db_key(session)
+    if name not in _CREATED.get(db_key, ()):
+        table.create(session.connection(), checkfirst=True)
+        session.info.setdefault(_PENDING_KEY, set()).add((db_key, name))
+    return table
+
+
+def forget(db_key: str, name: str) -> None:
+    """Убрать таблицу из кэша созданных (после DROP)."""
+    _CREATED.get(db_key, set()).discard(name)
+
+
+@event.listens_for(Session, "after_commit")
+def _promote_created(session: Session) -> None:
+    for db_key, name in session.info.pop(_PENDING_KEY, ()):
+        _CREATED.setdefault(db_key, set()).add(name)
+
+
+@event.listens_for(Session, "after_rollback")
+def _drop_pending(session: Session) -> None:
+    session.info.pop(_PENDING_KEY, None)
+
+
+def existing(session: Session) -> List[str]:
+    """Все таблицы строк снимков в БД: партиции и (если ещё есть) общая snapshot_items."""
+    names = session.execute(text(
+        "SELECT name FROM sqlite_master WHERE type = 'table' AND (name = :legacy OR name LIKE 'snapshot\\_items\\_%' ESCAPE '\\')"
+    ), {"legacy": LEGACY}).scalars()
+    return sorted(n for n in names if n == LEGACY or parse_name(n) is not None)
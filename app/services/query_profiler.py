@@ -0,0 +1,235 @@
+# app/services/query_profiler.py
+"""
+Профилировщик SQL на движке из db.make_engine (события before/after_cursor_execute).
+Это единственный слушатель SQL-событий и хуков запроса в приложении: каждый запрос
+замеряется один раз, и результат идёт и в профиль, и в метрики Prometheus (metrics).
+
+Единица работы — HTTP-запрос (init_app) или явный блок `with profile("collector:TQBR")`:
+- считаем запросы и время в SQL (всегда — из них же метрики SQL на HTTP-запрос);
+- группируем по «форме» запроса (текст SQL с схлопнутыми списками плейсхолдеров):
+  одна форма, повторённая не меньше PROFILE["n1_threshold"] раз, — подозрение на N+1,
+  пишем предупреждение в лог;
+- запрос дольше PROFILE["slow_ms"] пишется в лог вместе с EXPLAIN QUERY PLAN.
+
+В dev-режиме (DEBUG или SQL_PROFILE_HEADERS=1) сводка запроса уходит
+в заголовки X-SQL-* и Server-Timing (видно во вкладке Network браузера),
+а также лежит в flask.g.sql_profile для шаблонов/тулбара.
+"""
+
+from __future__ import annotations
+import logging
+import re
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+
+from . import metrics
+
+log = logging.getLogger(__name__)
+slow_log = logging.getLogger(__name__ + ".slow")
+
+PROFILE: Dict[str, Any] = {
+    "enabled": True,
+    "slow_ms": 200.0,     # запрос дольше — в slow-лог с планом
+    "n1_threshold": 10,   # столько одинаковых форм за единицу работы — подозрение на N+1
+    "explain": True,      # EXPLAIN QUERY PLAN для медленных запросов
+}
+
+_IN_LIST = re.compile(r"\((?:\s*\?\s*,)+\s*\?\s*\)")
+_VALUES = re.compile(r"(\(\?\.\.\.\)|\(\s*\?\s*\))(?:\s*,\s*(?:\(\?\.\.\.\)|\(\s*\?\s*\)))+")
+_SPACES = re.compile(r"\s+")
+_EXPLAINABLE = ("select", "with", "update", "delete", "insert", "replace")
+
+
+def configure(enabled: bool | None = None, slow_ms: float | None = None,
+              n1_threshold: int | None = None, explain: bool | None = None) -> None:
+    if enabled is not None:
+        PROFILE["enabled"] = bool(enabled)
+    if slow_ms is not None:
+        PROFILE["slow_ms"] = float(slow_ms)
+    if n1_threshold is not None:
+        PROFILE["n1_threshold"] = max(2, int(n1_threshold))
+    if explain is not None:
+        PROFILE["explain"] = bool(explain)
+
+
+def statement_shape(statement: str) -> str:
+    """Форма запроса: IN (?, ?, ?) -> IN (?...), VALUES (?, ?), (?, ?) -> VALUES (?...), ...; пробелы схлопнуты."""
+    shape = _VALUES.sub(r"\1, ...", _IN_LIST.sub("(?...)", statement))
+    return _SPACES.sub(" ", shape).strip()
+
+
+class Profile:
+    """Сводка SQL одной единицы работы."""
+
+    __slots__ = ("name", "units", "statements", "seconds", "shapes", "slow", "started", "last_context")
+
+    def __init__(self, name: str, units: int = 1) -> None:
+        self.name = name
+        self.units = max(1, int(units))  # единиц работы в блоке (бордов в пачке): порог N+1 — на каждую
+        self.statements = 0
+        self.seconds = 0.0
+        self.shapes: Counter = Counter()
+        self.slow = 0
+        self.started = time.perf_counter()
+        self.last_context = None
+
+    def suspects(self, threshold: int | None = None) -> List[tuple]:
+        """[(форма, сколько раз)] для форм, повторённых не меньше threshold раз."""
+        threshold = (threshold or PROFILE["n1_threshold"]) * self.units
+        return [(shape, n) for shape, n in self.shapes.most_common() if n >= threshold]
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "statements": self.statements,
+            "distinct": len(self.shapes),
+            "sql_ms": round(self.seconds * 1000.0, 2),
+            "total_ms": round((time.perf_counter() - self.started) * 1000.0, 2),
+            "slow": self.slow,
+            "n_plus_one": [{"sql": shape[:300], "count": n} for shape, n in self.suspects()],
+        }
+
+
+_local = threading.local()
+
+
+def current() -> Optional[Profile]:
+    return getattr(_local, "profile", None)
+
+
+def start(name: str, units: int = 1) -> Profile:
+    profile = Profile(name, units)
+    _local.profile = profile
+    return profile
+
+
+def finish(profile: Profile) -> Dict[str, Any]:
+    """Закрыть единицу работы: предупреждение о N+1 и сводка."""
+    if current() is profile:
+        _local.profile = None
+    # С выключенным профилировщиком формы не собираются — suspects() пуст
+    for shape, n in profile.suspects():
+        log.warning("possible N+1 in %s: %d x %s", profile.name, n, shape[:300])
+    return profile.summary()
+
+
+@contextmanager
+def profile(name: str, units: int = 1) -> Iterator[Profile]:
+    """
+    Профиль блока кода вне HTTP-запроса (коллектор, скрипты). Вложенные блоки не поддерживаются.
+    units — сколько однотипных единиц работы в блоке: запрос на каждый борд пачки — не N+1.
+    """
+    outer = current()
+    p = start(name, units)
+    try:
+        yield p
+    finally:
+        finish(p)
+        _local.profile = outer
+
+
+# ---------- события движка ----------
+
+def _explain(cursor, statement: str, parameters: Any) -> List[str]:
+    if not statement.lstrip()[:7].lower().startswith(_EXPLAINABLE):
+        return []
+    try:
+        cur = cursor.connection.cursor()
+        try:
+            cur.execute("EXPLAIN QUERY PLAN " + statement, parameters or ())
+            return [row[-1] for row in cur.fetchall()]
+        finally:
+            cur.close()
+    except Exception as exc:  # план — только диагностика, запрос уже выполнен
+        return [f"<explain failed: {exc}>"]
+
+
+def attach(engine) -> None:
+    """
+    Подключить к движку (зовётся из db.make_engine) единственную пару слушателей SQL:
+    время запроса меряется один раз и идёт в metrics (гистограммы, блокировка записи) и в профиль.
+    """
+    from sqlalchemy import event
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info["sql_started"] = time.perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info.pop("sql_started", None)
+        if started is None:
+            return
+        elapsed = time.perf_counter() - started
+        metrics.observe_statement(conn.info, statement, elapsed)
+        p = current()
+        if p is not None:
+            p.statements += 1
+            p.seconds += elapsed
+        if not PROFILE["enabled"]:
+            return
+        # Пакетный INSERT (insertmanyvalues) — несколько вызовов курсора на одно execute():
+        # это не N+1, форму считаем один раз на контекст выполнения
+        if p is not None and (context is None or context is not p.last_context):
+            p.shapes[statement_shape(statement)] += 1
+            p.last_context = context
+        if elapsed * 1000.0 >= PROFILE["slow_ms"]:
+            if p is not None:
+                p.slow += 1
+            plan = [] if executemany or not PROFILE["explain"] else _explain(cursor, statement, parameters)
+            slow_log.warning(
+                "slow query %.1f ms%s: %s | params=%.200r%s",
+                elapsed * 1000.0, f" in {p.name}" if p is not None else "",
+                _SPACES.sub(" ", statement)[:1000], parameters,
+                "".join(f"\n  plan: {line}" for line in plan),
+            )
+
+    def _end(conn):
+        metrics.end_transaction(conn.info)
+
+    event.listen(engine, "commit", _end)
+    event.listen(engine, "rollback", _end)
+
+
+# ---------- Flask ----------
+
+def init_app(app) -> None:
+    """
+    Профиль на каждый HTTP-запрос (одна пара before/after_request на приложение): из него же
+    метрики запроса (латентность роута, число и время SQL), если METRICS_ENABLED;
+    в dev-режиме — сводка в заголовках ответа.
+    """
+    from flask import g, request
+
+    with_metrics = app.config.get("METRICS_ENABLED", True)
+
+    @app.before_request
+    def _profile_start():
+        g.sql_profile_obj = start(f"{request.method} {request.path}")
+
+    @app.after_request
+    def _profile_finish(response):
+        p = g.pop("sql_profile_obj", None)
+        if p is None:
+            return response
+        summary = g.sql_profile = finish(p)
+        if with_metrics:
+            endpoint = request.url_rule.rule if request.url_rule is not None else "unmatched"
+            metrics.observe_request(endpoint, request.method, str(response.status_code),
+                                    time.perf_counter() - p.started, p.statements, p.seconds)
+        if not PROFILE["enabled"]:
+            return response
+        # debug включается в app.run(), уже после create_app — проверяем на каждом запросе
+        if app.config.get("SQL_PROFILE_HEADERS") or app.debug:
+            response.headers["X-SQL-Count"] = str(summary["statements"])
+            response.headers["X-SQL-Time-ms"] = str(summary["sql_ms"])
+            if summary["n_plus_one"]:
+                worst = summary["n_plus_one"][0]
+                response.headers["X-SQL-N-Plus-One"] = f'{worst["count"]}x {worst["sql"][:120]}'
+            response.headers.add(
+                "Server-Timing", f'db;dur={summary["sql_ms"]};desc="{summary["statements"]} queries"'
+            )
+        return response
@@ -4,11 +4,62 @@
 """
 
 from __future__ import annotations
+import json
+import os
+import threading
+import time
 from datetime import datetime
-from sqlalchemy import select, desc, func
-from sqlalchemy.orm import Session
+from sqlalchemy import Table, and_, select, desc, func, insert, delete, update, event, text, union_all
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session, aliased
+from . import metrics, partitions
 from .db import SessionLocal
-from .models import Engine, Market, Board, Security, Snapshot, SnapshotItem
+from .models import Engine, Market, Board, Security, Snapshot
+from .snapshot_cache import timeline, tiles_lru
+from .snapshot_storage import STORAGE, content_hash, item_values, plan_delta
+from .snapshot_stats import STATS_VERSION, compute_stats
+
+# Сколько строк отправляем одним multi-row INSERT / IN (...) — с запасом
+# под лимит SQLite на число bind-параметров.
+_CHUNK = 400
+
+# Процессный кэш secid -> (security_id, shortname), отдельно для каждой БД (по URL).
+# Новые записи сначала копятся в session.info и попадают сюда только после commit,
+# чтобы откат транзакции не оставил в кэше несуществующих id.
+_SECURITY_IDS: dict[str, dict[str, tuple[int, str | None]]] = {}
+_SECURITY_IDS_LOCK = threading.Lock()
+_PENDING_KEY = "moex_pending_security_ids"
+# Снимки, записанные в текущей транзакции: после commit уходят в таймлайн
+_NEW_SNAPSHOTS_KEY = "moex_new_snapshots"
+
+
+def _chunks(seq: list, size: int = _CHUNK):
+    for i in range(0, len(seq), size):
+        yield seq[i:i + size]
+
+
+@event.listens_for(Session, "after_commit")
+def _promote_security_ids(session: Session) -> None:
+    for db_key, board_code, snapshot_id, created_at in session.info.pop(_NEW_SNAPSHOTS_KEY, ()):
+        timeline.note(db_key, board_code, snapshot_id, created_at)
+    pending = session.info.pop(_PENDING_KEY, None)
+    if not pending:
+        return
+    with _SECURITY_IDS_LOCK:
+        for db_key, ids in pending.items():
+            _SECURITY_IDS.setdefault(db_key, {}).update(ids)
+
+
+@event.listens_for(Session, "after_rollback")
+def _drop_pending_security_ids(session: Session) -> None:
+    session.info.pop(_PENDING_KEY, None)
+    session.info.pop(_NEW_SNAPSHOTS_KEY, None)
+
+
+def reset_security_cache() -> None:
+    """Сбрасывает процессный кэш secid -> id (например, после пересоздания БД)."""
+    with _SECURITY_IDS_LOCK:
+        _SECURITY_IDS.clear()
 
 
 class MoexRepository:
@@ -63,25 +114,658 @@ class MoexRepository:
     # -------- работа со снимками --------
 
     def create_snapshot(self, board: Board, created_at: datetime | None = None) -> Snapshot:
-        snap = Snapshot(board_id=board.id, created_at=created_at or datetime.utcnow())
+        created_at = created_at or datetime.utcnow()
+        snap = Snapshot(board_id=board.id, created_at=created_at,
+                        part=partitions.partition_name(board.id, board.code, created_at))
+        partitions.ensure_table(self.session, snap.part)
         self.session.add(snap)
         self.session.flush()
         return snap
 
-    def add_items(self, snapshot: Snapshot, items: list[dict]) -> None:
+    @staticmethod
+    def _items(part: str | None) -> Table:
+        """Таблица строк снимка: его партиция или общая snapshot_items (снимки старых версий)."""
+        return partitions.item_table(part or partitions.LEGACY)
+
+    def add_items(self, snapshot: Snapshot, items: list[dict], keyframe_id: int | None = None,
+                  previous_id: int | None = None) -> dict:
         """
         items: [{secid, shortname, last, base_price, change, valtoday}, ...]
+
+        Пакетная запись: все secid резолвятся одним запросом (плюс процессный кэш),
+        новые бумаги и строки снимка вставляются multi-row INSERT'ами.
+        keyframe_id — попробовать записать снимок дельтой к этому ключевому кадру
+        (см. snapshot_storage.plan_delta), previous_id — предыдущий снимок борда;
+        если дельта невыгодна, пишется полный кадр.
+        Возвращает статистику: {"items", "stored_items", "kind", "securities_new",
+        "securities_updated", "elapsed_ms"}.
+        """
+        started = time.perf_counter()
+
+        # Дубликаты secid в одном снимке нарушили бы uq_item_snapshot_security — берём последний
+        by_secid = {it["secid"]: it for it in items if it.get("secid")}
+        ids, created, updated = self._resolve_security_ids(
+            {secid: it.get("shortname") for secid, it in by_secid.items()}
+        )
+
+        current = {ids[secid]: item_values(it) for secid, it in by_secid.items()}
+        stored = list(current)
+        if keyframe_id is not None:
+            # Кадр всегда в той же партиции, что и новый снимок (см. _current_keyframe)
+            keyframe = self._snapshot_values(keyframe_id, snapshot.part)
+            previous = None
+            if previous_id is not None:
+                previous = keyframe if previous_id == keyframe_id else self._snapshot_full_values(previous_id)
+            changed = plan_delta(keyframe, current, previous)
+            if changed is not None:
+                snapshot.kind, snapshot.base_id = "delta", keyframe_id
+                stored = changed
+        snapshot.items_count = len(current)
+
+        rows = [
+            {
+                "snapshot_id": snapshot.id,
+                "security_id": sid,
+                "last": current[sid][0],
+                "base_price": current[sid][1],
+                "change_pct": current[sid][2],
+                "valtoday": current[sid][3],
+            }
+            for sid in stored
+        ]
+        if rows:
+            # Core-insert в таблицу партиции: одинаковый набор ключей — один executemany на снимок
+            self.session.execute(insert(self._items(snapshot.part)), rows)
+
+        return {
+            "items": len(current),
+            "stored_items": len(rows),
+            "kind": snapshot.kind or "full",
+            "securities_new": created,
+            "securities_updated": updated,
+            "elapsed_ms": round((time.perf_counter() - started) * 1000.0, 3),
+        }
+
+    def save_snapshot(
+        self,
+        engine: str,
+        market: str,
+        board: str,
+        items: list[dict],
+        created_at: datetime | None = None,
+        titles: dict | None = None,
+    ) -> dict:
+        """
+        Справочники (engine/market/board) + снимок + пакетная вставка строк.
+        Снимок, совпадающий по содержимому с предыдущим, не пишется (STORAGE["dedup"]) —
+        тогда в ответе "skipped": True и id предыдущего снимка.
+        В режиме STORAGE["mode"] == "delta" пишется дельтой к текущему ключевому кадру.
+        Коммит остаётся за вызывающим кодом. Возвращает статистику add_items
+        с добавленными "board", "snapshot_id" и "skipped".
+        """
+        started = time.perf_counter()
+        brd = self._resolve_board(engine, market, board, titles)
+        prev = self.session.execute(
+            select(Snapshot.id, Snapshot.kind, Snapshot.base_id, Snapshot.content_hash, Snapshot.part)
+            .where(Snapshot.board_id == brd.id)
+            .order_by(desc(Snapshot.created_at))
+            .limit(1)
+        ).first()
+        return self._save_board_snapshot(brd, items, created_at, prev, started)
+
+    def save_snapshots(self, batch: list[tuple[dict, list[dict]]], created_at: datetime | None = None) -> list[dict]:
+        """
+        Пачка снимков разных бордов (массовый коллектор): [({engine, market, board}, items), ...].
+        Борды и предыдущие снимки всей пачки читаются двумя запросами, а не по три-четыре
+        на борд; дальше — как save_snapshot. Коммит остаётся за вызывающим кодом.
+        """
+        started = time.perf_counter()
+        codes = [spec["board"] for spec, _ in batch]
+        boards = {
+            (eng_code, mkt_code, brd.code): brd
+            for brd, mkt_code, eng_code in self.session.execute(
+                select(Board, Market.code, Engine.code)
+                .join(Market, Board.market_id == Market.id)
+                .join(Engine, Market.engine_id == Engine.id)
+                .where(Board.code.in_(codes))
+            )
+        }
+        resolved = [
+            boards.get((spec["engine"], spec["market"], spec["board"]))
+            or self._resolve_board(spec["engine"], spec["market"], spec["board"])
+            for spec, _ in batch
+        ]
+        # Последний снимок каждого борда — коррелированный LIMIT 1 по индексу (board_id, created_at)
+        latest = (
+            select(Snapshot.id).where(Snapshot.board_id == Board.id)
+            .order_by(desc(Snapshot.created_at)).limit(1)
+            .correlate(Board).scalar_subquery()
+        )
+        prev_by_board = {
+            row.board_id: row
+            for row in self.session.execute(
+                select(Snapshot.id, Snapshot.board_id, Snapshot.kind, Snapshot.base_id, Snapshot.content_hash,
+                       Snapshot.part)
+                .where(Snapshot.id.in_(select(latest).where(Board.id.in_([b.id for b in resolved]))))
+            )
+        }
+        out = []
+        for brd, (_, items) in zip(resolved, batch):
+            out.append(self._save_board_snapshot(brd, items, created_at, prev_by_board.get(brd.id), started))
+            started = time.perf_counter()
+        return out
+
+    def _resolve_board(self, engine: str, market: str, board: str, titles: dict | None = None) -> Board:
+        titles = titles or {}
+        eng = self._get_or_create_engine(engine, titles.get("engine", engine.title()))
+        mkt = self._get_or_create_market(eng, market, titles.get("market", market.title()))
+        return self._get_or_create_board(mkt, board, titles.get("board", board))
+
+    def _save_board_snapshot(self, brd: Board, items: list[dict], created_at: datetime | None, prev,
+                             started: float) -> dict:
+        board = brd.code
+        by_secid = {it["secid"]: it for it in items if it.get("secid")}
+        digest = content_hash((secid, item_values(it)) for secid, it in by_secid.items())
+        if STORAGE["dedup"] and prev is not None and prev.content_hash == digest:
+            metrics.snapshots_skipped_total.inc(board)
+            return {
+                "board": board, "snapshot_id": prev.id, "skipped": True,
+                "items": len(by_secid), "stored_items": 0, "kind": None,
+                "securities_new": 0, "securities_updated": 0,
+                "elapsed_ms": round((time.perf_counter() - started) * 1000.0, 3),
+            }
+
+        snap = self.create_snapshot(brd, created_at=created_at)
+        snap.content_hash = digest
+        snap.stats_json = json.dumps(compute_stats(by_secid.values(), STORAGE["top_k"]),
+                                     ensure_ascii=False, separators=(",", ":"))
+        keyframe_id = self._current_keyframe(prev, snap.part) if STORAGE["mode"] == "delta" else None
+        stats = self.add_items(snap, items, keyframe_id=keyframe_id,
+                               previous_id=prev.id if prev is not None else None)
+        self.session.info.setdefault(_NEW_SNAPSHOTS_KEY, []).append(
+            (self._db_key(), board, snap.id, snap.created_at)
+        )
+        metrics.snapshot_items.observe(len(by_secid), board, "all")
+        metrics.snapshot_items.observe(stats["stored_items"], board, "stored")
+        metrics.snapshot_write_seconds.observe(time.perf_counter() - started, board)
+        return {"board": board, "snapshot_id": snap.id, "skipped": False, **stats}
+
+    # -------- ключевые кадры / дельты --------
+
+    def _current_keyframe(self, prev, part: str | None) -> int | None:
+        """
+        Кадр, к которому писать следующую дельту, или None — пора писать новый кадр.
+        Первый снимок новой партиции — всегда кадр: партиция не зависит от соседних.
+        """
+        if prev is None or prev.part != part:
+            return None
+        keyframe_id = prev.id if prev.kind != "delta" else prev.base_id
+        deltas = self.session.scalar(
+            select(func.count(Snapshot.id)).where(Snapshot.base_id == keyframe_id)
+        ) or 0
+        return keyframe_id if deltas + 1 < STORAGE["keyframe_every"] else None
+
+    def _snapshot_values(self, snapshot_id: int, part: str | None) -> dict[int, tuple]:
+        """Хранимые строки снимка из его партиции: {security_id: (last, base_price, change_pct, valtoday)}."""
+        t = self._items(part)
+        q = select(t.c.security_id, t.c.last, t.c.base_price, t.c.change_pct, t.c.valtoday).where(
+            t.c.snapshot_id == snapshot_id)
+        return {sid: (last, base, change, val) for sid, last, base, change, val in self.session.execute(q)}
+
+    def _snapshot_full_values(self, snapshot_id: int) -> dict[int, tuple]:
+        """Как _snapshot_values, но для дельты — уже наложенной на свой ключевой кадр."""
+        base = aliased(Snapshot)
+        meta = self.session.execute(
+            select(Snapshot.part, base.id, base.part)
+            .outerjoin(base, and_(Snapshot.kind == "delta", base.id == Snapshot.base_id))
+            .where(Snapshot.id == snapshot_id)
+        ).first()
+        if meta is None:
+            return {}
+        part, base_id, base_part = meta
+        values = self._snapshot_values(snapshot_id, part)
+        if not base_id:
+            return values
+        return {**self._snapshot_values(base_id, base_part), **values}
+
+    # -------- пакетный резолв бумаг --------
+
+    def _db_key(self) -> str:
+        return str(self.session.get_bind().url)
+
+    def _resolve_security_ids(self, wanted: dict[str, str | None]) -> tuple[dict[str, int], int, int]:
+        """
+        wanted: {secid: shortname}. Возвращает ({secid: security_id}, создано, обновлено).
+        Неизвестные secid ищутся одним SELECT ... IN, отсутствующие/переименованные
+        бумаги пишутся одним upsert'ом.
+        """
+        db_key = self._db_key()
+        pending = self.session.info.setdefault(_PENDING_KEY, {}).setdefault(db_key, {})
+        with _SECURITY_IDS_LOCK:
+            known = dict(_SECURITY_IDS.get(db_key, {}))
+        known.update(pending)
+
+        missing = [secid for secid in wanted if secid not in known]
+        for part in _chunks(missing):
+            for sec_id, secid, shortname in self.session.execute(
+                select(Security.id, Security.secid, Security.shortname).where(Security.secid.in_(part))
+            ):
+                known[secid] = pending[secid] = (sec_id, shortname)
+
+        # Новые бумаги и бумаги со сменившимся shortname (пустой shortname не затирает старый)
+        upsert = [
+            {"secid": secid, "shortname": shortname}
+            for secid, shortname in wanted.items()
+            if secid not in known or (shortname and known[secid][1] != shortname)
+        ]
+        created = sum(1 for row in upsert if row["secid"] not in known)
+        if upsert:
+            for part in _chunks(upsert):
+                stmt = sqlite_insert(Security).values(part)
+                stmt = stmt.on_conflict_do_update(
+                    index_elements=[Security.secid],
+                    set_={"shortname": func.coalesce(stmt.excluded.shortname, Security.shortname)},
+                )
+                self.session.execute(stmt)
+            fresh = [row["secid"] for row in upsert]
+            for part in _chunks(fresh):
+                for sec_id, secid, shortname in self.session.execute(
+                    select(Security.id, Security.secid, Security.shortname).where(Security.secid.in_(part))
+                ):
+                    known[secid] = pending[secid] = (sec_id, shortname)
+
+        return {secid: known[secid][0] for secid in wanted}, created, len(upsert) - created
+
+    # -------- миграция существующих снимков в keyframe + delta --------
+
+    def compact_board(self, board_code: str, delta: bool = True, dedup: bool = True,
+                      commit_every: int = 50) -> dict:
+        """
+        Перекодирует уже записанные полные снимки борда: одинаковые подряд удаляет (dedup),
+        остальные превращает в дельты к ключевым кадрам (delta), по тем же правилам,
+        что и запись (snapshot_storage). Снимки, на которые уже ссылаются дельты, не трогаются.
+        Коммитит пачками. Возвращает статистику по борду.
+        """
+        board_id = self._board_id(board_code)
+        stats = {"board": board_code, "snapshots": 0, "deduplicated": 0, "to_delta": 0,
+                 "keyframes": 0, "items_deleted": 0}
+        if board_id is None:
+            return stats
+
+        snaps = self.session.execute(
+            select(Snapshot.id, Snapshot.kind, Snapshot.content_hash, Snapshot.part)
+            .where(Snapshot.board_id == board_id)
+            .order_by(Snapshot.created_at)
+        ).all()
+        with_dependents = set(self.session.scalars(
+            select(Snapshot.base_id).where(Snapshot.base_id.is_not(None)).distinct()
+        ))
+        keyframe_id, keyframe_values, keyframe_part, deltas_since, prev_hash = None, None, None, 0, None
+        prev_values = None
+        removed: list[int] = []
+        evicted_since_commit = False
+
+        for n, snap in enumerate(snaps, 1):
+            stats["snapshots"] += 1
+            if snap.kind == "delta":
+                prev_hash, prev_values = snap.content_hash, self._snapshot_full_values(snap.id)
+                continue
+            t = self._items(snap.part)
+            rows = self.session.execute(
+                select(t.c.security_id, Security.secid, t.c.last, t.c.base_price, t.c.change_pct, t.c.valtoday)
+                .join(Security, t.c.security_id == Security.id)
+                .where(t.c.snapshot_id == snap.id)
+            ).all()
+            values = {r[0]: tuple(r[2:]) for r in rows}
+            digest = snap.content_hash or content_hash((r[1], tuple(r[2:])) for r in rows)
+            pinned = snap.id in with_dependents
+
+            if dedup and digest == prev_hash and not pinned:
+                self.session.execute(delete(t).where(t.c.snapshot_id == snap.id))
+                self.session.execute(delete(Snapshot).where(Snapshot.id == snap.id))
+                stats["deduplicated"] += 1
+                stats["items_deleted"] += len(values)
+                removed.append(snap.id)
+                evicted_since_commit = True
+                continue
+
+            changed = None
+            if (delta and not pinned and keyframe_values is not None and keyframe_part == snap.part
+                    and deltas_since + 1 < STORAGE["keyframe_every"]):
+                changed = plan_delta(keyframe_values, values, prev_values)
+            prev_hash, prev_values = digest, values
+            if changed is not None:
+                changed_set = set(changed)
+                unchanged = [sid for sid in values if sid not in changed_set]
+                for part in _chunks(unchanged):
+                    self.session.execute(delete(t).where(t.c.snapshot_id == snap.id, t.c.security_id.in_(part)))
+                self.session.execute(update(Snapshot).where(Snapshot.id == snap.id).values(
+                    kind="delta", base_id=keyframe_id, content_hash=digest, items_count=len(values)))
+                stats["to_delta"] += 1
+                stats["items_deleted"] += len(unchanged)
+                deltas_since += 1
+            else:
+                self.session.execute(update(Snapshot).where(Snapshot.id == snap.id).values(
+                    content_hash=digest, items_count=len(values)))
+                keyframe_id, keyframe_values, keyframe_part, deltas_since = snap.id, values, snap.part, 0
+                stats["keyframes"] += 1
+
+            if n % commit_every == 0:
+                if evicted_since_commit:
+                    self._bump_evict_gen(board_id)
+                    evicted_since_commit = False
+                self.session.commit()
+        if evicted_since_commit:
+            self._bump_evict_gen(board_id)
+        self.session.commit()
+
+        db_key = self._db_key()
+        timeline.invalidate(db_key, board_code)
+        tiles_lru.discard(db_key, removed)
+        return stats
+
+    # -------- агрегаты снимков --------
+
+    def get_snapshot_stats(self, snapshot_id: int | None, top_k: int | None = None) -> dict | None:
+        """
+        Агрегаты снимка (см. snapshot_stats.compute_stats) с добавленными snapshot_id/created_at.
+        Читается одна колонка stats_json; если агрегатов нет (старый снимок), они устарели
+        или нужно больше лидеров, чем сохранено, — считаем по плиткам снимка.
+        """
+        if not snapshot_id:
+            return None
+        row = self.session.execute(
+            select(Snapshot.created_at, Snapshot.stats_json).where(Snapshot.id == snapshot_id)
+        ).first()
+        if row is None:
+            return None
+        stats = json.loads(row.stats_json) if row.stats_json else None
+        if stats is None or stats.get("v") != STATS_VERSION or (top_k is not None and top_k > stats["top_k"]):
+            stats = compute_stats(self.get_tiles_for_snapshot_id(snapshot_id, limit=None),
+                                  max(top_k or 0, STORAGE["top_k"]))
+        return {"snapshot_id": snapshot_id, "created_at": row.created_at, **stats}
+
+    def backfill_stats(self, board_code: str, commit_every: int = 200) -> int:
+        """Досчитывает stats_json для снимков, записанных до появления агрегатов. Возвращает число снимков."""
+        board_id = self._board_id(board_code)
+        if board_id is None:
+            return 0
+        ids = list(self.session.scalars(
+            select(Snapshot.id).where(Snapshot.board_id == board_id, Snapshot.stats_json.is_(None))
+        ))
+        for n, snapshot_id in enumerate(ids, 1):
+            stats = compute_stats(self._load_snapshot_tiles(snapshot_id) or [], STORAGE["top_k"])
+            self.session.execute(update(Snapshot).where(Snapshot.id == snapshot_id).values(
+                stats_json=json.dumps(stats, ensure_ascii=False, separators=(",", ":"))))
+            if n % commit_every == 0:
+                self.session.commit()
+        self.session.commit()
+        return len(ids)
+
+    # -------- retention: удаление снимков с архивированием --------
+
+    def snapshot_index(self, board_code: str) -> list[tuple[int, datetime]]:
+        """Все снимки борда (id, created_at) по возрастанию времени — для плана retention."""
+        board_id = self._board_id(board_code)
+        if board_id is None:
+            return []
+        return [tuple(r) for r in self.session.execute(
+            select(Snapshot.id, Snapshot.created_at)
+            .where(Snapshot.board_id == board_id)
+            .order_by(Snapshot.created_at)
+        )]
+
+    def _securities_by_id(self, security_ids) -> dict[int, tuple[str, str | None]]:
+        found: dict[int, tuple[str, str | None]] = {}
+        for part in _chunks(list(security_ids)):
+            for sid, secid, shortname in self.session.execute(
+                select(Security.id, Security.secid, Security.shortname).where(Security.id.in_(part))
+            ):
+                found[sid] = (secid, shortname)
+        return found
+
+    def evict_snapshots(self, board_code: str, evict_ids, archive=None, pause: float = 0.0) -> dict:
+        """
+        Удаляет снимки борда из evict_ids. archive(board_code, [(snapshot_id, created_at, rows), ...]),
+        если задан, получает полные строки удаляемых снимков группы
+        [(secid, shortname, last, base_price, change, valtoday)] ДО удаления. Если удаляется ключевой кадр, оставшиеся его дельты сначала перекодируются:
+        первая становится новым кадром, остальные — дельтами к нему.
+        Коммит после каждой группы «кадр + его дельты», между группами — pause сек:
+        писатели (коллектор) не ждут блокировку дольше одной группы.
+        """
+        evict = set(evict_ids)
+        stats = {"board": board_code, "evicted": 0, "rebased": 0, "items_deleted": 0}
+        if not evict:
+            return stats
+        cols = (Snapshot.id, Snapshot.created_at, Snapshot.kind, Snapshot.base_id, Snapshot.part)
+        snaps = []
+        for part in _chunks(sorted(evict)):
+            snaps.extend(self.session.execute(select(*cols).where(Snapshot.id.in_(part))).all())
+        snaps.sort(key=lambda r: r.created_at)
+        board_id = self._board_id(board_code)
+
+        done: set[int] = set()
+        for snap in snaps:
+            if snap.id in done:
+                continue
+            group = [snap]
+            if snap.kind != "delta":
+                group += self.session.execute(
+                    select(*cols).where(Snapshot.base_id == snap.id).order_by(Snapshot.created_at)
+                ).all()
+            # Полные значения всей группы — до любых изменений
+            full = {g.id: self._snapshot_full_values(g.id) for g in group}
+            evicted = [g for g in group if g.id in evict]
+            kept = [g for g in group if g.id not in evict]
+
+            if archive is not None and evicted:
+                names = self._securities_by_id({sid for g in evicted for sid in full[g.id]})
+                archive(board_code, [
+                    (g.id, g.created_at, [(*names[sid], *values) for sid, values in full[g.id].items()])
+                    for g in evicted
+                ])
+            if snap.kind != "delta" and kept:
+                self._rebase(kept, full)
+                stats["rebased"] += len(kept)
+            # Сначала дельты, потом их кадр (base_id ссылается на кадр)
+            for g in reversed(evicted):
+                t = self._items(g.part)
+                stats["items_deleted"] += self.session.execute(delete(t).where(t.c.snapshot_id == g.id)).rowcount
+                self.session.execute(delete(Snapshot).where(Snapshot.id == g.id))
+                done.add(g.id)
+            stats["evicted"] += len(evicted)
+            if evicted:
+                self._bump_evict_gen(board_id)
+            self.session.commit()
+            if pause:
+                time.sleep(pause)
+
+        db_key = self._db_key()
+        timeline.invalidate(db_key, board_code)
+        tiles_lru.discard(db_key, done)
+        return stats
+
+    def _rebase(self, kept, full: dict[int, dict[int, tuple]]) -> None:
+        """Перезаписывает оставшиеся снимки группы: новый ключевой кадр + дельты к нему."""
+        keyframe_id, prev, since = None, None, 0
+        for g in kept:
+            values = full[g.id]
+            changed = None
+            if keyframe_id is not None and since + 1 < STORAGE["keyframe_every"]:
+                changed = plan_delta(full[keyframe_id], values, prev)
+            t = self._items(g.part)  # кадр и его дельты — в одной партиции
+            self.session.execute(delete(t).where(t.c.snapshot_id == g.id))
+            if changed is None:
+                stored = list(values)
+                self.session.execute(update(Snapshot).where(Snapshot.id == g.id).values(kind="full", base_id=None))
+                keyframe_id, since = g.id, 0
+            else:
+                stored = changed
+                self.session.execute(update(Snapshot).where(Snapshot.id == g.id).values(kind="delta", base_id=keyframe_id))
+                since += 1
+            rows = [
+                {"snapshot_id": g.id, "security_id": sid, "last": values[sid][0], "base_price": values[sid][1],
+                 "change_pct": values[sid][2], "valtoday": values[sid][3]}
+                for sid in stored
+            ]
+            if rows:
+                self.session.execute(insert(t), rows)
+            prev = values
+
+    # -------- партиции строк снимков --------
+
+    def list_partitions(self) -> list[dict]:
+        """Таблицы строк снимков: [{"name", "board", "period", "snapshots", "first", "last"}] по борду и времени."""
+        codes = dict(self.session.execute(select(Board.id, Board.code)).all())
+        usage = {
+            part or partitions.LEGACY: (n, first, last)
+            for part, n, first, last in self.session.execute(
+                select(Snapshot.part, func.count(Snapshot.id), func.min(Snapshot.created_at),
+                       func.max(Snapshot.created_at)).group_by(Snapshot.part)
+            )
+        }
+        out = []
+        for name in partitions.existing(self.session):
+            board_id, period = partitions.parse_name(name) or (None, None)
+            n, first, last = usage.get(name, (0, None, None))
+            out.append({"name": name, "board": codes.get(board_id), "period": period,
+                        "snapshots": n, "first": first, "last": last})
+        return sorted(out, key=lambda p: (p["board"] or "", p["period"] or ""))
+
+    def migrate_legacy_items(self, board_code: str) -> dict:
         """
-        for it in items:
-            sec = self._get_or_create_security(it["secid"], it.get("shortname"))
-            self.session.add(SnapshotItem(
-                snapshot_id=snapshot.id,
-                security_id=sec.id,
-                last=it.get("last"),
-                base_price=it.get("base_price"),
-                change_pct=it.get("change"),
-                valtoday=it.get("valtoday"),
-            ))
+        Переносит строки снимков борда из общей snapshot_items (старые версии) в партиции:
+        INSERT ... SELECT пачками снимков, коммит на каждую партицию. Дельта, чей кадр попал
+        в другую партицию, сначала разворачивается в полный кадр — партиции остаются независимыми.
+        """
+        stats = {"board": board_code, "snapshots": 0, "partitions": 0, "materialized": 0}
+        board_id = self._board_id(board_code)
+        if board_id is None or partitions.LEGACY not in partitions.existing(self.session):
+            return stats
+        legacy = self._items(None)
+        snaps = self.session.execute(
+            select(Snapshot.id, Snapshot.created_at, Snapshot.kind, Snapshot.base_id)
+            .where(Snapshot.board_id == board_id, Snapshot.part.is_(None))
+            .order_by(Snapshot.created_at)
+        ).all()
+        groups: dict[str, list] = {}
+        for snap in snaps:
+            groups.setdefault(partitions.partition_name(board_id, board_code, snap.created_at), []).append(snap)
+
+        cols = ["snapshot_id", "security_id", "last", "base_price", "change_pct", "valtoday"]
+        for name, group in groups.items():
+            ids = {g.id for g in group}
+            for g in group:
+                if g.kind == "delta" and g.base_id not in ids:
+                    values = self._snapshot_full_values(g.id)
+                    self.session.execute(delete(legacy).where(legacy.c.snapshot_id == g.id))
+                    self.session.execute(insert(legacy), [
+                        {"snapshot_id": g.id, "security_id": sid, "last": v[0], "base_price": v[1],
+                         "change_pct": v[2], "valtoday": v[3]} for sid, v in values.items()
+                    ])
+                    self.session.execute(update(Snapshot).where(Snapshot.id == g.id).values(kind="full", base_id=None))
+                    stats["materialized"] += 1
+            target = partitions.ensure_table(self.session, name)
+            for part in _chunks(sorted(ids)):
+                self.session.execute(insert(target).from_select(
+                    cols, select(*(legacy.c[c] for c in cols)).where(legacy.c.snapshot_id.in_(part)).order_by(legacy.c.id)))
+                self.session.execute(update(Snapshot).where(Snapshot.id.in_(part)).values(part=name))
+                self.session.execute(delete(legacy).where(legacy.c.snapshot_id.in_(part)))
+            self.session.commit()
+            stats["snapshots"] += len(group)
+            stats["partitions"] += 1
+
+        db_key = self._db_key()
+        timeline.invalidate(db_key, board_code)
+        tiles_lru.discard(db_key, [s.id for s in snaps])
+        return stats
+
+    def drop_legacy_items(self) -> bool:
+        """Удаляет общую snapshot_items, если в ней не осталось строк (после migrate_legacy_items по всем бордам)."""
+        if partitions.LEGACY not in partitions.existing(self.session):
+            return False
+        legacy = self._items(None)
+        if self.session.execute(select(legacy.c.id).limit(1)).first() is not None:
+            return False
+        self.session.execute(text(f'DROP TABLE "{partitions.LEGACY}"'))
+        self.session.commit()
+        return True
+
+    def detach_partition(self, name: str, archive_path: str | None = None) -> dict:
+        """
+        Отцепляет партицию целиком: её снимки удаляются из snapshots (короткая таблица),
+        строки — одним DROP TABLE, без построчного DELETE по индексам. С archive_path партиция,
+        её снимки и бумаги сначала копируются в отдельный файл SQLite (CREATE TABLE AS SELECT
+        через ATTACH) — его можно открыть любым клиентом SQLite. Текущую партицию борда
+        отцепить нельзя: ту, где лежит последний снимок борда (по БД — не зависит от того,
+        с какой схемой партиций запущен процесс), и ту, куда по настройкам пишется следующий.
+        """
+        parsed = partitions.parse_name(name)
+        if parsed is None or name not in partitions.existing(self.session):
+            raise ValueError(f"no such partition: {name}")
+        board_id, period = parsed
+        board_code = self.session.scalar(select(Board.code).where(Board.id == board_id))
+        latest_part = self.session.scalar(
+            select(Snapshot.part).where(Snapshot.board_id == board_id)
+            .order_by(desc(Snapshot.created_at), desc(Snapshot.id)).limit(1))
+        if latest_part == name:
+            raise ValueError(f"{name} holds the latest snapshot of {board_code or board_id}")
+        if board_code and name == partitions.partition_name(board_id, board_code, datetime.utcnow()):
+            raise ValueError(f"{name} is the current partition of {board_code}")
+        in_part = select(Snapshot.id).where(Snapshot.part == name)
+        dependents = self.session.scalar(select(func.count(Snapshot.id)).where(
+            Snapshot.base_id.in_(in_part), func.coalesce(Snapshot.part, "") != name))
+        if dependents:
+            raise ValueError(f"{dependents} snapshots outside {name} are deltas to its keyframes")
+
+        ids = list(self.session.scalars(in_part))
+        if archive_path:
+            self._archive_partition(name, archive_path)
+        self.session.execute(delete(Snapshot).where(Snapshot.part == name))
+        self.session.execute(text(f'DROP TABLE "{name}"'))
+        self._bump_evict_gen(board_id)
+        self.session.commit()
+
+        db_key = self._db_key()
+        partitions.forget(db_key, name)
+        if board_code:
+            timeline.invalidate(db_key, board_code)
+        tiles_lru.discard(db_key, ids)
+        return {"partition": name, "board": board_code, "period": period, "snapshots": len(ids),
+                "archive": archive_path}
+
+    def _bump_evict_gen(self, board_id: int | None) -> None:
+        """
+        Снимки борда удалены — поколение +1 в той же транзакции. По нему другие процессы
+        (веб при отдельном коллекторе/retention) узнают, что их таймлайн и LRU устарели.
+        """
+        if board_id is not None:
+            self.session.execute(update(Board).where(Board.id == board_id).values(evict_gen=Board.evict_gen + 1))
+
+    def _archive_partition(self, name: str, path: str) -> None:
+        """Копия партиции в отдельный файл: snapshot_items, snapshots (с кодом борда) и нужные securities."""
+        if os.path.exists(path):
+            raise ValueError(f"archive already exists: {path}")
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        # ATTACH нельзя внутри транзакции — отдельное соединение в autocommit, копия — своей транзакцией
+        with self.session.get_bind().connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+            conn.exec_driver_sql("ATTACH DATABASE ? AS archive", (path,))
+            try:
+                conn.exec_driver_sql("BEGIN")
+                conn.exec_driver_sql(f'CREATE TABLE archive.snapshot_items AS SELECT * FROM main."{name}" ORDER BY id')
+                conn.exec_driver_sql(
+                    "CREATE TABLE archive.snapshots AS SELECT s.*, b.code AS board FROM main.snapshots s "
+                    "JOIN main.boards b ON b.id = s.board_id WHERE s.part = ? ORDER BY s.created_at", (name,))
+                conn.exec_driver_sql(
+                    "CREATE TABLE archive.securities AS SELECT * FROM main.securities "
+                    f'WHERE id IN (SELECT DISTINCT security_id FROM main."{name}")')
+                conn.exec_driver_sql("CREATE INDEX archive.ix_items_snapshot ON snapshot_items (snapshot_id)")
+                conn.exec_driver_sql("COMMIT")
+            except Exception:
+                conn.exec_driver_sql("ROLLBACK")
+                raise
+            finally:
+                conn.exec_driver_sql("DETACH DATABASE archive")
 
     # -------- выборки для сайта / API --------
 
@@ -98,33 +782,266 @@ class MoexRepository:
     def get_tiles_for_snapshot(self, snapshot: Snapshot | None, limit: int = 400):
         if not snapshot:
             return []
-        rows = (
-            self.session.query(SnapshotItem, Security)
-            .join(Security, SnapshotItem.security_id == Security.id)
-            .filter(SnapshotItem.snapshot_id == snapshot.id)
-            .limit(limit).all()
+        return self.get_tiles_for_snapshot_id(snapshot.id, limit=limit)
+
+    # -------- time-travel через кэши (snapshot_cache) --------
+
+    def find_snapshot_id(self, board_code: str, at_utc: datetime | None) -> int | None:
+        """Как get_snapshot_by_time, но через in-memory таймлайн: для истории — без запросов к БД."""
+        return timeline.find(self._db_key(), board_code, at_utc, self._board_id, self._snapshot_times_after,
+                             self._evict_gen)
+
+    def eviction_gen(self, board_code: str) -> int:
+        """Поколение удалений снимков борда (для ETag): из таймлайна, если он уже прочитан, иначе из БД."""
+        gen = timeline.generation(self._db_key(), board_code)
+        if gen is None:
+            gen = self.session.scalar(select(Board.evict_gen).where(Board.code == board_code))
+        return gen or 0
+
+    def get_tiles_for_snapshot_id(self, snapshot_id: int | None, limit: int = 400) -> list[dict]:
+        """Плитки снимка по id; декодированный снимок кэшируется в LRU целиком."""
+        if not snapshot_id:
+            return []
+        db_key = self._db_key()
+        tiles = tiles_lru.get(db_key, snapshot_id)
+        if tiles is None:
+            tiles = self._load_snapshot_tiles(snapshot_id)
+            if tiles is None:
+                return []  # снимка нет (удалён retention/detach) — пустой ответ в LRU не кладём
+            tiles_lru.put(db_key, snapshot_id, tiles)
+        return tiles[:limit] if limit is not None else tiles
+
+    def _load_snapshot_tiles(self, snapshot_id: int) -> list[dict] | None:
+        meta = self.session.execute(
+            select(Snapshot.kind, Snapshot.base_id, Snapshot.part).where(Snapshot.id == snapshot_id)
+        ).first()
+        if meta is None:
+            return None
+        # Кортежи вместо ORM-объектов: снимок может содержать сотни строк
+        t = self._items(meta.part)
+        q = (
+            select(Security.secid, Security.shortname, t.c.last, t.c.change_pct, t.c.valtoday)
+            .join(Security, t.c.security_id == Security.id)
+            .where(t.c.snapshot_id == snapshot_id)
+            .order_by(t.c.id)
+        )
+        tiles = [
+            {
+                "secid": secid,
+                "name": (shortname or secid)[:18],
+                "last": last,
+                "change": change,
+                "valtoday": valtoday,
+            }
+            for secid, shortname, last, change, valtoday in self.session.execute(q)
+        ]
+        if meta.kind != "delta" or not meta.base_id:
+            return tiles
+        # Дельта: ключевой кадр (обычно уже в LRU) + изменившиеся строки поверх
+        changed = {t["secid"]: t for t in tiles}
+        merged = [changed.pop(t["secid"], t) for t in self.get_tiles_for_snapshot_id(meta.base_id, limit=None)]
+        merged.extend(changed.values())
+        return merged
+
+    def has_board(self, board_code: str) -> bool:
+        return self._board_id(board_code) is not None
+
+    def _board_id(self, board_code: str) -> int | None:
+        return self.session.scalar(select(Board.id).where(Board.code == board_code))
+
+    def _evict_gen(self, board_id: int) -> int:
+        return self.session.scalar(select(Board.evict_gen).where(Board.id == board_id)) or 0
+
+    def _snapshot_times_after(self, board_id: int, after_id: int):
+        q = (
+            select(Snapshot.created_at, Snapshot.id)
+            .where(Snapshot.board_id == board_id, Snapshot.id > after_id)
+            .order_by(Snapshot.id)
         )
-        tiles = []
-        for it, sec in rows:
-            tiles.append({
-                "secid": sec.secid,
-                "name": (sec.shortname or sec.secid)[:18],
-                "last": it.last,
-                "change": it.change_pct,
-                "valtoday": it.valtoday,
-            })
-        return tiles
+        return self.session.execute(q).all()
+
+    # -------- история по одной бумаге --------
+
+    def get_history(self, secid: str, start: datetime | None = None, end: datetime | None = None,
+                    after_id: int = 0, limit: int = 5000, board_code: str | None = None) -> list[tuple]:
+        """
+        Точки истории бумаги на борде: [(snapshot_id, created_at, last, change_pct, valtoday), ...]
+        по возрастанию snapshot_id (снимки пишутся по времени, так что это и хронология).
+        Keyset-пагинация: следующая страница — after_id = snapshot_id последней точки.
+        Борд по умолчанию — тот, где бумага встречается в последний раз.
+
+        start/end переводятся таймлайном борда (find_snapshot_id) в границы по id:
+        snapshot_id BETWEEN <снимок на момент start> AND <снимок на момент end> — диапазон
+        покрывающего индекса (security_id, snapshot_id, ...), без фильтра по времени через join.
+        Первая точка — значение, действовавшее на start (снимок на этот момент может быть раньше start);
+        у дельта-снимков хранятся только изменения, поэтому его значение берётся из ключевого кадра.
+        Бумага может быть в любой партиции борда: запрос — UNION ALL по партициям, пересекающимся
+        с периодом, а ORDER BY ... LIMIT SQLite выполняет слиянием упорядоченных веток.
+        """
+        security_id = self.session.scalar(select(Security.id).where(Security.secid == secid))
+        if security_id is None:
+            return []
+        board_id = self._board_id(board_code) if board_code else self._security_board_id(security_id)
+        if board_id is None:
+            return []
+        if board_code is None:
+            board_code = self.session.scalar(select(Board.code).where(Board.id == board_id))
+
+        lo = self.find_snapshot_id(board_code, start) if start is not None else None
+        hi = self.find_snapshot_id(board_code, end) if end is not None else None
+        if end is not None and hi is None:
+            return []  # на момент end у борда ещё нет снимков
+        seed = None
+        if lo is not None:
+            seed = self.session.execute(
+                select(Snapshot.created_at, Snapshot.kind, Snapshot.base_id, Snapshot.part).where(Snapshot.id == lo)
+            ).first()
+        period_start = seed.created_at if seed is not None else start
+        names = [n for n in partitions.existing(self.session)
+                 if n == partitions.LEGACY or (partitions.parse_name(n)[0] == board_id
+                                               and partitions.period_overlaps(partitions.parse_name(n)[1], period_start, end))]
+
+        def _branch(name: str):
+            t = self._items(name)
+            q = (
+                select(t.c.snapshot_id, Snapshot.created_at, t.c.last, t.c.change_pct, t.c.valtoday)
+                .join(Snapshot, Snapshot.id == t.c.snapshot_id)
+                .where(t.c.security_id == security_id, t.c.snapshot_id > max(after_id, (lo or 1) - 1))
+            )
+            if hi is not None:
+                q = q.where(t.c.snapshot_id <= hi)
+            if name == partitions.LEGACY:
+                q = q.where(Snapshot.board_id == board_id)
+            return q
+
+        rows: list[tuple] = []
+        # Веток в одном составном SELECT не больше _CHUNK (лимит SQLite — 500)
+        for part in _chunks(names):
+            q = _branch(part[0]) if len(part) == 1 else union_all(*map(_branch, part))
+            q = q.order_by(text("snapshot_id")).limit(limit)
+            rows.extend(tuple(r) for r in self.session.execute(q))
+        if len(names) > _CHUNK:
+            rows.sort(key=lambda r: r[0])
+        # Дельта на момент start без строки бумаги: значение не менялось с её ключевого кадра
+        if (seed is not None and after_id < lo and seed.kind == "delta" and seed.base_id
+                and (not rows or rows[0][0] != lo)):
+            base_part = self.session.scalar(select(Snapshot.part).where(Snapshot.id == seed.base_id))
+            t = self._items(base_part)
+            value = self.session.execute(
+                select(t.c.last, t.c.change_pct, t.c.valtoday)
+                .where(t.c.snapshot_id == seed.base_id, t.c.security_id == security_id)
+            ).first()
+            if value is not None:
+                rows.insert(0, (lo, seed.created_at, *value))
+        return rows[:limit]
+
+    def history_board(self, secid: str) -> str | None:
+        """Код борда, с которого get_history берёт историю бумаги по умолчанию (где она встречается в последний раз)."""
+        security_id = self.session.scalar(select(Security.id).where(Security.secid == secid))
+        board_id = self._security_board_id(security_id) if security_id is not None else None
+        return None if board_id is None else self.session.scalar(select(Board.code).where(Board.id == board_id))
+
+    def _security_board_id(self, security_id: int) -> int | None:
+        """Борд, где бумага встречается в последний раз: по одному поиску в индексе на партицию."""
+        best: tuple[int, int] | None = None  # (snapshot_id, board_id)
+        for name in partitions.existing(self.session):
+            t = self._items(name)
+            sid = self.session.scalar(select(func.max(t.c.snapshot_id)).where(t.c.security_id == security_id))
+            if sid is None or (best is not None and sid <= best[0]):
+                continue
+            board_id = (partitions.parse_name(name)[0] if name != partitions.LEGACY
+                        else self.session.scalar(select(Snapshot.board_id).where(Snapshot.id == sid)))
+            best = (sid, board_id)
+        return None if best is None else best[1]
+
+    def iter_history(self, secid: str, start: datetime | None = None, end: datetime | None = None,
+                     page: int = 5000, board_code: str | None = None):
+        """Вся история за период постранично (keyset), без загрузки в память одним запросом."""
+        after_id = 0
+        while True:
+            rows = self.get_history(secid, start, end, after_id=after_id, limit=page, board_code=board_code)
+            yield from rows
+            if len(rows) < page:
+                return
+            after_id = rows[-1][0]
+
+    # -------- потоковое чтение диапазона снимков (экспорт) --------
+
+    def iter_snapshot_tiles(self, board_code: str, start: datetime | None = None, end: datetime | None = None,
+                            snapshot_ids: list[int] | None = None, chunk: int = 2000):
+        """
+        Снимки борда за период по возрастанию времени: (snapshot_id, created_at, tiles).
+        Потоковый запрос (yield_per) на каждую партицию борда; в памяти — только текущий снимок
+        и ключевой кадр для дельт. LRU не трогаем, чтобы большой экспорт не вытеснял горячие снимки.
+        """
+        board_id = self._board_id(board_code)
+        if board_id is None:
+            return
+        where = [Snapshot.board_id == board_id]
+        if start is not None:
+            where.append(Snapshot.created_at >= start)
+        if end is not None:
+            where.append(Snapshot.created_at <= end)
+        if snapshot_ids is not None:
+            where.append(Snapshot.id.in_(snapshot_ids))
+        # Партиции борда в периоде — по времени; каждая читается своим потоковым запросом
+        parts = self.session.execute(
+            select(Snapshot.part).where(*where).group_by(Snapshot.part).order_by(func.min(Snapshot.created_at))
+        ).scalars().all()
+
+        def _query(part: str | None):
+            t = self._items(part)
+            return (
+                select(Snapshot.id, Snapshot.created_at, Snapshot.kind, Snapshot.base_id,
+                       Security.secid, Security.shortname, t.c.last, t.c.change_pct, t.c.valtoday)
+                .join(t, t.c.snapshot_id == Snapshot.id, isouter=True)
+                .join(Security, Security.id == t.c.security_id, isouter=True)
+                .where(*where, Snapshot.part.is_(None) if part is None else Snapshot.part == part)
+                .order_by(Snapshot.created_at, t.c.id)
+            )
+
+        keyframe: tuple[int | None, list[dict]] = (None, [])
+        current = None  # (id, created_at, kind, base_id, tiles)
+
+        def _finish(snap):
+            nonlocal keyframe
+            snapshot_id, created_at, kind, base_id, tiles = snap
+            if kind == "delta" and base_id:
+                if keyframe[0] != base_id:
+                    keyframe = (base_id, self._load_snapshot_tiles(base_id) or [])
+                changed = {t["secid"]: t for t in tiles}
+                tiles = [changed.pop(t["secid"], t) for t in keyframe[1]]
+                tiles.extend(changed.values())
+            elif kind != "delta":
+                keyframe = (snapshot_id, tiles)
+            return snapshot_id, created_at, tiles
+
+        for part in parts:
+            for row in self.session.execute(_query(part).execution_options(yield_per=chunk)):
+                if current is None or row.id != current[0]:
+                    if current is not None:
+                        yield _finish(current)
+                    current = (row.id, row.created_at, row.kind, row.base_id, [])
+                if row.secid is not None:
+                    current[4].append({
+                        "secid": row.secid,
+                        "name": (row.shortname or row.secid)[:18],
+                        "last": row.last,
+                        "change": row.change_pct,
+                        "valtoday": row.valtoday,
+                    })
+        if current is not None:
+            yield _finish(current)
 
     def list_snapshots(self, board_code: str, limit: int = 100):
         """Список последних снимков (id, created_at, items_count)."""
         board = self.session.scalar(select(Board).where(Board.code == board_code))
         if not board:
             return []
+        # items_count хранится в снимке (у дельт строк в партиции меньше, чем бумаг)
         q = (
-            select(Snapshot.id, Snapshot.created_at, func.count(SnapshotItem.id).label("items_count"))
-            .join(SnapshotItem, SnapshotItem.snapshot_id == Snapshot.id, isouter=True)
+            select(Snapshot.id, Snapshot.created_at, Snapshot.items_count.label("items_count"))
             .where(Snapshot.board_id == board.id)
-            .group_by(Snapshot.id)
             .order_by(desc(Snapshot.created_at))
             .limit(limit)
         )
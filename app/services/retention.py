@@ -0,0 +1,214 @@
+# app/services/retention.py
+"""
+Retention снимков: ступенчатое прореживание старых данных с архивом.
+
+Политика — список ступеней «возраст: шаг», например "7d:all,30d:5m,*:1h":
+- моложе 7 дней — все снимки;
+- от 7 до 30 дней — один снимок (последний) на каждые 5 минут;
+- старше — один на час.
+Вытесненные снимки пишутся в сжатый архив (ARCHIVE_DIR/<борд>/<YYYY-MM-DD>.jsonl.gz,
+по строке JSON на снимок) и удаляются из БД небольшими транзакциями; освободившиеся
+страницы возвращаются файлу через PRAGMA incremental_vacuum порциями.
+Архив читается обратно через iter_archive().
+"""
+
+from __future__ import annotations
+import gzip
+import json
+import logging
+import os
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+from sqlalchemy import select, text
+
+from .db import get_engine
+from .downsample import parse_step
+from .models import Board
+from .repository import MoexRepository
+
+log = logging.getLogger(__name__)
+
+# (максимальный возраст или None = без ограничения, шаг в секундах или None = хранить всё)
+Tier = Tuple[Optional[timedelta], Optional[int]]
+
+ARCHIVE_COLUMNS = ["secid", "name", "last", "base_price", "change", "valtoday"]
+
+
+def parse_tiers(spec: str) -> List[Tier]:
+    """'7d:all,30d:5m,*:1h' -> [(7 дней, None), (30 дней, 300), (None, 3600)]."""
+    tiers: List[Tier] = []
+    for part in spec.split(","):
+        age, _, step = part.strip().partition(":")
+        if not age or not step:
+            raise ValueError(f"bad retention tier: {part!r}")
+        max_age = None if age.strip() == "*" else timedelta(seconds=parse_step(age) or 0)
+        if max_age is not None and not max_age:
+            raise ValueError(f"bad retention age: {age!r}")
+        if step.strip().lower() == "all":
+            seconds = None
+        else:
+            seconds = parse_step(step)
+            if seconds is None:
+                raise ValueError(f"bad retention step: {step!r}")
+        tiers.append((max_age, seconds))
+    return tiers
+
+
+def plan_evictions(snapshots: Sequence[Tuple[int, datetime]], now: datetime, tiers: List[Tier]) -> List[int]:
+    """
+    id снимков, которые политика вытесняет. snapshots — (id, created_at) по возрастанию времени.
+    В каждом интервале ступени остаётся последний снимок (как bucket_last у истории),
+    поэтому при переходе снимка на следующую ступень выбор остаётся согласованным.
+    Снимки старше последней ступени с ограничением возраста не трогаем.
+    """
+    evict: List[int] = []
+    kept_in_bucket: Dict[Tuple[int, int], int] = {}
+    for snapshot_id, created_at in snapshots:
+        age = now - created_at
+        for n, (max_age, step) in enumerate(tiers):
+            if max_age is None or age < max_age:
+                break
+        else:
+            continue
+        if step is None:
+            continue
+        bucket = (n, int(created_at.replace(tzinfo=timezone.utc).timestamp() // step))
+        previous = kept_in_bucket.get(bucket)
+        if previous is not None:
+            evict.append(previous)
+        kept_in_bucket[bucket] = snapshot_id
+    return evict
+
+
+# ---------- архив ----------
+
+class ArchiveWriter:
+    """
+    Дописывает снимки в ARCHIVE_DIR/<борд>/<день>.jsonl.gz. Каждый вызов (группа снимков
+    одной транзакции) — отдельный gzip-член (gzip читает склеенные члены как один поток)
+    + fsync: к моменту удаления из БД снимки уже на диске. Повтор после сбоя даст
+    дубликат, iter_archive его отбросит.
+    """
+
+    def __init__(self, directory: str) -> None:
+        self.directory = directory
+        self.written = 0
+
+    def path_for(self, board_code: str, created_at: datetime) -> str:
+        return os.path.join(self.directory, board_code, f"{created_at:%Y-%m-%d}.jsonl.gz")
+
+    def __call__(self, board_code: str, snapshots: List[Tuple[int, datetime, List[tuple]]]) -> None:
+        by_path: Dict[str, List[bytes]] = {}
+        for snapshot_id, created_at, rows in snapshots:
+            line = json.dumps({
+                "id": snapshot_id,
+                "board": board_code,
+                "created_at": created_at.isoformat(),
+                "columns": ARCHIVE_COLUMNS,
+                "rows": rows,
+            }, ensure_ascii=False, separators=(",", ":"))
+            by_path.setdefault(self.path_for(board_code, created_at), []).append(line.encode("utf-8") + b"\n")
+        for path, lines in by_path.items():
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, "ab") as raw:
+                with gzip.GzipFile(fileobj=raw, mode="ab") as gz:
+                    gz.writelines(lines)
+                raw.flush()
+                os.fsync(raw.fileno())
+            self.written += len(lines)
+
+
+def iter_archive(directory: str, board_code: str, start: datetime | None = None,
+                 end: datetime | None = None) -> Iterator[Tuple[int, datetime, List[Dict[str, Any]]]]:
+    """
+    Снимки из архива по возрастанию времени: (snapshot_id, created_at, tiles) —
+    в том же формате плиток, что и MoexRepository.iter_snapshot_tiles.
+    """
+    board_dir = os.path.join(directory, board_code)
+    try:
+        files = sorted(f for f in os.listdir(board_dir) if f.endswith(".jsonl.gz"))
+    except FileNotFoundError:
+        return
+    for name in files:
+        day = datetime.strptime(name[:10], "%Y-%m-%d")
+        if (start is not None and day + timedelta(days=1) <= start) or (end is not None and day > end):
+            continue
+        seen = set()
+        records = []
+        with gzip.open(os.path.join(board_dir, name), "rt", encoding="utf-8") as f:
+            for line in f:
+                rec = json.loads(line)
+                if rec["id"] in seen:
+                    continue
+                seen.add(rec["id"])
+                created_at = datetime.fromisoformat(rec["created_at"])
+                if (start is None or created_at >= start) and (end is None or created_at <= end):
+                    records.append((created_at, rec))
+        records.sort(key=lambda r: r[0])
+        for created_at, rec in records:
+            idx = {c: i for i, c in enumerate(rec["columns"])}
+            yield rec["id"], created_at, [
+                {"secid": r[idx["secid"]], "name": (r[idx["name"]] or r[idx["secid"]])[:18],
+                 "last": r[idx["last"]], "change": r[idx["change"]], "valtoday": r[idx["valtoday"]]}
+                for r in rec["rows"]
+            ]
+
+
+# ---------- задание ----------
+
+def incremental_vacuum(engine, pages: int = 1000, pause: float = 0.05, max_steps: int = 10_000) -> int:
+    """
+    Возвращает свободные страницы файлу порциями по pages (короткие транзакции).
+    Работает, только если у БД auto_vacuum=INCREMENTAL; иначе 0 (см. scripts.retention --enable-incremental-vacuum).
+    """
+    freed = 0
+    with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        if conn.execute(text("PRAGMA auto_vacuum")).scalar() != 2:
+            return 0
+        for _ in range(max_steps):
+            free = conn.execute(text("PRAGMA freelist_count")).scalar()
+            if not free:
+                break
+            conn.execute(text(f"PRAGMA incremental_vacuum({min(free, pages)})"))
+            left = conn.execute(text("PRAGMA freelist_count")).scalar()
+            if left >= free:
+                break
+            freed += free - left
+            time.sleep(pause)
+    return freed
+
+
+class RetentionJob:
+    """Один проход retention по бордам: план -> архив -> удаление -> incremental vacuum."""
+
+    def __init__(self, tiers: List[Tier], archive_dir: str | None, pause: float = 0.05) -> None:
+        self.tiers = tiers
+        self.archive = ArchiveWriter(archive_dir) if archive_dir else None
+        self.pause = pause
+
+    def run(self, boards: Iterable[str] | None = None, now: datetime | None = None,
+            dry_run: bool = False) -> List[Dict[str, Any]]:
+        now = now or datetime.utcnow()
+        repo = MoexRepository()
+        report = []
+        try:
+            codes = list(boards) if boards else sorted(repo.session.scalars(select(Board.code)))
+            for code in codes:
+                started = time.perf_counter()
+                evict = plan_evictions(repo.snapshot_index(code), now, self.tiers)
+                if dry_run:
+                    report.append({"board": code, "evicted": len(evict), "dry_run": True})
+                    continue
+                stats = repo.evict_snapshots(code, evict, archive=self.archive, pause=self.pause)
+                stats["elapsed_ms"] = round((time.perf_counter() - started) * 1000.0, 1)
+                report.append(stats)
+                log.info("retention: %s", stats)
+        finally:
+            repo.close()
+        if not dry_run:
+            freed = incremental_vacuum(get_engine(), pause=self.pause)
+            report.append({"vacuum_pages": freed})
+        return report
+
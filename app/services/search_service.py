@@ -1,20 +1,115 @@
-from typing import List, Dict
+import threading
+from typing import List, Dict, Optional
+
+# Длина n-грамм индекса подстрок: запросы короче ищутся прямо по n-граммам
+NGRAM = 3
+
+
+class SearchIndex:
+    """
+    Предпостроенный индекс по тикеру/названию для набора плиток.
+    - точное совпадение secid — словарь
+    - префиксы secid и названия — словари «префикс -> позиции»
+    - подстроки — n-граммы (1..3 символа) с пересечением списков и проверкой кандидатов
+    Позиции в списках идут по возрастанию, поэтому внутри ранга сохраняется порядок плиток.
+    """
+
+    def __init__(self, tiles: List[Dict]) -> None:
+        self.tiles = tiles
+        self._secids = [(t.get("secid") or "").upper() for t in tiles]
+        self._names = [(t.get("name") or "").upper() for t in tiles]
+        self._exact: Dict[str, List[int]] = {}
+        self._secid_prefix: Dict[str, List[int]] = {}
+        self._name_prefix: Dict[str, List[int]] = {}
+        self._grams: Dict[str, List[int]] = {}
+
+        for i, (secid, name) in enumerate(zip(self._secids, self._names)):
+            self._exact.setdefault(secid, []).append(i)
+            self._add_prefixes(self._secid_prefix, secid, i)
+            self._add_prefixes(self._name_prefix, name, i)
+            for gram in self._ngrams(secid) | self._ngrams(name):
+                self._grams.setdefault(gram, []).append(i)
+
+    @staticmethod
+    def _add_prefixes(index: Dict[str, List[int]], text: str, i: int) -> None:
+        for end in range(1, len(text) + 1):
+            bucket = index.setdefault(text[:end], [])
+            if not bucket or bucket[-1] != i:
+                bucket.append(i)
+
+    @staticmethod
+    def _ngrams(text: str) -> set:
+        return {text[i:i + n] for n in range(1, NGRAM + 1) for i in range(len(text) - n + 1)}
+
+    def _substring_candidates(self, q: str) -> List[int]:
+        if len(q) <= NGRAM:
+            return self._grams.get(q, [])
+        grams = sorted({q[i:i + NGRAM] for i in range(len(q) - NGRAM + 1)},
+                       key=lambda g: len(self._grams.get(g, ())))
+        candidates = set(self._grams.get(grams[0], ()))
+        for gram in grams[1:]:
+            if not candidates:
+                break
+            candidates.intersection_update(self._grams.get(gram, ()))
+        # n-граммы дают надмножество — подтверждаем настоящей подстрокой
+        return [i for i in sorted(candidates) if q in self._secids[i] or q in self._names[i]]
+
+    def search(self, query: str, limit: Optional[int] = None) -> List[Dict]:
+        """Ранжированный поиск: точный secid > префикс secid > префикс названия > подстрока."""
+        q = (query or "").strip().upper()
+        if not q or (limit is not None and limit <= 0):
+            return []
+
+        seen: set = set()
+        res: List[Dict] = []
+        for bucket in (
+            self._exact.get(q, ()),
+            self._secid_prefix.get(q, ()),
+            self._name_prefix.get(q, ()),
+        ):
+            for i in bucket:
+                if i not in seen:
+                    seen.add(i)
+                    res.append(self.tiles[i])
+                    if limit is not None and len(res) >= limit:
+                        return res
+        for i in self._substring_candidates(q):
+            if i not in seen:
+                seen.add(i)
+                res.append(self.tiles[i])
+                if limit is not None and len(res) >= limit:
+                    break
+        return res
+
 
 class SearchService:
     """
     Очень простой «поиск» по тикеру/части названия
     (по уже полученным данным борда, без отдельного запроса).
+    Индекс строится один раз на версию данных (см. tile_cache.tiles_version)
+    и переиспользуется всеми запросами, пока данные не поменяются.
     В реальности можно расширить до поиска через /securities.json по всей базе.
     """
-    def search(self, tiles: List[Dict], query: str) -> List[Dict]:
-        q = (query or "").strip().upper()
-        if not q:
-            return []
 
-        res = []
-        for t in tiles:
-            secid = (t.get("secid") or "").upper()
-            name = (t.get("name") or "").upper()
-            if q in secid or q in name:
-                res.append(t)
-        return res
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._index: Optional[SearchIndex] = None
+        self._index_version: Optional[str] = None
+
+    def index_for(self, tiles: List[Dict], version: Optional[str] = None) -> SearchIndex:
+        """Индекс для версии данных; без версии — разовый индекс, не кэшируется."""
+        if version is None:
+            return SearchIndex(tiles)
+        with self._lock:
+            if self._index is not None and self._index_version == version:
+                return self._index
+        index = SearchIndex(tiles)
+        with self._lock:
+            self._index, self._index_version = index, version
+        return index
+
+    def search(self, tiles: List[Dict], query: str, limit: Optional[int] = None,
+               version: Optional[str] = None) -> List[Dict]:
+        if not (query or "").strip():
+            return []
+        return self.index_for(tiles, version).search(query, limit=limit)
@@ -0,0 +1,191 @@
+# app/services/snapshot_cache.py
+"""
+Кэши для «путешествий во времени» по снимкам:
+- SnapshotTimeline — по каждому борду отсортированные (created_at, snapshot_id),
+  поиск снимка «на момент» через bisect без запросов к БД;
+- SnapshotTilesLRU — ограниченный LRU уже декодированных плиток по snapshot_id.
+
+Снимок после записи не меняется, поэтому плитки по id можно кэшировать — пока снимок есть.
+Новые снимки этого процесса попадают в таймлайн сразу после commit (см. repository),
+снимки других процессов (коллектор) подтягиваются инкрементально не чаще раза в ttl секунд
+и только для запросов «последний/позже известного».
+
+Удаляют снимки retention, detach партиции и dedup — возможно, в другом процессе. Каждое
+удаление увеличивает boards.evict_gen в той же транзакции; таймлайн сверяет поколение
+не чаще раза в ttl секунд (для любых запросов, в том числе исторических) и при смене
+перечитывает борд целиком, а пропавшие id выкидывает из LRU плиток.
+"""
+
+from __future__ import annotations
+import threading
+import time
+from bisect import bisect_right
+from collections import OrderedDict
+from datetime import datetime
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+
+class _BoardTimeline:
+    __slots__ = ("board_id", "times", "ids", "max_id", "checked_at", "gen", "gen_checked_at")
+
+    def __init__(self, board_id: int, gen: int = 0) -> None:
+        self.board_id = board_id
+        self.times: List[datetime] = []
+        self.ids: List[int] = []
+        self.max_id = 0
+        self.checked_at = 0.0
+        self.gen = gen  # boards.evict_gen, с которым прочитаны times/ids
+        self.gen_checked_at = time.monotonic()
+
+    def add(self, created_at: datetime, snapshot_id: int) -> None:
+        pos = bisect_right(self.times, created_at)
+        if pos and self.times[pos - 1] == created_at:
+            self.ids[pos - 1] = snapshot_id  # uq_snapshot_board_time: на момент один снимок
+        else:
+            self.times.insert(pos, created_at)
+            self.ids.insert(pos, snapshot_id)
+
+
+# Загрузчики, которые даёт репозиторий: board_code -> board_id | None,
+# (board_id, after_id) -> [(created_at, id), ...], board_id -> boards.evict_gen
+BoardLoader = Callable[[str], Optional[int]]
+RowsLoader = Callable[[int, int], Iterable[Tuple[datetime, int]]]
+GenLoader = Callable[[int], int]
+
+
+class SnapshotTimeline:
+    def __init__(self, ttl: float = 5.0, on_evicted: Callable[[str, Iterable[int]], None] | None = None) -> None:
+        self.ttl = ttl
+        self.on_evicted = on_evicted  # (db_key, id пропавших снимков) — сбросить их из LRU плиток
+        self._lock = threading.Lock()
+        self._boards: Dict[Tuple[str, str], _BoardTimeline] = {}
+
+    def find(self, db_key: str, board_code: str, at: datetime | None,
+             load_board: BoardLoader, load_rows: RowsLoader, load_gen: GenLoader) -> Optional[int]:
+        """id последнего снимка борда с created_at <= at (at=None — самый последний)."""
+        key = (db_key, board_code)
+        with self._lock:
+            tl = self._boards.get(key)
+        if tl is None:
+            board_id = load_board(board_code)
+            if board_id is None:
+                return None
+            tl = self._load(key, board_id, load_rows, load_gen)
+        else:
+            if time.monotonic() - tl.gen_checked_at >= self.ttl:
+                gen = load_gen(tl.board_id)
+                tl.gen_checked_at = time.monotonic()
+                if gen != tl.gen:
+                    tl = self._reload(key, tl, load_rows, load_gen)
+            if self._needs_refresh(tl, at):
+                self._refresh(tl, load_rows)
+
+        with self._lock:
+            pos = len(tl.times) if at is None else bisect_right(tl.times, at)
+            return tl.ids[pos - 1] if pos else None
+
+    def generation(self, db_key: str, board_code: str) -> Optional[int]:
+        """Поколение удалений, с которым прочитан таймлайн борда (None — борд ещё не читали)."""
+        with self._lock:
+            tl = self._boards.get((db_key, board_code))
+        return None if tl is None else tl.gen
+
+    def _load(self, key: Tuple[str, str], board_id: int, load_rows: RowsLoader,
+              load_gen: GenLoader, replace: bool = False) -> _BoardTimeline:
+        # Поколение читаем ДО строк: удаление между ними даст лишнее перечитывание, а не устаревший таймлайн
+        tl = _BoardTimeline(board_id, load_gen(board_id))
+        self._refresh(tl, load_rows)
+        with self._lock:
+            if replace:
+                self._boards[key] = tl
+                return tl
+            return self._boards.setdefault(key, tl)
+
+    def _reload(self, key: Tuple[str, str], old: _BoardTimeline, load_rows: RowsLoader,
+                load_gen: GenLoader) -> _BoardTimeline:
+        """Снимки борда удалили (возможно, другой процесс): таймлайн заново, пропавшие id — из LRU."""
+        tl = self._load(key, old.board_id, load_rows, load_gen, replace=True)
+        if self.on_evicted is not None:
+            with self._lock:
+                gone = set(old.ids).difference(tl.ids)
+            self.on_evicted(key[0], gone)
+        return tl
+
+    def _needs_refresh(self, tl: _BoardTimeline, at: datetime | None) -> bool:
+        # Исторический момент внутри известного диапазона уже не изменится — БД не трогаем
+        if at is not None and tl.times and at < tl.times[-1]:
+            return False
+        return time.monotonic() - tl.checked_at >= self.ttl
+
+    def _refresh(self, tl: _BoardTimeline, load_rows: RowsLoader) -> None:
+        rows = list(load_rows(tl.board_id, tl.max_id))
+        with self._lock:
+            for created_at, snapshot_id in rows:
+                tl.add(created_at, snapshot_id)
+                # max_id двигаем только по данным из БД: снимки из note() могли
+                # обогнать по id ещё не прочитанные снимки других процессов
+                tl.max_id = max(tl.max_id, snapshot_id)
+            tl.checked_at = time.monotonic()
+
+    def note(self, db_key: str, board_code: str, snapshot_id: int, created_at: datetime) -> None:
+        """Снимок записан (и закоммичен) этим процессом — добавляем без запроса к БД."""
+        with self._lock:
+            tl = self._boards.get((db_key, board_code))
+            if tl is not None:
+                tl.add(created_at, snapshot_id)
+
+    def invalidate(self, db_key: str | None = None, board_code: str | None = None) -> None:
+        """Сбросить таймлайны (например, после удаления снимков)."""
+        with self._lock:
+            for key in list(self._boards):
+                if (db_key is None or key[0] == db_key) and (board_code is None or key[1] == board_code):
+                    del self._boards[key]
+
+
+class SnapshotTilesLRU:
+    """LRU: (db_key, snapshot_id) -> список плиток. Плитки отдаются как есть — не мутировать."""
+
+    def __init__(self, maxsize: int = 64) -> None:
+        self.maxsize = maxsize
+        self._lock = threading.Lock()
+        self._data: "OrderedDict[Tuple[str, int], List[dict]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, db_key: str, snapshot_id: int) -> Optional[List[dict]]:
+        with self._lock:
+            tiles = self._data.get((db_key, snapshot_id))
+            if tiles is None:
+                self.misses += 1
+                return None
+            self._data.move_to_end((db_key, snapshot_id))
+            self.hits += 1
+            return tiles
+
+    def put(self, db_key: str, snapshot_id: int, tiles: List[dict]) -> None:
+        with self._lock:
+            self._data[(db_key, snapshot_id)] = tiles
+            self._data.move_to_end((db_key, snapshot_id))
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def discard(self, db_key: str, snapshot_ids: Iterable[int]) -> None:
+        with self._lock:
+            for snapshot_id in snapshot_ids:
+                self._data.pop((db_key, snapshot_id), None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+
+# Общие на процесс экземпляры; параметры задаёт create_app через configure()
+tiles_lru = SnapshotTilesLRU()
+timeline = SnapshotTimeline(on_evicted=tiles_lru.discard)
+
+
+def configure(ttl: float | None = None, lru_size: int | None = None) -> None:
+    if ttl is not None:
+        timeline.ttl = ttl
+    if lru_size is not None:
+        tiles_lru.maxsize = lru_size
@@ -0,0 +1,90 @@
+# app/services/snapshot_stats.py
+"""
+Агрегаты снимка (чистые функции, без БД):
+- compute_stats — считается один раз при записи снимка и хранится в snapshots.stats_json:
+  ширина рынка (растут/падают/без изменений), суммарный оборот, top-K по изменению и по обороту;
+- diff_tiles — сравнение двух снимков одного борда: слияние двух отсортированных по secid
+  потоков (heapq.merge) и top-K через кучу, без сортировки всего списка.
+Строка — dict с ключами secid, name/shortname, last, change, valtoday (плитка или item репозитория).
+"""
+
+from __future__ import annotations
+import heapq
+from itertools import groupby
+from typing import Any, Dict, Iterable, List, Optional
+
+# Версия формата stats_json: при изменении состава полей старые агрегаты пересчитываются
+STATS_VERSION = 1
+
+
+def _brief(row: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "secid": row["secid"],
+        "name": (row.get("name") or row.get("shortname") or row["secid"])[:18],
+        "last": row.get("last"),
+        "change": row.get("change"),
+        "valtoday": row.get("valtoday"),
+    }
+
+
+def compute_stats(rows: Iterable[Dict[str, Any]], top_k: int = 20) -> Dict[str, Any]:
+    """Агрегаты снимка за один проход; top-K — через кучи размера K."""
+    rows = list(rows)
+    with_change = [r for r in rows if r.get("change") is not None]
+    advancers = sum(1 for r in with_change if r["change"] > 0)
+    decliners = sum(1 for r in with_change if r["change"] < 0)
+    by_change = lambda r: r["change"]
+    return {
+        "v": STATS_VERSION,
+        "count": len(rows),
+        "advancers": advancers,
+        "decliners": decliners,
+        "unchanged": len(with_change) - advancers - decliners,
+        "no_change": len(rows) - len(with_change),
+        "turnover": sum(r.get("valtoday") or 0 for r in rows),
+        "top_k": top_k,
+        "gainers": [_brief(r) for r in heapq.nlargest(top_k, with_change, key=by_change) if r["change"] > 0],
+        "losers": [_brief(r) for r in heapq.nsmallest(top_k, with_change, key=by_change) if r["change"] < 0],
+        "most_active": [_brief(r) for r in heapq.nlargest(top_k, rows, key=lambda r: r.get("valtoday") or 0)
+                        if r.get("valtoday")],
+    }
+
+
+def _pct(a: Optional[float], b: Optional[float]) -> Optional[float]:
+    if a is None or b is None or a == 0:
+        return None
+    return (b - a) / a * 100.0
+
+
+def diff_tiles(old: List[Dict[str, Any]], new: List[Dict[str, Any]], top_k: int = 20) -> Dict[str, Any]:
+    """
+    Разница между двумя снимками: по каждой бумаге — изменение last в % между моментами.
+    Оба списка сортируются по secid и сливаются одним проходом; top-K роста/падения — кучи.
+    """
+    key = lambda t: t["secid"]
+    merged = heapq.merge(((t["secid"], 0, t) for t in sorted(old, key=key)),
+                         ((t["secid"], 1, t) for t in sorted(new, key=key)))
+    moves, added, removed = [], [], []
+    for secid, group in groupby(merged, key=lambda x: x[0]):
+        pair = {side: t for _, side, t in group}
+        a, b = pair.get(0), pair.get(1)
+        if a is None:
+            added.append(secid)
+            continue
+        if b is None:
+            removed.append(secid)
+            continue
+        pct = _pct(a.get("last"), b.get("last"))
+        if pct is not None:
+            moves.append({**_brief(b), "last_from": a.get("last"), "move_pct": pct})
+
+    by_move = lambda m: m["move_pct"]
+    return {
+        "count": len(moves),
+        "up": sum(1 for m in moves if m["move_pct"] > 0),
+        "down": sum(1 for m in moves if m["move_pct"] < 0),
+        "top_up": [m for m in heapq.nlargest(top_k, moves, key=by_move) if m["move_pct"] > 0],
+        "top_down": [m for m in heapq.nsmallest(top_k, moves, key=by_move) if m["move_pct"] < 0],
+        "added": added,
+        "removed": removed,
+    }
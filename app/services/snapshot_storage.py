@@ -0,0 +1,111 @@
+# app/services/snapshot_storage.py
+"""
+Правила хранения снимков (чистые функции, без БД):
+- content_hash — хэш содержимого снимка, одинаковые снимки подряд не пишем;
+- plan_delta — писать ли снимок дельтой к ключевому кадру и какие строки в неё попадут.
+
+Режим 'full' — каждый снимок хранит все строки (как раньше).
+Режим 'delta' — раз в keyframe_every снимков пишется полный ключевой кадр,
+остальные хранят только строки, отличающиеся от ключевого кадра
+(дельта всегда к кадру, не к предыдущему снимку: восстановление = кадр + одна дельта).
+Дополнительно в дельту попадают строки, изменившиеся относительно предыдущего снимка, —
+так в строках снимков остаётся каждая точка изменения цены (история по бумаге).
+"""
+
+from __future__ import annotations
+import hashlib
+from typing import Any, Dict, Iterable, Mapping, Optional, Tuple
+
+# (last, base_price, change_pct, valtoday) — значения строки снимка
+Values = Tuple[Optional[float], Optional[float], Optional[float], Optional[float]]
+
+# Значения по умолчанию; реальные настройки приходят только из Config (configure_from):
+# create_app и скрипты (scripts.bootstrap) вызывают его сами, окружение модуль не читает
+STORAGE = {
+    "mode": "full",
+    "keyframe_every": 30,
+    "dedup": True,
+    # Если изменилась большая доля строк, дельта не выгодна — пишем новый кадр
+    "max_delta_ratio": 0.5,
+    # Сколько лидеров роста/падения/оборота хранить в агрегатах снимка (stats_json)
+    "top_k": 20,
+    # Разбиение строк снимков по таблицам (см. partitions): board | month, и схемы отдельных бордов
+    "partition": "month",
+    "partition_by_board": {},
+}
+
+PARTITION_SCHEMES = ("board", "month")
+
+
+def configure(mode: str | None = None, keyframe_every: int | None = None, dedup: bool | None = None,
+              top_k: int | None = None, partition: str | None = None,
+              partition_by_board: Dict[str, str] | None = None) -> None:
+    if mode is not None:
+        if mode not in ("full", "delta"):
+            raise ValueError(f"unknown snapshot storage mode: {mode}")
+        STORAGE["mode"] = mode
+    if keyframe_every is not None:
+        STORAGE["keyframe_every"] = max(1, int(keyframe_every))
+    if dedup is not None:
+        STORAGE["dedup"] = bool(dedup)
+    if top_k is not None:
+        STORAGE["top_k"] = max(1, int(top_k))
+    for scheme in ([partition] if partition is not None else []) + list((partition_by_board or {}).values()):
+        if scheme not in PARTITION_SCHEMES:
+            raise ValueError(f"unknown snapshot partition scheme: {scheme}")
+    if partition is not None:
+        STORAGE["partition"] = partition
+    if partition_by_board is not None:
+        STORAGE["partition_by_board"] = dict(partition_by_board)
+
+
+def configure_from(cfg: Mapping[str, Any] | type, partition_by_board: Dict[str, str] | None = None) -> None:
+    """Настройки хранения из Config (класс или app.config); partition_by_board — из реестра бордов."""
+    get = cfg.get if isinstance(cfg, Mapping) else (lambda name, default=None: getattr(cfg, name, default))
+    configure(
+        mode=get("SNAPSHOT_STORAGE"),
+        keyframe_every=get("SNAPSHOT_KEYFRAME_EVERY"),
+        dedup=get("SNAPSHOT_DEDUP"),
+        top_k=get("SNAPSHOT_TOP_K"),
+        partition=get("SNAPSHOT_PARTITION"),
+        partition_by_board=partition_by_board,
+    )
+
+
+def _num(x) -> Optional[float]:
+    # В БД всё хранится как REAL: int и float одного значения должны хэшироваться одинаково
+    return None if x is None else float(x)
+
+
+def item_values(item: dict) -> Values:
+    """Значения строки из item формата репозитория (secid, last, base_price, change, valtoday)."""
+    return (_num(item.get("last")), _num(item.get("base_price")),
+            _num(item.get("change")), _num(item.get("valtoday")))
+
+
+def content_hash(rows: Iterable[Tuple[str, Values]]) -> str:
+    """Хэш снимка по (secid, значения), независимо от порядка строк."""
+    h = hashlib.blake2b(digest_size=16)
+    for secid, values in sorted(rows, key=lambda r: r[0]):
+        h.update(f"{secid}|{values!r}\n".encode("utf-8"))
+    return h.hexdigest()
+
+
+def plan_delta(keyframe: Dict[int, Values], current: Dict[int, Values],
+               previous: Optional[Dict[int, Values]] = None) -> Optional[list[int]]:
+    """
+    security_id строк, которые нужно записать дельтой к keyframe,
+    или None — если дельта невозможна/невыгодна и нужен полный кадр:
+    из снимка пропала бумага (дельта не умеет «удалять») или изменилось слишком много строк.
+    previous — полные значения предыдущего снимка: строки, вернувшиеся к значению кадра,
+    тоже пишутся, иначе история по бумаге потеряла бы это изменение.
+    """
+    if not keyframe or keyframe.keys() - current.keys():
+        return None
+    changed = [
+        sid for sid, values in current.items()
+        if keyframe.get(sid) != values or (previous is not None and previous.get(sid) != values)
+    ]
+    if len(changed) > STORAGE["max_delta_ratio"] * len(current):
+        return None
+    return changed
@@ -0,0 +1,229 @@
+# app/services/tile_cache.py
+"""
+Общий кэш плиток по бордам.
+Ключи и TTL живут здесь, чтобы веб-роуты и фоновый коллектор
+писали/читали одни и те же записи.
+
+Запись в кэше: {"tiles": [...], "version": "<хэш содержимого>", "fetched_at": unix-время}.
+version меняется только при изменении данных — по нему перестраиваются
+производные структуры (поисковый индекс и т.п.).
+
+Где лежат записи, задаёт TILE_STORE (см. tile_store): память процесса, общий каталог
+на диске или Redis. С общим хранилищем борд обновляет один процесс, остальные читают.
+
+Свежесть (stale-while-revalidate): запись свежая TILES_CACHE_TTL секунд, после этого
+ещё до TILES_STALE_MAX_AGE секунд отдаётся как устаревшая, пока одно фоновое обновление
+тянет новые данные (и продолжает отдаваться, если MOEX падает). Одновременные загрузки
+одного борда схлопываются в одну (single-flight).
+
+С коллектором (COLLECTOR_MODE=thread|process) кэш пишет только он: свежесть считается
+от его интервала опроса, записи живут не меньше трёх интервалов, веб MOEX не опрашивает.
+Коллектору в отдельном процессе нужно общее хранилище — memory тогда заменяется на file.
+"""
+
+from __future__ import annotations
+import hashlib
+import json
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+from flask import Flask, current_app
+from ..extensions import cache
+from . import heatmap_service
+from .heatmap_service import HeatmapService
+from .single_flight import SingleFlight
+from .tile_store import TileStore, make_store
+from .time_utils import is_trading_time
+
+log = logging.getLogger(__name__)
+
+_heatmap = HeatmapService()
+flights = SingleFlight()
+# Последняя ошибка фонового обновления по ключу борда (для диагностики)
+refresh_errors: Dict[str, str] = {}
+# Борды, обновление которых уже поставлено в пул (ещё не началось или идёт)
+_refreshing: set = set()
+_refreshing_lock = threading.Lock()
+
+
+def store_kind(cfg) -> str:
+    """TILE_STORE, но коллектор в отдельном процессе не может писать в память веб-процесса — тогда file."""
+    kind = cfg.get("TILE_STORE", "memory")
+    if kind == "memory" and cfg.get("COLLECTOR_MODE") == "process":
+        return "file"
+    return kind
+
+
+def get_store() -> TileStore:
+    """Хранилище плиток приложения (создаётся при первом обращении)."""
+    store = current_app.extensions.get("tile_store")
+    if store is None:
+        cfg = current_app.config
+        kind = store_kind(cfg)
+        if kind != cfg.get("TILE_STORE", "memory"):
+            log.warning("COLLECTOR_MODE=process needs a shared tile store: using TILE_STORE=%s (%s)",
+                        kind, cfg.get("TILE_STORE_DIR"))
+        store = current_app.extensions.setdefault("tile_store", make_store(
+            kind, cache=cache, directory=cfg.get("TILE_STORE_DIR"), url=cfg.get("TILE_STORE_URL"),
+        ))
+    return store
+
+
+def collector_enabled() -> bool:
+    """Плитки обновляет фоновый коллектор (поток или процесс) — веб их только читает."""
+    return current_app.config.get("COLLECTOR_MODE", "off") in ("thread", "process")
+
+
+def cache_key(engine: str, market: str, board: str) -> str:
+    return f"board:{engine}:{market}:{board}"
+
+
+def tiles_ttl() -> int:
+    """Сколько секунд запись свежая: TILES_CACHE_TTL, с коллектором — его текущий интервал + длительность цикла."""
+    cfg = current_app.config
+    if collector_enabled():
+        interval = cfg.get("COLLECTOR_INTERVAL_TRADING", 60) if is_trading_time() else cfg.get("COLLECTOR_INTERVAL_OFFHOURS", 900)
+        return int(interval + cfg.get("COLLECTOR_CYCLE_TIMEOUT", 30))
+    return int(cfg.get("TILES_CACHE_TTL", 60))
+
+
+def stale_max_age() -> int:
+    """
+    Сколько секунд запись живёт в кэше всего: свежая часть + время, когда её можно отдавать устаревшей.
+    Запись коллектора должна дожить до его следующего цикла, даже если между ними сменилось
+    расписание (торги -> ночь) и цикл-другой упал, — поэтому не меньше трёх длинных интервалов.
+    """
+    cfg = current_app.config
+    age = max(int(cfg.get("TILES_STALE_MAX_AGE", 600)), tiles_ttl())
+    if collector_enabled():
+        longest = max(int(cfg.get("COLLECTOR_INTERVAL_TRADING", 60)), int(cfg.get("COLLECTOR_INTERVAL_OFFHOURS", 900)))
+        age = max(age, 3 * longest)
+    return age
+
+
+def entry_age(entry: Dict[str, Any]) -> Optional[float]:
+    fetched_at = entry.get("fetched_at")
+    return None if fetched_at is None else max(0.0, time.time() - fetched_at)
+
+
+def is_fresh(entry: Dict[str, Any]) -> bool:
+    age = entry_age(entry)
+    return age is not None and age <= tiles_ttl()
+
+
+def freshness(entry: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """{"age_sec", "stale"} для UI/заголовков; None — данных нет."""
+    age = entry_age(entry)
+    if age is None:
+        return None
+    return {"age_sec": round(age, 1), "stale": age > tiles_ttl()}
+
+
+def tiles_version(tiles: List[Dict[str, Any]]) -> str:
+    """Хэш содержимого плиток: одинаковые данные -> одинаковая версия (в любом процессе)."""
+    raw = json.dumps(tiles, ensure_ascii=False, separators=(",", ":"), default=str)
+    return hashlib.blake2b(raw.encode("utf-8"), digest_size=8).hexdigest()
+
+
+def get_entry(engine: str, market: str, board: str) -> Optional[Dict[str, Any]]:
+    """Запись {"tiles", "version"} из кэша или None, если записи нет/истекла."""
+    return get_store().get(cache_key(engine, market, board))
+
+
+def get_tiles(engine: str, market: str, board: str) -> Optional[List[Dict[str, Any]]]:
+    """Плитки из кэша или None, если записи нет/истекла."""
+    entry = get_entry(engine, market, board)
+    return None if entry is None else entry["tiles"]
+
+
+def store_tiles(engine: str, market: str, board: str, tiles: List[Dict[str, Any]]) -> Dict[str, Any]:
+    entry = {"tiles": tiles, "version": tiles_version(tiles), "fetched_at": time.time()}
+    get_store().set(cache_key(engine, market, board), entry, timeout=stale_max_age())
+    return entry
+
+
+def fetch_entry(spec: Dict[str, str], load: Callable[[Dict[str, str]], List[Dict[str, Any]]],
+                timeout: float | None = None) -> Dict[str, Any]:
+    """
+    Загрузить борд и положить в кэш; одновременные вызовы для одного борда
+    ждут одну загрузку. С общим хранилищем то же и между процессами: если борд
+    уже грузит другой воркер, ждём его запись. Нужен app context (store_tiles).
+    """
+    key = cache_key(spec["engine"], spec["market"], spec["board"])
+    wait = 20.0 if timeout is None else timeout
+
+    def _fetch():
+        store = get_store()
+        started = time.time()
+        if not store.acquire(key, ttl=wait):
+            entry = _wait_for_peer(store, key, started, wait)
+            if entry is not None:
+                return entry
+        try:
+            entry = store_tiles(spec["engine"], spec["market"], spec["board"], load(spec))
+        finally:
+            store.release(key)
+        refresh_errors.pop(key, None)
+        return entry
+
+    return flights.do(key, _fetch, timeout=timeout)
+
+
+def _wait_for_peer(store: TileStore, key: str, started: float, timeout: float) -> Optional[Dict[str, Any]]:
+    """Ждём, пока другой процесс положит запись новее started; None — не дождались, грузим сами."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        entry = store.get(key)
+        if entry is not None and entry.get("fetched_at", 0) >= started:
+            return entry
+        time.sleep(0.1)
+    return None
+
+
+def refresh_in_background(app: Flask, submit: Callable[..., Any], spec: Dict[str, str],
+                          load: Callable[[Dict[str, str]], List[Dict[str, Any]]]) -> bool:
+    """
+    Фоновое обновление устаревшей записи через submit (пул потоков).
+    Если обновление этого борда уже идёт — ничего не делаем. Ошибка не трогает
+    старую запись: она продолжает отдаваться до TILES_STALE_MAX_AGE.
+    """
+    key = cache_key(spec["engine"], spec["market"], spec["board"])
+    with _refreshing_lock:
+        if key in _refreshing or flights.in_flight(key):
+            return False
+        _refreshing.add(key)
+
+    def _run():
+        try:
+            with app.app_context():
+                # Пока задача ждала в очереди, борд мог обновить синхронный запрос
+                cached = get_store().get(key)
+                if cached is None or not is_fresh(cached):
+                    fetch_entry(spec, load)
+        except Exception as exc:
+            refresh_errors[key] = str(exc) or exc.__class__.__name__
+            log.warning("background refresh of %s failed, serving stale: %s", spec["board"], exc)
+        finally:
+            with _refreshing_lock:
+                _refreshing.discard(key)
+
+    try:
+        submit(_run)
+    except Exception:
+        with _refreshing_lock:
+            _refreshing.discard(key)
+        raise
+    return True
+
+
+def load_tiles(client, spec: Dict[str, str], columnar: bool = False) -> List[Dict[str, Any]]:
+    """
+    MOEX -> плитки для одного борда (без Flask-контекста, можно звать из пула потоков).
+    columnar=True — колоночный путь (используется, только если установлен NumPy).
+    """
+    if columnar and heatmap_service.np is not None:
+        data = client.get_board_columns(spec["engine"], spec["market"], spec["board"])
+        return _heatmap.compute_tile_columns(data["columns"], data["size"]).to_dicts()
+    data = client.get_board_data(spec["engine"], spec["market"], spec["board"])
+    return _heatmap.compute_tiles(data["rows"])
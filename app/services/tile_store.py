@@ -0,0 +1,236 @@
+# app/services/tile_store.py
+"""
+Хранилища записей плиток (общий интерфейс для tile_cache):
+- memory — Flask-Caching текущего процесса (как раньше, по умолчанию);
+- file   — каталог на диске, общий для всех воркеров одной машины, без внешних сервисов;
+- redis  — для нескольких машин (нужен пакет redis).
+
+Запись = метаданные {"version", "fetched_at", "expires_at"} + блоб плиток.
+Блоб меняется атомарно (файл: write tmp + os.replace; redis: MULTI), читатель
+сначала сверяет дешёвые метаданные и декодирует блоб только при смене version —
+один раз на версию в каждом процессе, дальше отдаёт тот же список без копий.
+
+acquire/release — межпроцессная блокировка обновления борда: грузит из MOEX
+один воркер (или коллектор), остальные ждут появления записи.
+"""
+
+from __future__ import annotations
+import errno
+import json
+import os
+import threading
+import time
+import uuid
+from abc import ABC, abstractmethod
+from typing import Any, Dict, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows: блокировка только внутри процесса
+    fcntl = None
+
+try:
+    import redis
+except ImportError:  # pragma: no cover - redis необязателен
+    redis = None
+
+
+def _dumps(obj: Any) -> bytes:
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":"), default=str).encode("utf-8")
+
+
+class TileStore(ABC):
+    """Интерфейс: get/set записи {"tiles", "version", "fetched_at"} и блокировка обновления."""
+
+    shared = False  # видят ли запись другие процессы
+
+    @abstractmethod
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        ...
+
+    @abstractmethod
+    def set(self, key: str, entry: Dict[str, Any], timeout: int) -> None:
+        ...
+
+    def acquire(self, key: str, ttl: float) -> bool:
+        return True
+
+    def release(self, key: str) -> None:
+        pass
+
+
+class MemoryTileStore(TileStore):
+    """Кэш процесса через Flask-Caching (CACHE_TYPE из конфига)."""
+
+    def __init__(self, cache) -> None:
+        self.cache = cache
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        return self.cache.get(key)
+
+    def set(self, key: str, entry: Dict[str, Any], timeout: int) -> None:
+        self.cache.set(key, entry, timeout=timeout)
+
+
+class _DecodedMemo:
+    """Декодированные плитки по ключу: повторно декодируем только при смене version."""
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._data: Dict[str, Tuple[Any, list]] = {}  # key -> (метка, tiles)
+
+    def get(self, key: str, mark: Any) -> Optional[list]:
+        with self._lock:
+            item = self._data.get(key)
+        return item[1] if item is not None and item[0] == mark else None
+
+    def put(self, key: str, mark: Any, tiles: list) -> None:
+        with self._lock:
+            self._data[key] = (mark, tiles)
+
+
+class FileTileStore(TileStore):
+    """
+    Файл на борд: первая строка — метаданные JSON, дальше — плитки JSON.
+    Замена файла атомарна (os.replace), поэтому читатель видит либо старую, либо новую версию.
+    Перед чтением — только stat(): если файл не менялся, отдаём уже декодированную запись.
+    """
+
+    shared = True
+
+    def __init__(self, directory: str) -> None:
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self._memo = _DecodedMemo()
+        self._stat: Dict[str, Tuple[Tuple[int, int, int], Dict[str, Any]]] = {}
+        self._locks: Dict[str, int] = {}
+
+    def _path(self, key: str, suffix: str = ".tiles") -> str:
+        return os.path.join(self.directory, key.replace(":", "_") + suffix)
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        path = self._path(key)
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            return None
+        mark = (st.st_ino, st.st_mtime_ns, st.st_size)
+        known = self._stat.get(key)
+        if known is not None and known[0] == mark:
+            meta, tiles = known[1], self._memo.get(key, known[1]["version"])
+        else:
+            meta, tiles = None, None
+        if meta is None or tiles is None:
+            try:
+                with open(path, "rb") as f:
+                    meta = json.loads(f.readline())
+                    tiles = self._memo.get(key, meta["version"])
+                    if tiles is None:
+                        tiles = json.loads(f.read())
+                        self._memo.put(key, meta["version"], tiles)
+            except (OSError, ValueError):
+                return None
+            self._stat[key] = (mark, meta)
+        if meta["expires_at"] < time.time():
+            return None
+        return {"tiles": tiles, "version": meta["version"], "fetched_at": meta["fetched_at"]}
+
+    def set(self, key: str, entry: Dict[str, Any], timeout: int) -> None:
+        meta = {"version": entry["version"], "fetched_at": entry["fetched_at"], "expires_at": time.time() + timeout}
+        path = self._path(key)
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(_dumps(meta) + b"\n")
+            f.write(_dumps(entry["tiles"]))
+        os.replace(tmp, path)
+        self._memo.put(key, entry["version"], entry["tiles"])
+
+    def acquire(self, key: str, ttl: float) -> bool:
+        # flock снимается ядром, если процесс-владелец умер — «вечных» блокировок нет
+        if fcntl is None:
+            return True
+        fd = os.open(self._path(key, ".lock"), os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError as exc:
+            os.close(fd)
+            if exc.errno in (errno.EAGAIN, errno.EACCES):
+                return False
+            raise
+        self._locks[key] = fd
+        return True
+
+    def release(self, key: str) -> None:
+        fd = self._locks.pop(key, None)
+        if fd is not None:
+            fcntl.flock(fd, fcntl.LOCK_UN)
+            os.close(fd)
+
+
+class RedisTileStore(TileStore):
+    """
+    Два ключа на борд: <key>:meta (маленький JSON) и <key>:tiles (блоб), пишутся одной транзакцией.
+    Читатель берёт meta и тянет блоб только при смене version.
+    Блокировка — SET NX EX со случайным токеном владельца; снимается Lua-скриптом «сравнить и
+    удалить», так что истёкшая у нас и уже взятая соседом блокировка не будет удалена.
+    """
+
+    shared = True
+
+    _RELEASE = """
+    if redis.call("get", KEYS[1]) == ARGV[1] then
+        return redis.call("del", KEYS[1])
+    end
+    return 0
+    """
+
+    def __init__(self, url: str) -> None:
+        if redis is None:
+            raise RuntimeError("TILE_STORE=redis requires the redis package (pip install redis)")
+        self.client = redis.Redis.from_url(url)
+        self._memo = _DecodedMemo()
+        self._token = uuid.uuid4().hex  # уникален между машинами, в отличие от pid
+        self._release = self.client.register_script(self._RELEASE)
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        raw = self.client.get(f"{key}:meta")
+        if raw is None:
+            return None
+        meta = json.loads(raw)
+        tiles = self._memo.get(key, meta["version"])
+        if tiles is None:
+            blob = self.client.get(f"{key}:tiles:{meta['version']}")
+            if blob is None:
+                return None
+            tiles = json.loads(blob)
+            self._memo.put(key, meta["version"], tiles)
+        return {"tiles": tiles, "version": meta["version"], "fetched_at": meta["fetched_at"]}
+
+    def set(self, key: str, entry: Dict[str, Any], timeout: int) -> None:
+        # Блоб адресуется версией: читатель, успевший взять старую meta, дочитает старый блоб
+        meta = {"version": entry["version"], "fetched_at": entry["fetched_at"]}
+        pipe = self.client.pipeline(transaction=True)
+        pipe.set(f"{key}:tiles:{entry['version']}", _dumps(entry["tiles"]), ex=timeout)
+        pipe.set(f"{key}:meta", _dumps(meta), ex=timeout)
+        pipe.execute()
+        self._memo.put(key, entry["version"], entry["tiles"])
+
+    def acquire(self, key: str, ttl: float) -> bool:
+        return bool(self.client.set(f"{key}:lock", self._token, nx=True, ex=max(1, int(ttl))))
+
+    def release(self, key: str) -> None:
+        self._release(keys=[f"{key}:lock"], args=[self._token])
+
+
+def make_store(kind: str, cache=None, directory: str | None = None, url: str | None = None) -> TileStore:
+    if kind == "memory":
+        return MemoryTileStore(cache)
+    if kind == "file":
+        if not directory:
+            raise ValueError("TILE_STORE=file requires TILE_STORE_DIR")
+        return FileTileStore(directory)
+    if kind == "redis":
+        if not url:
+            raise ValueError("TILE_STORE=redis requires TILE_STORE_URL")
+        return RedisTileStore(url)
+    raise ValueError(f"unknown tile store: {kind}")
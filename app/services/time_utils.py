@@ -1,6 +1,6 @@
 # app/services/time_utils.py
 from __future__ import annotations
-from datetime import datetime
+from datetime import date, datetime, time, timedelta
 
 def parse_iso_utc(s: str | None) -> datetime | None:
     """
@@ -16,3 +16,29 @@ def parse_iso_utc(s: str | None) -> datetime | None:
         return datetime.fromisoformat(s)  # YYYY-MM-DD HH:MM[:SS]
     except Exception:
         return None
+
+
+# Московское время — UTC+3 круглый год
+MSK_OFFSET = timedelta(hours=3)
+# Основная + вечерняя сессии MOEX (МСК), пн–пт
+TRADING_HOURS_MSK = (time(9, 50), time(23, 50))
+
+
+def is_trading_time(now_utc: datetime | None = None,
+                    hours_msk: tuple[time, time] = TRADING_HOURS_MSK) -> bool:
+    """Грубая проверка «идут ли торги»: будний день и время МСК внутри окна."""
+    msk = (now_utc or datetime.utcnow()) + MSK_OFFSET
+    if msk.weekday() >= 5:
+        return False
+    start, end = hours_msk
+    return start <= msk.time() <= end
+
+
+def session_day(now_utc: datetime | None = None, roll_msk: time = time(0, 0)) -> date:
+    """
+    Торговый день, к которому относится момент: сутки МСК, начинающиеся в roll_msk.
+    Для фондового рынка это календарная дата (roll утром), у срочного день начинается
+    вечером накануне — метка тогда на день раньше, но смена ключа приходится ровно на roll.
+    """
+    msk = (now_utc or datetime.utcnow()) + MSK_OFFSET
+    return (msk - timedelta(hours=roll_msk.hour, minutes=roll_msk.minute)).date()
@@ -0,0 +1,118 @@
+# app/services/treemap.py
+"""
+Treemap теплокарты: площадь плитки — оборот (valtoday), цвет — изменение цены.
+- squarify — раскладка Bruls–Huizing–van Wijk («squarified treemap»): веса по убыванию
+  укладываются рядами вдоль короткой стороны, ряд растёт, пока худшее соотношение сторон
+  в нём не начнёт ухудшаться; O(n) после сортировки;
+- change_color — та же шкала, что у плиток на странице (gradientForChange в scripts.js):
+  зелёный/красный, темнее с ростом |изменения| до ±8%;
+- build_treemap — компактный колоночный ответ для canvas: прямоугольники плоским массивом
+  целых [x, y, w, h, ...] в координатах width×height (клиент только масштабирует) и цвета
+  числами 0xRRGGBB. Считается один раз на версию данных борда (ETag + кэш тела ответа),
+  у клиентов раскладка не повторяется.
+Бумаги без оборота площади не получают — их число возвращается в hidden.
+"""
+
+from __future__ import annotations
+import colorsys
+from typing import Any, Dict, List, Sequence, Tuple
+
+Rect = Tuple[float, float, float, float]  # x, y, w, h
+
+# Шкала цвета — как в gradientForChange (static/js/scripts.js)
+COLOR_MAX_PCT = 8.0
+NEUTRAL_COLOR = 0x2B2F36  # нет изменения (нет сделок) — фон плитки из styles.css
+
+
+def _worst(total: float, smallest: float, largest: float, side: float) -> float:
+    """Худшее соотношение сторон в ряду с суммой total вдоль стороны side."""
+    s2, l2 = total * total, side * side
+    return max(l2 * largest / s2, s2 / (l2 * smallest))
+
+
+def squarify(values: Sequence[float], x: float, y: float, width: float, height: float) -> List[Rect]:
+    """
+    Прямоугольники для values (по убыванию, > 0) в области x, y, width, height.
+    Площадь прямоугольника пропорциональна значению; порядок результата — порядок values.
+    """
+    total = float(sum(values))
+    if not values or total <= 0 or width <= 0 or height <= 0:
+        return []
+    scale = width * height / total
+    areas = [v * scale for v in values]
+    rects: List[Rect] = []
+    i, n = 0, len(areas)
+    while i < n:
+        side = min(width, height)
+        if side <= 0:  # погрешность float на последних рядах — остаток нулевой площади
+            rects.extend((x, y, 0.0, 0.0) for _ in range(n - i))
+            break
+        row_sum = smallest = largest = areas[i]
+        worst = _worst(row_sum, smallest, largest, side)
+        j = i + 1
+        while j < n:
+            a = areas[j]
+            candidate = _worst(row_sum + a, min(smallest, a), max(largest, a), side)
+            if candidate > worst:
+                break
+            row_sum += a
+            smallest, largest, worst = min(smallest, a), max(largest, a), candidate
+            j += 1
+        if width >= height:  # ряд — столбец у левого края
+            col = row_sum / height
+            pos = y
+            for a in areas[i:j]:
+                h = a / col
+                rects.append((x, pos, col, h))
+                pos += h
+            x, width = x + col, width - col
+        else:                # ряд — строка у верхнего края
+            row = row_sum / width
+            pos = x
+            for a in areas[i:j]:
+                w = a / row
+                rects.append((pos, y, w, row))
+                pos += w
+            y, height = y + row, height - row
+        i = j
+    return rects
+
+
+def change_color(pct: float | None) -> int:
+    """Изменение в % -> цвет 0xRRGGBB (верх градиента плитки)."""
+    if pct is None or pct != pct:
+        return NEUTRAL_COLOR
+    c = max(-COLOR_MAX_PCT, min(COLOR_MAX_PCT, float(pct)))
+    intensity = abs(c) / COLOR_MAX_PCT
+    hue = 140 if c >= 0 else 0
+    lightness = 60 - (60 - 16) * intensity
+    r, g, b = colorsys.hls_to_rgb(hue / 360.0, lightness / 100.0, 0.70)
+    return (round(r * 255) << 16) | (round(g * 255) << 8) | round(b * 255)
+
+
+def build_treemap(tiles: List[Dict[str, Any]], width: int = 1600, height: int = 900) -> Dict[str, Any]:
+    """
+    Плитки -> {"width", "height", "n", "hidden", "valtoday", "secid", "name", "change",
+    "rects": [x, y, w, h, ...], "colors": [0xRRGGBB, ...]}; порядок — по убыванию оборота.
+    Края прямоугольников округляются до целых, так что соседние плитки стыкуются без щелей.
+    """
+    weighted = [t for t in tiles if (t.get("valtoday") or 0) > 0]
+    weighted.sort(key=lambda t: t["valtoday"], reverse=True)
+    rects = squarify([float(t["valtoday"]) for t in weighted], 0, 0, width, height)
+
+    flat: List[int] = []
+    for x, y, w, h in rects:
+        x0, y0 = round(x), round(y)
+        flat.extend((x0, y0, round(x + w) - x0, round(y + h) - y0))
+    return {
+        "width": width,
+        "height": height,
+        "n": len(weighted),
+        "hidden": len(tiles) - len(weighted),
+        "valtoday": sum(float(t["valtoday"]) for t in weighted),
+        "secid": [t["secid"] for t in weighted],
+        "name": [t.get("name") or t["secid"] for t in weighted],
+        "change": [None if t.get("change") is None else round(t["change"], 2) for t in weighted],
+        "rects": flat,
+        "colors": [change_color(t.get("change")) for t in weighted],
+    }
@@ -24,14 +24,207 @@ function gradientForChange(pct) {
   return `linear-gradient(180deg, ${col1} 0%, ${col2} 100%)`;
 }
 
+function paintTile(el) {
+  const ch = parseFloat(el.dataset.change);
+  if (!Number.isFinite(ch)) return;  // пропускаем "—"
+  el.style.background = gradientForChange(ch);
+
+  // Контраст текста: при очень светлом фоне делаем текст тёмным (редкий случай около 0%)
+  // Но в нашей шкале фон почти всегда тёмный -> оставляем белый.
+  // Если захочешь адаптивно — можно посчитать l1 и менять color при l1>50.
+}
+
+// ---------- treemap (раскладка и цвета — с сервера, /market/api/treemap) ----------
+
+const treemaps = new Map();  // board -> {canvas, data, timer}
+
+function drawTreemap(tm) {
+  const {canvas, data} = tm;
+  if (!data) return;
+  if (!data.n) { canvas.style.display = 'none'; return; }
+  canvas.style.display = '';
+  // Раскладка в координатах width×height сервера — только масштабируем под ширину canvas
+  const cssWidth = canvas.clientWidth;
+  const cssHeight = Math.round(cssWidth * data.height / data.width);
+  const dpr = window.devicePixelRatio || 1;
+  canvas.style.height = cssHeight + 'px';
+  canvas.width = Math.round(cssWidth * dpr);
+  canvas.height = Math.round(cssHeight * dpr);
+  const k = cssWidth / data.width;
+  const ctx = canvas.getContext('2d');
+  ctx.setTransform(dpr * k, 0, 0, dpr * k, 0, 0);
+
+  const r = data.rects;
+  for (let i = 0; i < data.n; i++) {
+    ctx.fillStyle = '#' + data.colors[i].toString(16).padStart(6, '0');
+    ctx.fillRect(r[4 * i], r[4 * i + 1], r[4 * i + 2], r[4 * i + 3]);
+  }
+  // Границы плиток и подписи — в CSS-пикселях, чтобы текст не масштабировался вместе с раскладкой
+  ctx.setTransform(dpr, 0, 0, dpr, 0, 0);
+  ctx.strokeStyle = 'rgba(0,0,0,.35)';
+  ctx.lineWidth = 1;
+  ctx.fillStyle = '#fff';
+  ctx.textAlign = 'center';
+  ctx.textBaseline = 'middle';
+  for (let i = 0; i < data.n; i++) {
+    const x = r[4 * i] * k, y = r[4 * i + 1] * k, w = r[4 * i + 2] * k, h = r[4 * i + 3] * k;
+    if (w >= 4 && h >= 4) ctx.strokeRect(x + .5, y + .5, w - 1, h - 1);
+    if (w < 36 || h < 14) continue;
+    const size = clamp(Math.floor(Math.min(w / 4, h / 3)), 10, 28);
+    ctx.font = `700 ${size}px system-ui, sans-serif`;
+    const change = data.change[i];
+    if (h >= 2.2 * size + 6 && change !== null) {
+      ctx.fillText(data.secid[i], x + w / 2, y + h / 2 - size * .55, w - 4);
+      ctx.font = `${Math.round(size * .8)}px system-ui, sans-serif`;
+      ctx.fillText(change.toFixed(2) + '%', x + w / 2, y + h / 2 + size * .6, w - 4);
+    } else {
+      ctx.fillText(data.secid[i], x + w / 2, y + h / 2, w - 4);
+    }
+  }
+}
+
+function treemapHit(tm, ev) {
+  const {canvas, data} = tm;
+  if (!data) return -1;
+  const rect = canvas.getBoundingClientRect();
+  const k = data.width / rect.width;
+  const px = (ev.clientX - rect.left) * k, py = (ev.clientY - rect.top) * k;
+  const r = data.rects;
+  for (let i = 0; i < data.n; i++) {
+    if (px >= r[4 * i] && px < r[4 * i] + r[4 * i + 2] && py >= r[4 * i + 1] && py < r[4 * i + 1] + r[4 * i + 3]) return i;
+  }
+  return -1;
+}
+
+async function loadTreemap(tm) {
+  try {
+    // ETag/304 отдаёт браузер: пока версия данных борда та же, тело не пересылается
+    const resp = await fetch(tm.canvas.dataset.treemapUrl, {headers: {'Accept': 'application/json'}});
+    if (!resp.ok) {
+      if (resp.status === 404) tm.canvas.style.display = 'none';  // нет снимка борда на этот момент
+      return;
+    }
+    tm.data = await resp.json();
+    drawTreemap(tm);
+  } catch (e) { /* сеть — оставляем прошлую картинку */ }
+}
+
+function initTreemap(canvas) {
+  const tm = {canvas, data: null, timer: null};
+  treemaps.set(canvas.dataset.board, tm);
+  canvas.addEventListener('mousemove', ev => {
+    const i = treemapHit(tm, ev);
+    const d = tm.data;
+    canvas.title = i < 0 ? '' : `${d.secid[i]} — ${d.name[i]}: ` +
+      (d.change[i] === null ? '—' : d.change[i].toFixed(2)) + '%';
+  });
+  loadTreemap(tm);
+}
+
+function refreshTreemap(board) {
+  // Обновления SSE приходят пачками — одна перезагрузка раскладки на секунду
+  const tm = treemaps.get(board);
+  if (!tm || tm.timer) return;
+  tm.timer = setTimeout(() => { tm.timer = null; loadTreemap(tm); }, 1000);
+}
+
+// ---------- список плиток: сетка догружается при первом раскрытии <details> ----------
+
+async function loadGrid(details) {
+  details.dataset.loaded = 'loading';
+  try {
+    const resp = await fetch(details.dataset.gridUrl, {headers: {'Accept': 'text/html'}});
+    if (!resp.ok) throw new Error(resp.status);
+    details.insertAdjacentHTML('beforeend', await resp.text());
+    details.querySelectorAll('.tile').forEach(paintTile);
+    details.dataset.loaded = '1';
+  } catch (e) {
+    delete details.dataset.loaded;  // сеть/ошибка — попробуем при следующем раскрытии
+  }
+}
+
+function initTilesList(details) {
+  details.addEventListener('toggle', () => {
+    if (details.open && !details.dataset.loaded) loadGrid(details);
+  });
+}
+
+// ---------- живое обновление (SSE /market/stream) ----------
+
+function createTile(t) {
+  const el = document.createElement('div');
+  el.className = 'tile';
+  el.dataset.secid = t.secid;
+  el.innerHTML = '<div class="tile-head"></div><div class="tile-name"></div><div class="tile-num"></div>';
+  el.querySelector('.tile-head').textContent = t.secid;
+  el.querySelector('.tile-name').textContent = t.name || '';
+  return el;
+}
+
+function patchTile(el, t) {
+  const hasChange = t.change !== null && t.change !== undefined;
+  const change = hasChange ? Number(t.change).toFixed(6) : '';
+  const title = `${t.secid}: ${t.last}`;
+  if (el.dataset.change === change && el.title === title) return;  // полный снимок: плитка не менялась
+  el.dataset.change = change;
+  el.title = title;
+  el.querySelector('.tile-num').textContent = (hasChange ? Number(t.change).toFixed(2) : '—') + '%';
+  paintTile(el);
+  el.classList.add('tile-flash');
+  setTimeout(() => el.classList.remove('tile-flash'), 800);
+}
+
+function applyBoard(board, data, full) {
+  // Сетки нет, пока список не раскрыт: её HTML при загрузке уже будет свежим
+  const grid = document.querySelector(`.grid[data-board="${board}"]`);
+  if (!grid) return;
+  const bySecid = new Map();
+  grid.querySelectorAll('.tile[data-secid]').forEach(el => bySecid.set(el.dataset.secid, el));
+
+  data.tiles.forEach(t => {
+    let el = bySecid.get(t.secid);
+    if (!el) {
+      el = createTile(t);
+      grid.appendChild(el);
+    }
+    bySecid.delete(t.secid);
+    patchTile(el, t);
+  });
+  // Полный снимок: всё, чего в нём нет, пропало с борда
+  const gone = full ? Array.from(bySecid.keys()) : (data.removed || []);
+  gone.forEach(secid => {
+    const el = grid.querySelector(`.tile[data-secid="${CSS.escape(secid)}"]`);
+    if (el) el.remove();
+  });
+}
+
+function connectLive(statusEl) {
+  if (!window.EventSource) return;
+  const source = new EventSource(statusEl.dataset.streamUrl);
+  const handle = full => ev => {
+    const msg = JSON.parse(ev.data);
+    Object.entries(msg.boards).forEach(([board, data]) => {
+      applyBoard(board, data, full);
+      refreshTreemap(board);
+    });
+    statusEl.textContent = 'live: ' + new Date().toLocaleTimeString();
+  };
+  source.addEventListener('snapshot', handle(true));
+  source.addEventListener('tiles', handle(false));
+  source.onopen = () => { statusEl.textContent = 'live: подключено'; };
+  // EventSource переподключается сам; после переподключения сервер пришлёт полный снимок
+  source.onerror = () => { statusEl.textContent = 'live: переподключение…'; };
+}
+
 document.addEventListener('DOMContentLoaded', () => {
-  document.querySelectorAll('.tile').forEach(el => {
-    const ch = parseFloat(el.dataset.change);
-    if (!Number.isFinite(ch)) return;  // пропускаем "—"
-    el.style.background = gradientForChange(ch);
-
-    // Контраст текста: при очень светлом фоне делаем текст тёмным (редкий случай около 0%)
-    // Но в нашей шкале фон почти всегда тёмный -> оставляем белый.
-    // Если захочешь адаптивно — можно посчитать l1 и менять color при l1>50.
+  document.querySelectorAll('canvas.treemap[data-treemap-url]').forEach(initTreemap);
+  document.querySelectorAll('details.tiles-list[data-grid-url]').forEach(initTilesList);
+  let resizeTimer = null;
+  window.addEventListener('resize', () => {
+    clearTimeout(resizeTimer);
+    resizeTimer = setTimeout(() => treemaps.forEach(drawTreemap), 100);
   });
+
+  const live = document.querySelector('.live-status[data-stream-url]');
+  if (live) connectLive(live);
 });
@@ -0,0 +1,71 @@
+# benchmarks/bench_tiles.py
+"""
+Построчный vs колоночный путь: ответ ISS -> плитки (list[dict]).
+Проверяет, что результаты совпадают, и печатает время на размерах
+реальных бордов и на синтетических 50k строк.
+Запуск: python -m benchmarks.bench_tiles [--repeat 20]
+"""
+import argparse
+import math
+import time
+
+from app.services import heatmap_service
+from app.services.heatmap_service import HeatmapService
+from app.services.moex_client import MoexClient
+from benchmarks.synthetic import iss_board_payload
+
+SIZES = [("TQBR", 260), ("RFUD", 600), ("SYNTH", 50_000)]
+
+
+def rows_path(payload):
+    return HeatmapService().compute_tiles(MoexClient.merge_rows(payload))
+
+
+def columnar_path(payload):
+    data = MoexClient.merge_columns(payload)
+    return HeatmapService().compute_tile_columns(data["columns"], data["size"]).to_dicts()
+
+
+def same_tiles(a, b) -> bool:
+    """Сравнение с учётом NaN (NaN != NaN, но в плитках это одно и то же значение)."""
+    if len(a) != len(b):
+        return False
+    for x, y in zip(a, b):
+        if list(x) != list(y):
+            return False
+        for k in x:
+            vx, vy = x[k], y[k]
+            if isinstance(vx, float) and isinstance(vy, float) and math.isnan(vx) and math.isnan(vy):
+                continue
+            if vx != vy or type(vx) is not type(vy):
+                return False
+    return True
+
+
+def best_of(fn, payload, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn(payload)
+        best = min(best, time.perf_counter() - started)
+    return best * 1000.0
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    print(f"numpy: {'yes' if heatmap_service.np is not None else 'no (columnar = fallback)'}")
+    print(f"{'board':<8}{'rows':>8}{'rows, ms':>12}{'columnar, ms':>15}{'speedup':>10}  identical")
+    for board, size in SIZES:
+        payload = iss_board_payload(board, size)
+        identical = same_tiles(rows_path(payload), columnar_path(payload))
+        repeat = max(3, args.repeat // 5) if size > 10_000 else args.repeat
+        t_rows = best_of(rows_path, payload, repeat)
+        t_cols = best_of(columnar_path, payload, repeat)
+        print(f"{board:<8}{size:>8}{t_rows:>12.2f}{t_cols:>15.2f}{t_rows / t_cols:>9.2f}x  {identical}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+# benchmarks/bulk_collect.py
+"""
+Один цикл массового коллектора против локальной заглушки ISS (benchmarks.stub_iss):
+справочник -> ≈40 бордов -> снимки во временной БД. Печатает время цикла, число бордов,
+пиковую конкурентность к хосту и фактический темп запросов; код выхода 1, если цикл
+не уложился в FETCH_BOARD_TIMEOUT (таймаут одного запроса страницы) или часть бордов не собралась.
+Запуск: python -m benchmarks.bulk_collect [--latency 0.2] [--rate 20] [--concurrency 8]
+"""
+import argparse
+import atexit
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+_TMP = tempfile.mkdtemp(prefix="moex-bulk-")
+atexit.register(shutil.rmtree, _TMP, True)
+os.environ["FLASK_DB_URL"] = f"sqlite:///{os.path.join(_TMP, 'bulk.sqlite3')}"
+
+from benchmarks.stub_iss import start_stub  # noqa: E402
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--latency", type=float, default=0.2)
+    parser.add_argument("--rate", type=float, default=20.0, help="ISS_RATE_LIMIT, запросов/с")
+    parser.add_argument("--concurrency", type=int, default=8, help="ISS_MAX_CONCURRENCY")
+    parser.add_argument("--cycles", type=int, default=2)
+    args = parser.parse_args()
+
+    server, state, base = start_stub(args.latency)
+    os.environ.update({
+        "ISS_BASE_URL": base,
+        "COLLECTOR_DISCOVER": "stock,currency,futures",
+        "ISS_RATE_LIMIT": str(args.rate),
+        "ISS_MAX_CONCURRENCY": str(args.concurrency),
+        "COLLECTOR_MODE": "off",
+    })
+
+    from app import create_app
+    from app.services.collector import SnapshotCollector
+    from app.services.init_db import create_all_tables
+    from app.services.models import Snapshot
+    from app.services.repository import MoexRepository
+    from sqlalchemy import func, select
+
+    create_all_tables()
+    app = create_app()
+    collector = SnapshotCollector(app)
+    budget = app.config["FETCH_BOARD_TIMEOUT"]
+
+    failed = False
+    for cycle in range(1, args.cycles + 1):
+        state.requests.clear()
+        state.max_active = 0
+        started = time.perf_counter()
+        collector.run_once()
+        elapsed = time.perf_counter() - started
+        boards = collector.status()["boards"]
+        ok = [code for code, st in boards.items() if st["last_error"] is None and st["last_ok"]]
+        times = sorted(t for t, _ in state.requests)
+        span = times[-1] - times[0] if len(times) > 1 else 0
+        print(f"cycle {cycle}: {elapsed:.2f} s, boards ok {len(ok)}/{len(boards)}, "
+              f"requests {len(times)}, peak concurrency {state.max_active}, "
+              f"rate {len(times) / span if span else float('inf'):.1f}/s")
+        failed |= elapsed > budget or len(ok) < len(boards)
+
+    repo = MoexRepository()
+    try:
+        written = repo.session.scalar(select(func.count(Snapshot.id)))
+        print(f"snapshots written: {written} ({len(collector.target_boards())} boards x {args.cycles} cycles, "
+              f"unchanged snapshots are deduplicated)")
+    finally:
+        repo.close()
+    collector.bulk.close()
+    server.shutdown()
+    if failed:
+        print(f"FAILED: cycle over {budget:.0f}s or boards missing")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
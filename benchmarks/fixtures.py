@@ -0,0 +1,88 @@
+# benchmarks/fixtures.py
+"""
+Фикстуры ответов ISS для офлайн-бенчмарков.
+Записанные ответы лежат в benchmarks/fixtures/<BOARD>.json (см. benchmarks.record_fixtures,
+по умолчанию урезаны до --limit бумаг); если файла нет, берётся синтетический ответ того же
+формата и типичного размера борда. Источник попадает в отчёт ('recorded:<хэш>' | 'synthetic'),
+и --compare не сравнивает прогоны на разных данных.
+FixtureTransport подменяет HTTP-транспорт MoexClient: отдаёт байты фикстуры
+через json.loads, так что в замер попадает и разбор JSON, как в проде. Параметры
+iss.only / <таблица>.columns учитываются, как у ISS (опрос только marketdata — меньше байт).
+"""
+
+from __future__ import annotations
+import hashlib
+import json
+import os
+from typing import Any, Dict, Tuple
+
+from benchmarks.synthetic import iss_board_payload, select_tables
+
+FIXTURES_DIR = os.path.join(os.path.dirname(__file__), "fixtures")
+
+# Типичный размер борда — для синтетической замены записи
+BOARD_SIZES = {"TQBR": 260, "RFUD": 600}
+
+
+def fixture_path(board: str) -> str:
+    return os.path.join(FIXTURES_DIR, f"{board}.json")
+
+
+def load_raw(board: str, size: int | None = None) -> Tuple[bytes, str]:
+    """(сырые байты ответа ISS, источник: 'recorded:<хэш файла>' | 'synthetic')."""
+    path = fixture_path(board)
+    if size is None and os.path.exists(path):
+        with open(path, "rb") as f:
+            raw = f.read()
+        return raw, "recorded:" + hashlib.blake2b(raw, digest_size=6).hexdigest()
+    payload = iss_board_payload(board, size or BOARD_SIZES.get(board, 260))
+    return json.dumps(payload, ensure_ascii=False).encode("utf-8"), "synthetic"
+
+
+def trim_payload(data: Dict[str, Any], limit: int) -> Dict[str, Any]:
+    """
+    Ответ ISS, урезанный до первых limit бумаг: строки securities и строки остальных
+    таблиц с теми же SECID (marketdata, marketdata_yields...). Формат не меняется.
+    """
+    keep = None
+    out: Dict[str, Any] = {}
+    for name, table in data.items():
+        if not isinstance(table, dict) or "columns" not in table or "SECID" not in table["columns"]:
+            out[name] = table
+            continue
+        i = table["columns"].index("SECID")
+        if keep is None:
+            keep = {row[i] for row in data.get("securities", table)["data"][:limit]}
+        out[name] = {**table, "data": [row for row in table["data"] if row[i] in keep]}
+    return out
+
+
+def fixture_mismatch(current: Dict[str, str], baseline: Dict[str, str] | None) -> Dict[str, Tuple[Any, Any]]:
+    """{борд: (в базовом прогоне, сейчас)} для бордов, где данные прогонов разные."""
+    baseline = baseline or {}
+    return {board: (baseline.get(board), src) for board, src in current.items() if baseline.get(board) != src}
+
+
+class FixtureTransport:
+    """Транспорт для MoexClient: вместо сети — фикстура по коду борда из URL."""
+
+    def __init__(self, raw_by_board: Dict[str, bytes]) -> None:
+        self.raw_by_board = raw_by_board
+        self._selected: Dict[tuple, bytes] = {}
+
+    def body(self, board: str, params: Dict[str, Any] | None = None) -> bytes:
+        """Байты ответа на запрос с params (выборка таблиц/колонок считается один раз)."""
+        key = (board, tuple(sorted((params or {}).items())))
+        raw = self._selected.get(key)
+        if raw is None:
+            raw = json.dumps(select_tables(json.loads(self.raw_by_board[board]), params),
+                             ensure_ascii=False).encode("utf-8")
+            self._selected[key] = raw
+        return raw
+
+    def get_json(self, url: str, params: Dict[str, Any] | None = None, timeout: float | None = None) -> Any:
+        board = url.split("/boards/")[1].split("/")[0]
+        return json.loads(self.body(board, params))
+
+    def backoff(self, attempt: int) -> float:
+        return 0.0
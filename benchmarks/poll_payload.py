@@ -0,0 +1,71 @@
+# benchmarks/poll_payload.py
+"""
+Опрос борда с кэшем справочных данных и без него против локальной заглушки ISS
+(benchmarks.stub_iss, настоящий HTTP с gzip): байты «по проводу» и после распаковки
+на один опрос, время опроса (запрос + разбор JSON + склейка со справочником)
+и совпадение склеенных строк. Первый опрос с кэшем — полный, он в замер не входит.
+Запуск: python -m benchmarks.poll_payload [--polls 30] [--size 2000]
+"""
+import argparse
+import statistics
+import sys
+import time
+
+from app.services.http_transport import HttpTransport
+from app.services.moex_client import MoexClient
+from benchmarks.stub_iss import start_stub
+
+BOARDS = [("stock", "shares", "TQBR"), ("futures", "forts", "RFUD")]
+
+
+def poll(client: MoexClient, spec, polls: int) -> dict:
+    transport = client.transport
+    client.get_board_data(*spec)  # прогрев: соединение и (с кэшем) справочник
+    before = transport.stats(recent=0)
+    times = []
+    for _ in range(polls):
+        started = time.perf_counter()
+        rows = client.get_board_data(*spec)["rows"]
+        times.append((time.perf_counter() - started) * 1000.0)
+    after = transport.stats(recent=0)
+    return {
+        "wire": (after["bytes_wire"] - before["bytes_wire"]) / polls,
+        "decoded": (after["bytes_decoded"] - before["bytes_decoded"]) / polls,
+        "ms": statistics.median(times),
+        "rows": rows,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--polls", type=int, default=30)
+    parser.add_argument("--size", type=int, default=0, help="размер бордов в заглушке (0 — как в stub_iss)")
+    args = parser.parse_args()
+
+    if args.size:
+        import benchmarks.stub_iss as stub
+        stub.board_size = lambda code: args.size
+    server, _, base = start_stub(latency=0.0)
+
+    failed = False
+    print(f"{'board':<8}{'mode':<12}{'wire, B':>10}{'decoded, B':>12}{'poll, ms':>10}")
+    for spec in BOARDS:
+        results = {}
+        for mode, cached in (("full", False), ("reference", True)):
+            # Свой транспорт на режим — статистика байт не смешивается
+            client = MoexClient(timeout=5, retries=0, transport=HttpTransport(pool_size=2), base=base,
+                                reference_cache=cached)
+            results[mode] = r = poll(client, spec, args.polls)
+            print(f"{spec[2]:<8}{mode:<12}{r['wire']:>10.0f}{r['decoded']:>12.0f}{r['ms']:>10.2f}")
+        full, ref = results["full"], results["reference"]
+        same = full["rows"] == ref["rows"]
+        failed |= not same
+        print(f"{'':<8}{'saved':<12}{1 - ref['wire'] / full['wire']:>10.0%}"
+              f"{1 - ref['decoded'] / full['decoded']:>12.0%}{full['ms'] / ref['ms']:>9.1f}x  rows identical: {same}")
+    server.shutdown()
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,39 @@
+# benchmarks/record_fixtures.py
+"""
+Записывает живые ответы ISS в benchmarks/fixtures/<BOARD>.json — с теми же
+параметрами запроса, что и MoexClient. Нужен доступ к iss.moex.com.
+Ответ урезается до --limit бумаг (0 — весь борд), чтобы фикстуры можно было держать в git.
+Запуск: python -m benchmarks.record_fixtures [--board TQBR --board RFUD] [--limit 120]
+(по умолчанию — борды реестра BOARDS)
+"""
+import argparse
+import json
+import os
+
+from app.config import Config
+from app.services.board_registry import BoardRegistry
+from app.services.moex_client import MoexClient
+from benchmarks.fixtures import FIXTURES_DIR, fixture_path, trim_payload
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--board", action="append", help="код борда (по умолчанию — борды реестра)")
+    parser.add_argument("--limit", type=int, default=120, help="сколько бумаг оставить (0 — все)")
+    args = parser.parse_args()
+    specs = {s["board"]: s for s in BoardRegistry.from_config(Config).specs()}
+
+    client = MoexClient(timeout=30)
+    os.makedirs(FIXTURES_DIR, exist_ok=True)
+    for board in args.board or list(specs):
+        spec = specs.get(board, {"engine": "stock", "market": "shares", "board": board})
+        data = client._request(client._board_url(spec["engine"], spec["market"], board), params=client._board_params())
+        if args.limit:
+            data = trim_payload(data, args.limit)
+        with open(fixture_path(board), "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        print(f"{board}: {len(data['securities']['data'])} бумаг -> {fixture_path(board)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,135 @@
+# benchmarks/startup.py
+"""
+Стоимость старта воркера: каждый замер — отдельный чистый процесс Python
+(кэш импортов не мешает), меряем:
+- import app и create_app();
+- первый запрос без БД (/) и первый запрос в БД (/market/snapshots) — сюда переехал импорт SQLAlchemy;
+- eager-импорт всех тяжёлых сервисов (как было до ленивой инициализации) — для сравнения;
+- RSS процесса после create_app и после запроса в БД, число загруженных модулей.
+
+Запуск:
+  python -m benchmarks.startup [--repeat 15] [--out benchmarks/results/startup.json]
+  python -m benchmarks.startup --compare benchmarks/results/startup-baseline.json
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Код замера в дочернем процессе: печатает JSON с временами (мс), RSS (КБ) и флагами модулей
+PROBE = r"""
+import json, os, sys, time
+def rss_kb():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") // 1024
+    except OSError:
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+out = {}
+t = time.perf_counter()
+if MODE == "eager":
+    import app.services.repository, app.services.moex_client, app.services.heatmap_service  # noqa
+    import app.services.tile_cache, app.services.export_service, app.services.live_stream  # noqa
+    out["import_ms"] = (time.perf_counter() - t) * 1000
+else:
+    import app
+    out["import_ms"] = (time.perf_counter() - t) * 1000
+    t = time.perf_counter()
+    flask_app = app.create_app()
+    out["create_app_ms"] = (time.perf_counter() - t) * 1000
+    out["rss_create_app_kb"] = rss_kb()
+    out["modules_create_app"] = len(sys.modules)
+    out["sqlalchemy_loaded"] = "sqlalchemy" in sys.modules
+    client = flask_app.test_client()
+    for name, path in (("first_request_ms", "/"), ("first_db_request_ms", "/market/snapshots")):
+        t = time.perf_counter()
+        assert client.get(path).status_code == 200, path
+        out[name] = (time.perf_counter() - t) * 1000
+    out["rss_db_request_kb"] = rss_kb()
+print(json.dumps(out))
+"""
+
+
+def probe(mode: str, env: dict) -> dict:
+    code = f"MODE = {mode!r}\n" + PROBE
+    res = subprocess.run([sys.executable, "-c", code], cwd=ROOT, env=env, capture_output=True, text=True, check=True)
+    return json.loads(res.stdout.strip().splitlines()[-1])
+
+
+def run(repeat: int) -> dict:
+    tmp = tempfile.mkdtemp(prefix="moex-startup-")
+    try:
+        env = {**os.environ, "FLASK_DB_URL": f"sqlite:///{os.path.join(tmp, 'startup.sqlite3')}",
+               "COLLECTOR_MODE": "off", "DB_AUTO_INIT": "0"}
+        subprocess.run([sys.executable, "-m", "scripts.create_db"], cwd=ROOT, env=env, check=True,
+                       capture_output=True)
+        lazy = [probe("lazy", env) for _ in range(repeat)]
+        eager = [probe("eager", env) for _ in range(repeat)]
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+    def timing(samples, key):
+        values = [s[key] for s in samples]
+        return {"median_ms": round(statistics.median(values), 3), "best_ms": round(min(values), 3), "n": len(values)}
+
+    results = {
+        "startup.import_app": timing(lazy, "import_ms"),
+        "startup.create_app": timing(lazy, "create_app_ms"),
+        "startup.first_request[/]": timing(lazy, "first_request_ms"),
+        "startup.first_request[db]": timing(lazy, "first_db_request_ms"),
+        "startup.eager_import_services": timing(eager, "import_ms"),
+    }
+    memory = {
+        "rss_create_app_kb": int(statistics.median(s["rss_create_app_kb"] for s in lazy)),
+        "rss_db_request_kb": int(statistics.median(s["rss_db_request_kb"] for s in lazy)),
+        "modules_create_app": lazy[0]["modules_create_app"],
+        "sqlalchemy_loaded_at_create_app": lazy[0]["sqlalchemy_loaded"],
+    }
+    return {
+        "meta": {"created_at": datetime.utcnow().isoformat(timespec="seconds"),
+                 "python": sys.version.split()[0], "repeat": repeat},
+        "results": results,
+        "memory": memory,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=15)
+    parser.add_argument("--out", help="куда сохранить JSON")
+    parser.add_argument("--compare", help="JSON прошлого прогона для сравнения")
+    parser.add_argument("--threshold", type=float, default=0.15)
+    args = parser.parse_args()
+
+    report = run(args.repeat)
+    for name, r in report["results"].items():
+        print(f"{name:<48}{r['median_ms']:>12.3f} ms")
+    for name, value in report["memory"].items():
+        print(f"{name:<48}{value!s:>12}")
+
+    if args.out:
+        os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"saved: {args.out}")
+
+    if args.compare:
+        from benchmarks.suite import compare  # общая логика сравнения с основным набором
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.threshold, min_ms=1.0)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) over {args.threshold:.0%}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
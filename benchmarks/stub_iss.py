@@ -0,0 +1,154 @@
+# benchmarks/stub_iss.py
+"""
+Локальная заглушка ISS MOEX для офлайн-прогонов коллектора:
+- /iss/index.json — справочник engines/markets/boards (≈40 основных торгуемых бордов
+  плюс неосновные и неторгуемые, которые должен отсеять фильтр);
+- /iss/engines/<e>/markets/<m>/boards/<B>/securities.json — синтетический ответ
+  (benchmarks.synthetic) с учётом iss.only и <таблица>.columns, gzip при Accept-Encoding,
+  искусственная задержка сети.
+Считает запросы, пиковое число одновременных запросов и их время — чтобы проверить
+лимиты коллектора.
+
+Запуск отдельно: python -m benchmarks.stub_iss [--port 8089] [--latency 0.2]
+и ISS_BASE_URL=http://127.0.0.1:8089/iss для приложения.
+"""
+import argparse
+import gzip
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlsplit
+
+from benchmarks.synthetic import iss_board_payload, select_tables
+
+ENGINES = [(1, "stock"), (2, "currency"), (4, "futures")]
+MARKETS = [(1, 1, "shares"), (2, 1, "bonds"), (5, 1, "index"), (10, 2, "selt"), (22, 4, "forts"), (24, 4, "options")]
+BOARDS_BY_MARKET = {
+    "shares": ["TQBR", "TQTF", "TQIF", "TQPI", "TQTD", "TQTE", "SMAL", "TQDE"],
+    "bonds": ["TQCB", "TQOB", "TQOD", "TQIR", "TQRD", "TQOY", "TQOE", "TQUD"],
+    "index": ["SNDX", "RTSI", "MMIX", "MOEX"],
+    "selt": ["CETS", "FUTS", "CNGD", "LICU", "CETG"],
+    "forts": ["RFUD", "FIQS", "ROPD", "RFUN", "FORTS_EV", "RFUF"],
+    "options": ["ROPD_O", "RFOP", "OPTW", "OPTM", "OPTQ"],
+}
+SECONDARY = ["EQBR", "EQNE", "PSTQ", "EQOB"]  # неосновные борды рынка shares
+DEAD = ["TQNL", "EQDP"]                        # неторгуемые
+BOARD_URL = re.compile(r"^/iss/engines/([^/]+)/markets/([^/]+)/boards/([^/]+)/securities\.json$")
+
+
+def index_payload() -> dict:
+    markets = {name: mid for mid, _, name in MARKETS}
+    engine_of = {name: eid for mid, eid, name in MARKETS}
+    boards = []
+    for market, codes in BOARDS_BY_MARKET.items():
+        for code in codes:
+            boards.append([engine_of[market], markets[market], code, f"{code} board", 1, 1])
+    boards += [[1, markets["shares"], code, f"{code} secondary", 1, 0] for code in SECONDARY]
+    boards += [[1, markets["shares"], code, f"{code} closed", 0, 1] for code in DEAD]
+    return {
+        "engines": {"columns": ["id", "name"], "data": [list(e) for e in ENGINES]},
+        "markets": {"columns": ["id", "market_name"], "data": [[mid, name] for mid, _, name in MARKETS]},
+        "boards": {"columns": ["engine_id", "market_id", "boardid", "board_title", "is_traded", "is_primary"],
+                   "data": boards},
+    }
+
+
+def board_size(code: str) -> int:
+    return 60 + (sum(map(ord, code)) * 37) % 540
+
+
+class StubState:
+    def __init__(self, latency: float) -> None:
+        self.latency = latency
+        self.lock = threading.Lock()
+        self.active = 0
+        self.max_active = 0
+        self.requests = []  # (время начала, путь)
+        self.fail = set()   # борды, отвечающие 500
+        self._bodies = {}
+
+    def body(self, key: str, build) -> bytes:
+        with self.lock:
+            raw = self._bodies.get(key)
+        if raw is None:
+            raw = json.dumps(build(), ensure_ascii=False).encode("utf-8")
+            with self.lock:
+                self._bodies[key] = raw
+        return raw
+
+
+def make_handler(state: StubState):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"  # keep-alive, как у настоящего ISS
+        disable_nagle_algorithm = True  # заголовки и тело уходят отдельно: без TCP_NODELAY +40 мс на ответ
+
+        def log_message(self, *args):  # тихо
+            pass
+
+        def do_GET(self):
+            parts = urlsplit(self.path)
+            path, params = parts.path, dict(parse_qsl(parts.query))
+            with state.lock:
+                state.active += 1
+                state.max_active = max(state.max_active, state.active)
+                state.requests.append((time.monotonic(), path))
+            try:
+                time.sleep(state.latency)
+                if path == "/iss/index.json":
+                    body = state.body("index", index_payload)
+                else:
+                    m = BOARD_URL.match(path)
+                    if m is None:
+                        return self._send(404, b"{}")
+                    board = m.group(3)
+                    if board in state.fail:
+                        return self._send(500, b"{}")
+                    key = (board, tuple(sorted(params.items())))
+                    body = state.body(key, lambda: select_tables(
+                        iss_board_payload(board, size=board_size(board)), params))
+                self._send(200, body)
+            finally:
+                with state.lock:
+                    state.active -= 1
+
+        def _send(self, status: int, body: bytes) -> None:
+            headers = {"Content-Type": "application/json; charset=utf-8"}
+            if "gzip" in (self.headers.get("Accept-Encoding") or ""):
+                body = gzip.compress(body, compresslevel=1)
+                headers["Content-Encoding"] = "gzip"
+            self.send_response(status)
+            for k, v in headers.items():
+                self.send_header(k, v)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    return Handler
+
+
+def start_stub(latency: float = 0.2, port: int = 0):
+    """Заглушка в фоновом потоке: (server, state, base_url). Остановка — server.shutdown()."""
+    state = StubState(latency)
+    server = ThreadingHTTPServer(("127.0.0.1", port), make_handler(state))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="stub-iss", daemon=True).start()
+    return server, state, f"http://127.0.0.1:{server.server_address[1]}/iss"
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--latency", type=float, default=0.2, help="задержка ответа, сек")
+    args = parser.parse_args()
+    server, _, base = start_stub(args.latency, args.port)
+    print(f"stub ISS: {base} (Ctrl+C — стоп)")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
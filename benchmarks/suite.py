@@ -0,0 +1,256 @@
+# benchmarks/suite.py
+"""
+Набор микробенчмарков горячих путей, полностью офлайн:
+- MoexClient.get_board_data (JSON ISS -> строки): опрос со справочником из кэша и полный ответ
+  ([...,full]), HeatmapService.compute_tiles;
+- SearchService.search по индексу;
+- MoexRepository.add_items, get_tiles_for_snapshot (холодный/из LRU), list_snapshots;
+- рендер parser.html: сетки заново (cold) и из кэша фрагментов (warm), в том числе на 2000 плиток;
+- раскладка treemap (squarify + цвета) на борд и на 2000/20k синтетических бумаг.
+Данные — записанные фикстуры ISS (benchmarks/fixtures) или синтетика того же формата,
+плюс синтетическое масштабирование (SYNTH, 20k бумаг).
+
+Результаты пишутся в JSON; --compare сравнивает с прошлым прогоном и помечает
+регрессии (медиана выросла больше чем на --threshold), код выхода 1 при регрессиях.
+Если данные прогонов разные (фикстура записана заново, в одном из прогонов синтетика) —
+сравнение не делается, код выхода 2 (--allow-fixture-mismatch — сравнить с предупреждением).
+Запуск:
+  python -m benchmarks.suite [--quick] [--out benchmarks/results/run.json]
+  python -m benchmarks.suite --compare benchmarks/results/baseline.json
+"""
+import argparse
+import atexit
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+# БД бенчмарка — временный файл; переменная должна быть задана до импорта app.services.db
+_TMP = tempfile.mkdtemp(prefix="moex-bench-")
+atexit.register(shutil.rmtree, _TMP, True)
+os.environ["FLASK_DB_URL"] = f"sqlite:///{os.path.join(_TMP, 'bench.sqlite3')}"
+
+from flask import render_template  # noqa: E402
+
+from app import create_app  # noqa: E402
+from app.blueprints.market.routes import _grid_html, _sections  # noqa: E402
+from app.services import heatmap_service, snapshot_cache  # noqa: E402
+from app.services.fragment_cache import fragments  # noqa: E402
+from app.services.heatmap_service import HeatmapService  # noqa: E402
+from app.services.init_db import create_all_tables  # noqa: E402
+from app.services.moex_client import MoexClient  # noqa: E402
+from app.services.repository import MoexRepository  # noqa: E402
+from app.services.search_service import SearchService  # noqa: E402
+from app.services.treemap import build_treemap  # noqa: E402
+from benchmarks.fixtures import FixtureTransport, fixture_mismatch, load_raw  # noqa: E402
+
+SPECS = {
+    "TQBR": ("stock", "shares"),
+    "RFUD": ("futures", "forts"),
+    "SYNTH": ("stock", "shares"),
+}
+SYNTH_SIZE = 20_000
+
+
+def measure(fn, repeat: int, warmup: int = 1) -> dict:
+    for _ in range(warmup):
+        fn()
+    times = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        times.append((time.perf_counter() - started) * 1000.0)
+    return {"median_ms": round(statistics.median(times), 4), "best_ms": round(min(times), 4), "n": repeat}
+
+
+def git_rev() -> str | None:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.dirname(__file__)), timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def run(repeat: int) -> dict:
+    raw, sources = {}, {}
+    for board in ("TQBR", "RFUD"):
+        raw[board], sources[board] = load_raw(board)
+    raw["SYNTH"], sources["SYNTH"] = load_raw("SYNTH", size=SYNTH_SIZE)
+
+    client = MoexClient(timeout=1, retries=0, transport=FixtureTransport(raw))
+    full_client = MoexClient(timeout=1, retries=0, transport=client.transport, reference_cache=False)
+    heatmap = HeatmapService()
+    results: dict = {}
+
+    def bench(name: str, fn, n: int = repeat) -> None:
+        results[name] = measure(fn, n)
+        print(f"{name:<48}{results[name]['median_ms']:>12.3f} ms")
+
+    # --- разбор ISS и расчёт плиток ---
+    rows, tiles = {}, {}
+    for board, (engine, market) in SPECS.items():
+        n = max(3, repeat // 10) if board == "SYNTH" else repeat
+        bench(f"parse.get_board_data[{board},full]", lambda: full_client.get_board_data(engine, market, board), n)
+        bench(f"parse.get_board_data[{board}]", lambda: client.get_board_data(engine, market, board), n)
+        rows[board] = client.get_board_data(engine, market, board)["rows"]
+        bench(f"heatmap.compute_tiles[{board}]", lambda: heatmap.compute_tiles(rows[board]), n)
+        tiles[board] = heatmap.compute_tiles(rows[board])
+
+    # --- раскладка treemap (на сервере считается раз на версию данных борда) ---
+    for label, data in (("TQBR", tiles["TQBR"]), ("RFUD", tiles["RFUD"]),
+                        ("SYNTH 2k", tiles["SYNTH"][:2000]), ("SYNTH", tiles["SYNTH"])):
+        bench(f"treemap.build[{label}]", lambda: build_treemap(data), max(3, repeat // 10) if label == "SYNTH" else repeat)
+
+    # --- поиск по индексу (индекс строится один раз на версию данных) ---
+    search = SearchService()
+    both = tiles["TQBR"] + tiles["RFUD"]
+    for query in ("TQ00001", "RF", "ао"):
+        bench(f"search.search[{query}]", lambda: search.search(both, query, limit=50, version="bench"))
+    bench("search.search[SYNTH,cold index]", lambda: search.search(tiles["SYNTH"], "SY1", limit=50),
+          max(3, repeat // 10))
+
+    # --- репозиторий ---
+    create_all_tables()
+    repo = MoexRepository()
+    t0 = datetime(2026, 1, 5, 10, 0)
+    snapshot_ids = {}
+    for board in ("TQBR", "RFUD"):
+        engine, market = SPECS[board]
+        items = heatmap.to_db_items(tiles[board])
+        # Справочники и бумаги уже есть — как у коллектора в установившемся режиме
+        st = repo.save_snapshot(engine, market, board, items, created_at=t0)
+        repo.session.commit()
+        snapshot_ids[board] = st["snapshot_id"]
+        brd = repo._get_or_create_board(repo._get_or_create_market(repo._get_or_create_engine(engine), market), board)
+        tick = iter(range(1, 10 ** 9))
+
+        def _add_items():
+            snap = repo.create_snapshot(brd, created_at=t0 + timedelta(seconds=next(tick)))
+            repo.add_items(snap, items)
+            repo.session.flush()
+            repo.session.rollback()
+
+        bench(f"repo.add_items[{board}]", _add_items)
+
+    # 500 снимков для list_snapshots
+    engine, market = SPECS["TQBR"]
+    items = heatmap.to_db_items(tiles["TQBR"])
+    for i in range(1, 500):
+        items[i % len(items)]["last"] = (items[i % len(items)]["last"] or 1) + 0.01
+        repo.save_snapshot(engine, market, "TQBR", items, created_at=t0 + timedelta(minutes=i))
+        if i % 50 == 0:
+            repo.session.commit()
+    repo.session.commit()
+
+    for board, sid in snapshot_ids.items():
+        def _cold():
+            snapshot_cache.tiles_lru.clear()
+            repo.get_tiles_for_snapshot_id(sid, limit=None)
+
+        bench(f"repo.get_tiles_for_snapshot[{board},cold]", _cold)
+        bench(f"repo.get_tiles_for_snapshot[{board},lru]", lambda: repo.get_tiles_for_snapshot_id(sid, limit=None))
+    bench("repo.list_snapshots[TQBR,100 of 500]", lambda: repo.list_snapshots("TQBR", limit=100))
+    repo.close()
+
+    # --- рендер: страница без сеток; сетка — отдельный фрагмент (cold — заново, warm — из кэша фрагментов) ---
+    app = create_app()
+    with app.test_request_context("/market/parser"):
+        bench("render.parser_html", lambda: render_template(
+            "parser.html", page_title="bench", sections=_sections(tiles), errors={}, freshness={}, mode="fast"))
+        for label, data, version in (("", tiles["TQBR"], "bench-1"), ("2k,", tiles["SYNTH"][:2000], "bench-2")):
+            def _cold():
+                fragments.clear()
+                _grid_html("TQBR", data, version)
+
+            bench(f"render.grid_fragment[{label}cold]", _cold)
+            bench(f"render.grid_fragment[{label}warm]", lambda: _grid_html("TQBR", data, version))
+
+    return {
+        "meta": {
+            "created_at": datetime.utcnow().isoformat(timespec="seconds"),
+            "git": git_rev(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "numpy": heatmap_service.np is not None,
+            "fixtures": sources,
+            "repeat": repeat,
+        },
+        "results": results,
+    }
+
+
+def compare(current: dict, baseline: dict, threshold: float, min_ms: float = 0.05) -> list:
+    """
+    Список регрессий: (имя, было, стало, отношение) для медиан, выросших больше чем на threshold
+    и больше чем на min_ms в абсолюте (микросекундные замеры иначе «регрессируют» от шума).
+    """
+    regressions = []
+    print(f"\n{'benchmark':<48}{'baseline':>12}{'current':>12}{'ratio':>9}")
+    for name, cur in current["results"].items():
+        base = baseline["results"].get(name)
+        if base is None:
+            print(f"{name:<48}{'—':>12}{cur['median_ms']:>12.3f}{'new':>9}")
+            continue
+        ratio = cur["median_ms"] / base["median_ms"] if base["median_ms"] else float("inf")
+        flag = ""
+        if ratio > 1 + threshold and cur["median_ms"] - base["median_ms"] > min_ms:
+            flag = "  REGRESSION"
+            regressions.append((name, base["median_ms"], cur["median_ms"], ratio))
+        elif ratio < 1 - threshold:
+            flag = "  faster"
+        print(f"{name:<48}{base['median_ms']:>12.3f}{cur['median_ms']:>12.3f}{ratio:>8.2f}x{flag}")
+    return regressions
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=30)
+    parser.add_argument("--quick", action="store_true", help="меньше повторов (для быстрой проверки)")
+    parser.add_argument("--out", help="куда сохранить JSON (по умолчанию benchmarks/results/<время>.json)")
+    parser.add_argument("--compare", help="JSON прошлого прогона для сравнения")
+    parser.add_argument("--threshold", type=float, default=0.15, help="допустимый рост медианы (0.15 = 15%%)")
+    parser.add_argument("--min-ms", type=float, default=0.05, help="минимальный рост медианы в мс, чтобы считать регрессией")
+    parser.add_argument("--allow-fixture-mismatch", action="store_true",
+                        help="сравнивать, даже если данные базового прогона другие (только предупреждение)")
+    args = parser.parse_args()
+
+    report = run(5 if args.quick else args.repeat)
+    fixtures = report["meta"]["fixtures"]
+    print(f"\nfixtures: {fixtures}, numpy: {report['meta']['numpy']}")
+    synthetic = [b for b, src in fixtures.items() if b != "SYNTH" and src == "synthetic"]
+    if synthetic:
+        print(f"WARNING: no recorded ISS fixtures for {', '.join(synthetic)} — synthetic data "
+              f"(python -m benchmarks.record_fixtures)")
+
+    out = args.out or os.path.join(os.path.dirname(__file__), "results",
+                                   f"{datetime.utcnow():%Y%m%d-%H%M%S}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"saved: {out}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        mismatch = fixture_mismatch(fixtures, baseline.get("meta", {}).get("fixtures"))
+        if mismatch:
+            for board, (was, now) in mismatch.items():
+                print(f"fixture {board}: baseline {was}, current {now}")
+            if not args.allow_fixture_mismatch:
+                print("baseline was measured on different data, not comparing (--allow-fixture-mismatch to force)")
+                sys.exit(2)
+            print("WARNING: comparing runs on different data")
+        regressions = compare(report, baseline, args.threshold, args.min_ms)
+        if regressions:
+            print(f"\n{len(regressions)} regression(s) over {args.threshold:.0%}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+# benchmarks/synthetic.py
+"""
+Синтетические ответы ISS в формате securities + marketdata (columns/data),
+как их отдаёт /iss/engines/.../boards/<BOARD>/securities.json.
+Размер задаётся произвольно — от размера реального борда до десятков тысяч строк.
+select_tables повторяет за ISS параметры iss.only и <таблица>.columns.
+"""
+
+from __future__ import annotations
+import random
+from typing import Any, Dict, Mapping
+
+SEC_COLUMNS = ["SECID", "SHORTNAME", "PREVPRICE", "PREVSETTLEPRICE"]
+MD_COLUMNS = ["SECID", "LAST", "OPEN", "LOW", "HIGH", "VALTODAY", "VOLTODAY"]
+
+
+def iss_board_payload(board: str = "TQBR", size: int = 260, seed: int = 42) -> Dict[str, Any]:
+    """
+    Ответ ISS для борда из size бумаг. Как в жизни, встречаются: бумаги без сделок
+    (LAST=None), нулевые цены, отсутствующие строки marketdata, фьючерсная база
+    (PREVSETTLEPRICE вместо PREVPRICE).
+    """
+    rnd = random.Random(f"{board}:{size}:{seed}")
+    futures = board.upper() == "RFUD"
+    sec_rows, md_rows = [], []
+    for i in range(size):
+        secid = f"{board[:2].upper()}{i:05d}"
+        prev = round(rnd.uniform(0.5, 8000), 2)
+        if i % 97 == 0:
+            prev = 0.0
+        if futures:
+            sec_rows.append([secid, f"{secid}-12.26", None, prev])
+        else:
+            sec_rows.append([secid, f"Эмитент {i} ао", prev, None if i % 3 else prev])
+        if i % 53 == 0:
+            continue  # бумага без marketdata
+        last = None if i % 11 == 0 else round(prev * rnd.uniform(0.9, 1.1), 2)
+        valtoday = None if last is None else round(rnd.uniform(0, 5e9), 2)
+        voltoday = rnd.randint(0, 10 ** 7)
+        md_rows.append([secid, last, prev, prev * 0.95, prev * 1.05, valtoday, voltoday])
+    rnd.shuffle(md_rows)
+    return {
+        "securities": {"columns": SEC_COLUMNS, "data": sec_rows},
+        "marketdata": {"columns": MD_COLUMNS, "data": md_rows},
+    }
+
+
+def select_tables(payload: Dict[str, Any], params: Mapping[str, str] | None = None) -> Dict[str, Any]:
+    """Как ISS: iss.only — какие таблицы отдать, <таблица>.columns — какие колонки и в каком порядке."""
+    params = params or {}
+    only = [t.strip() for t in (params.get("iss.only") or ",".join(payload)).split(",") if t.strip()]
+    out = {}
+    for name in only:
+        table = payload.get(name)
+        if table is None:
+            continue
+        wanted = params.get(f"{name}.columns")
+        if wanted:
+            columns = [c for c in wanted.split(",") if c in table["columns"]]
+            idx = [table["columns"].index(c) for c in columns]
+            table = {"columns": columns, "data": [[row[i] for i in idx] for row in table["data"]]}
+        out[name] = table
+    return out
@@ -0,0 +1,18 @@
+# scripts/bootstrap.py
+"""
+Общий старт скриптов, работающих с БД без create_app: настройки хранения снимков
+(режим, dedup, top-K, схема партиций) берутся из Config, а схемы отдельных бордов —
+из реестра (BOARDS_FILE, поле partition), так же, как в веб-приложении; при необходимости
+создаются/доводятся таблицы.
+Использование:  from scripts.bootstrap import setup; setup()
+"""
+from app.config import Config
+from app.services import snapshot_storage
+from app.services.board_registry import BoardRegistry
+from app.services.init_db import create_all_tables
+
+
+def setup(create_tables: bool = True) -> list[str]:
+    """Применяет Config к хранению снимков; create_tables — ещё и create_all_tables() (шаги миграций)."""
+    snapshot_storage.configure_from(Config, partition_by_board=BoardRegistry.from_config(Config).partitions())
+    return create_all_tables() if create_tables else []
@@ -1,10 +1,12 @@
 # scripts/create_db.py
 """
-Создаёт таблицы в файле flaskparsermoex.sqlite3
+Создаёт таблицы в файле flaskparsermoex.sqlite3 (или FLASK_DB_URL) и применяет миграции схемы.
+Веб-приложение при старте схему не трогает — после обновления кода запускайте этот шаг
+(или flask --app run init-db).
 Запуск:  python -m scripts.create_db
 """
-from app.services.init_db import create_all_tables
+from scripts.bootstrap import setup
 
 if __name__ == "__main__":
-    create_all_tables()
-    print("SQLite: таблицы созданы.")
+    steps = setup()
+    print("SQLite: таблицы созданы." + (f" Миграции: {', '.join(steps)}" if steps else ""))
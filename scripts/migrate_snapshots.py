@@ -0,0 +1,73 @@
+# scripts/migrate_snapshots.py
+"""
+Переводит уже накопленные снимки в компактное хранение:
+- удаляет снимки, совпадающие по содержимому с предыдущим (--no-dedup — не удалять);
+- перекодирует полные снимки в ключевые кадры + дельты (--no-delta — только dedup);
+- досчитывает агрегаты (stats_json) для снимков, записанных до их появления;
+- печатает отчёт об освобождённом месте (--vacuum — сразу сжать файл БД).
+Запуск: python -m scripts.migrate_snapshots [--board TQBR] [--no-delta] [--no-dedup] [--vacuum]
+"""
+import argparse
+
+from sqlalchemy import text
+
+from app.services import partitions
+from app.services.db import SessionLocal, get_engine
+from app.services.models import Board
+from app.services.repository import MoexRepository
+from scripts.bootstrap import setup
+
+
+def db_stats() -> dict:
+    with get_engine().connect() as conn:
+        page_size = conn.execute(text("PRAGMA page_size")).scalar()
+        pages = conn.execute(text("PRAGMA page_count")).scalar()
+        free = conn.execute(text("PRAGMA freelist_count")).scalar()
+        snaps = conn.execute(text("SELECT COUNT(*) FROM snapshots")).scalar()
+        names = conn.execute(text(
+            "SELECT name FROM sqlite_master WHERE type = 'table' AND name LIKE 'snapshot%items%'")).scalars()
+        items = sum(conn.execute(text(f'SELECT COUNT(*) FROM "{name}"')).scalar()
+                    for name in names if name == partitions.LEGACY or partitions.parse_name(name))
+    return {"snapshots": snaps, "items": items,
+            "file_bytes": pages * page_size, "used_bytes": (pages - free) * page_size}
+
+
+def mb(n: int) -> str:
+    return f"{n / 1024 / 1024:.2f} MB"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--board", action="append", help="код борда (по умолчанию — все)")
+    parser.add_argument("--no-delta", action="store_true")
+    parser.add_argument("--no-dedup", action="store_true")
+    parser.add_argument("--vacuum", action="store_true")
+    args = parser.parse_args()
+
+    setup()  # колонки kind/base_id/content_hash/items_count для старых файлов
+    before = db_stats()
+
+    s = SessionLocal()
+    repo = MoexRepository(s)
+    try:
+        boards = args.board or sorted({b.code for b in s.query(Board).all()})
+        for code in boards:
+            st = repo.compact_board(code, delta=not args.no_delta, dedup=not args.no_dedup)
+            print(f"[{code}] снимков: {st['snapshots']}, дубликатов удалено: {st['deduplicated']}, "
+                  f"в дельты: {st['to_delta']}, ключевых кадров: {st['keyframes']}, "
+                  f"строк удалено: {st['items_deleted']}, "
+                  f"агрегатов досчитано: {repo.backfill_stats(code)}")
+    finally:
+        repo.close()
+
+    if args.vacuum:
+        with get_engine().connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+            conn.execute(text("VACUUM"))
+    after = db_stats()
+
+    print(f"\nСнимков: {before['snapshots']} -> {after['snapshots']}, "
+          f"строк снимков (все партиции): {before['items']} -> {after['items']}")
+    print(f"Занято данными: {mb(before['used_bytes'])} -> {mb(after['used_bytes'])} "
+          f"(освобождено {mb(before['used_bytes'] - after['used_bytes'])})")
+    print(f"Файл БД: {mb(before['file_bytes'])} -> {mb(after['file_bytes'])}"
+          + ("" if args.vacuum else " (без --vacuum место остаётся во freelist)"))
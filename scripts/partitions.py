@@ -0,0 +1,89 @@
+# scripts/partitions.py
+"""
+Партиции строк снимков (snapshot_items_<борд>[_<YYYYMM>], см. app/services/partitions.py).
+Запуск:
+  python -m scripts.partitions list
+  python -m scripts.partitions migrate [--board TQBR]       # общая snapshot_items -> партиции
+  python -m scripts.partitions detach --before 2025-06 [--board TQBR] [--archive] [--dry-run]
+  python -m scripts.partitions detach --name snapshot_items_1_202504 [--archive]
+Отцеплённая с --archive партиция лежит в ARCHIVE_DIR/partitions/<имя>.sqlite3.
+"""
+import argparse
+import os
+import sys
+
+from sqlalchemy import select
+
+from app.config import Config
+from app.services.db import SessionLocal, get_engine
+from app.services.models import Board
+from app.services.repository import MoexRepository
+from app.services.retention import incremental_vacuum
+from scripts.bootstrap import setup
+
+
+def cmd_list(repo: MoexRepository, args) -> None:
+    for p in repo.list_partitions():
+        span = f"{p['first']:%Y-%m-%d %H:%M} .. {p['last']:%Y-%m-%d %H:%M}" if p["first"] else "-"
+        print(f"{p['name']:<32} {p['board'] or '-':<8} {p['period'] or '-':<8} "
+              f"снимков: {p['snapshots']:<7} {span}")
+
+
+def cmd_migrate(repo: MoexRepository, args) -> None:
+    boards = args.board or sorted(repo.session.scalars(select(Board.code)))
+    for code in boards:
+        st = repo.migrate_legacy_items(code)
+        print(f"[{code}] снимков перенесено: {st['snapshots']}, партиций: {st['partitions']}, "
+              f"дельт развёрнуто в кадры: {st['materialized']}")
+    if not args.board:
+        print("общая snapshot_items удалена" if repo.drop_legacy_items()
+              else "общая snapshot_items не удалена (нет таблицы или в ней остались строки)")
+
+
+def cmd_detach(repo: MoexRepository, args) -> None:
+    if args.name:
+        names = [args.name]
+    else:
+        boards = {c.upper() for c in args.board or ()}
+        names = [p["name"] for p in repo.list_partitions()
+                 if p["period"] and p["period"] < args.before and (not boards or p["board"] in boards)]
+    if not names:
+        print("нечего отцеплять")
+        return
+    for name in names:
+        if args.dry_run:
+            print(f"[dry-run] {name}")
+            continue
+        archive = os.path.join(Config.ARCHIVE_DIR, "partitions", f"{name}.sqlite3") if args.archive else None
+        try:
+            st = repo.detach_partition(name, archive_path=archive)
+        except ValueError as exc:
+            print(f"{name}: пропущена — {exc}", file=sys.stderr)
+            continue
+        print(f"{name}: снимков удалено: {st['snapshots']}" + (f", архив: {archive}" if archive else ""))
+    if not args.dry_run:
+        print(f"возвращено страниц файлу: {incremental_vacuum(get_engine())}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    sub.add_parser("list")
+    p_migrate = sub.add_parser("migrate")
+    p_migrate.add_argument("--board", action="append", help="код борда (по умолчанию — все)")
+    p_detach = sub.add_parser("detach")
+    which = p_detach.add_mutually_exclusive_group(required=True)
+    which.add_argument("--name", help="имя партиции (см. list)")
+    which.add_argument("--before", metavar="YYYY-MM", help="все месячные партиции раньше этого месяца")
+    p_detach.add_argument("--board", action="append", help="только эти борды (с --before)")
+    p_detach.add_argument("--archive", action="store_true", help="сохранить партицию в ARCHIVE_DIR/partitions")
+    p_detach.add_argument("--dry-run", action="store_true")
+    args = parser.parse_args()
+
+    setup()  # колонка snapshots.part для старых файлов
+    s = SessionLocal()
+    repo = MoexRepository(s)
+    try:
+        {"list": cmd_list, "migrate": cmd_migrate, "detach": cmd_detach}[args.cmd](repo, args)
+    finally:
+        repo.close()
@@ -0,0 +1,75 @@
+# scripts/retention.py
+"""
+Retention снимков: прореживает старые снимки по ступеням RETENTION_TIERS,
+вытесненные архивирует в ARCHIVE_DIR и возвращает место файлу БД.
+Запуск:
+  python -m scripts.retention [--board TQBR] [--dry-run] [--tiers "7d:all,30d:5m,*:1h"]
+  python -m scripts.retention --loop 3600              # повторять раз в час
+  python -m scripts.retention --enable-incremental-vacuum   # один раз для старого файла БД (VACUUM)
+  python -m scripts.retention --read TQBR --from 2025-10-01 --to 2025-10-02 > old.csv
+"""
+import argparse
+import logging
+import sys
+import time
+
+from sqlalchemy import text
+
+from app.config import Config
+from app.services.db import get_engine
+from app.services.export_service import RANGE_FIELDS, iter_csv
+from app.services.retention import RetentionJob, iter_archive, parse_tiers
+from app.services.time_utils import parse_iso_utc
+from scripts.bootstrap import setup
+
+
+def enable_incremental_vacuum() -> None:
+    """auto_vacuum у существующего файла меняется только полным VACUUM (долгая блокировка — один раз)."""
+    with get_engine().connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+        mode = conn.execute(text("PRAGMA auto_vacuum")).scalar()
+        if mode == 2:
+            print("auto_vacuum уже INCREMENTAL")
+            return
+        conn.execute(text("PRAGMA auto_vacuum=INCREMENTAL"))
+        conn.execute(text("VACUUM"))
+        print("auto_vacuum=INCREMENTAL включён")
+
+
+def read_archive(board: str, start, end) -> None:
+    def _rows():
+        for _, created_at, tiles in iter_archive(Config.ARCHIVE_DIR, board, start, end):
+            for t in tiles:
+                yield {"board": board, "snapshot_at": created_at.isoformat(sep=" "), **t}
+
+    for chunk in iter_csv(_rows(), RANGE_FIELDS):
+        sys.stdout.write(chunk)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--board", action="append", help="код борда (по умолчанию — все)")
+    parser.add_argument("--tiers", default=Config.RETENTION_TIERS)
+    parser.add_argument("--dry-run", action="store_true", help="только посчитать, что будет вытеснено")
+    parser.add_argument("--loop", type=int, default=0, help="повторять каждые N секунд")
+    parser.add_argument("--enable-incremental-vacuum", action="store_true")
+    parser.add_argument("--read", metavar="BOARD", help="выгрузить архив борда в CSV (stdout)")
+    parser.add_argument("--from", dest="start")
+    parser.add_argument("--to", dest="end")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+
+    if args.read:
+        read_archive(args.read.upper(), parse_iso_utc(args.start), parse_iso_utc(args.end))
+        sys.exit(0)
+
+    setup()
+    if args.enable_incremental_vacuum:
+        enable_incremental_vacuum()
+
+    job = RetentionJob(parse_tiers(args.tiers), Config.ARCHIVE_DIR)
+    while True:
+        for st in job.run(boards=args.board, dry_run=args.dry_run):
+            print(st)
+        if not args.loop:
+            break
+        time.sleep(args.loop)
@@ -0,0 +1,38 @@
+# scripts/run_collector.py
+"""
+Отдельный процесс фонового сбора снимков (борды реестра BOARDS из Config).
+Веб при этом только читает БД/кэш. Остановка — Ctrl+C / SIGTERM,
+текущий борд дописывается до конца.
+Запуск:  python -m scripts.run_collector [--once]
+Статус:  COLLECTOR_STATUS_FILE=collector.json → /market/api/collector
+"""
+import logging
+import signal
+import sys
+
+from app import create_app
+from app.services.collector import SnapshotCollector
+from app.services.init_db import create_all_tables
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    app = create_app()
+    # Этот процесс и есть внешний коллектор: плитки — в общее хранилище (tile_cache.store_kind)
+    app.config["COLLECTOR_MODE"] = "process"
+    # Коллектор — единственный писатель: схему проверяем один раз здесь, а не в каждом веб-воркере
+    create_all_tables()
+    collector = SnapshotCollector(app)
+
+    if "--once" in sys.argv:
+        collector.run_once()
+        for code, st in collector.status()["boards"].items():
+            print(f"[{code}] строк: {st['items']}, ошибка: {st['last_error']}")
+        sys.exit(0)
+
+    def _shutdown(signum, _frame):
+        logging.info("collector: signal %s, stopping...", signum)
+        collector.stop(timeout=None)
+
+    signal.signal(signal.SIGINT, _shutdown)
+    signal.signal(signal.SIGTERM, _shutdown)
+    collector.run_forever()
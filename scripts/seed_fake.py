@@ -3,10 +3,10 @@ from datetime import datetime
 from app.services.db import SessionLocal
 from app.services.models import Engine, Market, Board
 from app.services.repository import MoexRepository
-from app.services.init_db import create_all_tables
+from scripts.bootstrap import setup
 
 if __name__ == "__main__":
-    create_all_tables()
+    setup()
     s = SessionLocal()
     repo = MoexRepository(s)
 
@@ -1,18 +1,17 @@
 # scripts/seed_from_moex.py
 """
-Тянет реальные данные с MOEX через наши сервисы и сохраняет СНИМКИ в БД.
+Тянет реальные данные с MOEX через наши сервисы и сохраняет СНИМКИ в БД —
+по всем бордам реестра (BOARDS / BOARDS_FILE в Config).
 Запуск: python -m scripts.seed_from_moex
 """
 from datetime import datetime
+from app.config import Config
+from app.services.board_registry import BoardRegistry
 from app.services.db import SessionLocal
-from app.services.init_db import create_all_tables
 from app.services.repository import MoexRepository
 from app.services.heatmap_service import HeatmapService
 from app.services.moex_client import MoexClient
-
-# Настрой борды под свои Config, если нужно
-STOCK = {"engine": "stock", "market": "shares", "board": "TQBR"}
-FUT   = {"engine": "futures", "market": "forts", "board": "RFUD"}
+from scripts.bootstrap import setup
 
 def fetch_tiles(engine: str, market: str, board: str) -> list[dict]:
     client = MoexClient(timeout=10, retries=2)
@@ -20,28 +19,24 @@ def fetch_tiles(engine: str, market: str, board: str) -> list[dict]:
     return HeatmapService().compute_tiles(data["rows"])
 
 if __name__ == "__main__":
-    create_all_tables()
+    setup()
 
     s = SessionLocal()
     repo = MoexRepository(s)
     try:
-        # STOCK
-        eng_s = repo._get_or_create_engine(STOCK["engine"], "Stocks")
-        mkt_s = repo._get_or_create_market(eng_s, STOCK["market"], "Shares")
-        brd_s = repo._get_or_create_board(mkt_s, STOCK["board"], "T+ Акции")
-        tiles_s = fetch_tiles(**STOCK)
-        snap_s = repo.create_snapshot(brd_s, created_at=datetime.utcnow())
-        repo.add_items(snap_s, HeatmapService().to_db_items(tiles_s))
-
-        # FUTURES
-        eng_f = repo._get_or_create_engine(FUT["engine"], "Futures")
-        mkt_f = repo._get_or_create_market(eng_f, FUT["market"], "Forts")
-        brd_f = repo._get_or_create_board(mkt_f, FUT["board"], "Фьючерсы")
-        tiles_f = fetch_tiles(**FUT)
-        snap_f = repo.create_snapshot(brd_f, created_at=datetime.utcnow())
-        repo.add_items(snap_f, HeatmapService().to_db_items(tiles_f))
+        now = datetime.utcnow()
+        stats = []
+        for b in BoardRegistry.from_config(Config):
+            tiles = fetch_tiles(b["engine"], b["market"], b["board"])
+            stats.append(repo.save_snapshot(
+                b["engine"], b["market"], b["board"],
+                HeatmapService().to_db_items(tiles), created_at=now,
+                titles={"board": b["title"]},
+            ))
 
         s.commit()
+        for st in stats:
+            print(f"[{st['board']}] {st['items']} строк, новых бумаг: {st['securities_new']}, {st['elapsed_ms']} мс")
         print("OK: реальные данные загружены в БД.")
     finally:
         repo.close()
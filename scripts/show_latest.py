@@ -1,14 +1,18 @@
 # scripts/show_latest.py
 """
-Выводит 10 бумаг из последнего снимка для TQBR и RFUD.
+Выводит 10 бумаг из последнего снимка для каждого борда реестра (BOARDS).
 Запуск: python -m scripts.show_latest
 """
+from app.config import Config
+from app.services.board_registry import BoardRegistry
 from app.services.repository import MoexRepository
+from scripts.bootstrap import setup
 
 if __name__ == "__main__":
+    setup(create_tables=False)
     repo = MoexRepository()
     try:
-        for board in ("TQBR", "RFUD"):
+        for board in BoardRegistry.from_config(Config).codes():
             snap = repo.get_snapshot_by_time(board, at_utc=None)
             tiles = repo.get_tiles_for_snapshot(snap)
             print(f"\n[{board}] {len(tiles)} rows")
@@ -0,0 +1,40 @@
+# tests/conftest.py
+import os
+import sys
+import tempfile
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+# Config читает окружение при импорте app, а тесты импортируют app.services ещё на сборке —
+# поэтому временная БД задаётся здесь, до любого импорта app
+_TMP = tempfile.TemporaryDirectory(prefix="moex-tests-")
+os.environ.update(
+    FLASK_DB_URL=f"sqlite:///{os.path.join(_TMP.name, 'test.sqlite3')}",
+    DB_AUTO_INIT="1",
+    COLLECTOR_MODE="off",
+    TILE_STORE="memory",
+    METRICS_ENABLED="0",
+    COLLECTOR_LOCK_FILE=os.path.join(_TMP.name, "collector.lock"),
+)
+
+from benchmarks.stub_iss import start_stub  # noqa: E402
+
+
+@pytest.fixture(scope="session")
+def app():
+    """Приложение на временной SQLite (схема создаётся на старте, DB_AUTO_INIT=1)."""
+    from app import create_app
+    return create_app()
+
+
+@pytest.fixture
+def stub():
+    """Заглушка ISS с небольшой задержкой: (state, base). state.fail — борды, отвечающие 500."""
+    server, state, base = start_stub(0.05)
+    yield state, base
+    server.shutdown()
+    server.server_close()
@@ -0,0 +1,167 @@
+# tests/test_bulk_collector.py
+"""Массовый сбор бордов против локальной заглушки ISS (benchmarks.stub_iss)."""
+import threading
+import time
+
+from sqlalchemy import select
+
+from benchmarks.stub_iss import BOARDS_BY_MARKET, DEAD, SECONDARY
+from app.services.bulk_collector import BulkCollector, RateLimiter, discover_boards, parse_board_filter
+from app.services.http_transport import HttpTransport
+from app.services.moex_client import MoexClient
+
+SHARES = [{"engine": "stock", "market": "shares", "board": b} for b in BOARDS_BY_MARKET["shares"]]
+
+
+def make_client(base, retries=0):
+    return MoexClient(base=base, retries=retries, reference_cache=False,
+                      transport=HttpTransport(pool_size=4, backoff_base=0.01))
+
+
+def board_requests(state):
+    return sorted(t for t, path in state.requests if path.startswith("/iss/engines/"))
+
+
+def test_discover_boards_filters_index(stub):
+    _, base = stub
+    index = make_client(base).get_boards_index()
+
+    shares = discover_boards(index, parse_board_filter("stock/shares"))
+    assert [s["board"] for s in shares] == BOARDS_BY_MARKET["shares"]
+
+    with_secondary = {s["board"] for s in discover_boards(index, parse_board_filter("stock/shares"), primary_only=False)}
+    assert set(SECONDARY) <= with_secondary
+    assert not set(DEAD) & with_secondary  # неторгуемые не берём никогда
+
+    futures = {s["board"] for s in discover_boards(index, parse_board_filter(" Futures , currency/selt "))}
+    assert futures == set(BOARDS_BY_MARKET["forts"] + BOARDS_BY_MARKET["options"] + BOARDS_BY_MARKET["selt"])
+
+
+def test_rate_limiter_paces_threads():
+    limiter = RateLimiter(20)
+    stamps, lock = [], threading.Lock()
+
+    def _take():
+        for _ in range(3):
+            limiter.acquire()
+            with lock:
+                stamps.append(time.monotonic())
+
+    threads = [threading.Thread(target=_take) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    stamps.sort()
+    # k-й токен выдаётся не раньше своего слота (поток может проснуться позже, но не раньше)
+    assert all(t - stamps[0] >= k / 20 - 0.005 for k, t in enumerate(stamps))
+
+    # Токен освободится позже дедлайна — отказ без резервации
+    assert limiter.acquire(deadline=time.monotonic()) is False
+
+
+def test_bulk_rate_limit_covers_every_request(stub):
+    state, base = stub
+    bulk = BulkCollector(make_client(base, retries=1), rate=20, max_concurrency=4, board_timeout=5, cycle_timeout=10)
+    state.fail = {"SMAL"}  # повтор тоже под лимитом
+    try:
+        result = bulk.run(SHARES)
+    finally:
+        bulk.close()
+    assert set(result["loaded"]) == {s["board"] for s in SHARES} - {"SMAL"}
+    times = board_requests(state)
+    assert len(times) == len(SHARES) + 1
+    # Темп меряем на стороне заглушки: разные соединения дают дрожание в единицы мс, поэтому окно, а не интервалы
+    assert times[-1] - times[0] >= (len(times) - 1) / 20 - 0.03
+    assert max(sum(t <= u < t + 0.25 for u in times) for t in times) <= 0.25 * 20 + 1
+    assert state.max_active <= 4
+
+
+def test_board_returning_500_fails_alone(stub):
+    state, base = stub
+    state.fail = {"TQTF"}
+    bulk = BulkCollector(make_client(base, retries=2), rate=0, max_concurrency=4, board_timeout=5, cycle_timeout=10)
+    try:
+        result = bulk.run(SHARES)
+    finally:
+        bulk.close()
+    assert list(result["errors"]) == ["TQTF"]
+    assert "500" in result["errors"]["TQTF"]
+    assert len(result["loaded"]) == len(SHARES) - 1
+    assert all(result["loaded"][b] for b in result["loaded"])
+    assert sum(path.endswith("/TQTF/securities.json") for _, path in state.requests) == 3
+
+
+def test_board_timeout_counts_from_worker_start(stub):
+    state, base = stub
+    state.latency = 0.4
+    # Один воркер: борды ждут в очереди пула, но ожидание не съедает их таймаут
+    bulk = BulkCollector(make_client(base), rate=0, max_concurrency=1, board_timeout=0.15, cycle_timeout=10)
+    started = time.monotonic()
+    try:
+        result = bulk.run(SHARES[:3])
+    finally:
+        bulk.close()
+    assert result["loaded"] == {}
+    assert result["errors"] == {s["board"]: "timeout after 0.15s" for s in SHARES[:3]}
+    assert len(board_requests(state)) == 3
+    assert time.monotonic() - started < 3 * 0.4
+
+
+def test_cycle_deadline_stops_threads(stub):
+    state, base = stub
+    state.latency = 0.3
+    bulk = BulkCollector(make_client(base), rate=0, max_concurrency=1, board_timeout=5, cycle_timeout=0.5)
+    started = time.monotonic()
+    try:
+        result = bulk.run(SHARES[:4])
+    finally:
+        bulk.close()
+    elapsed = time.monotonic() - started
+    assert list(result["loaded"]) == [SHARES[0]["board"]]
+    assert set(result["errors"]) == {s["board"] for s in SHARES[1:4]}
+    assert set(result["errors"].values()) == {"cycle deadline 0.5s"}
+    assert elapsed < 0.5 + 0.2
+    # HTTP-таймаут потока не длиннее остатка цикла: после дедлайна запросов к заглушке не остаётся
+    time.sleep(0.2)
+    assert state.active == 0
+    assert len(board_requests(state)) == 2
+
+
+def test_collector_writes_batches(app, stub, monkeypatch):
+    from app.services.collector import SnapshotCollector
+    from app.services.models import Board, Snapshot
+    from app.services.repository import MoexRepository
+
+    state, base = stub
+    state.fail = {"SMAL"}
+    for key, value in {"ISS_BASE_URL": base, "HTTP_RETRIES": 0, "ISS_RATE_LIMIT": 0, "ISS_MAX_CONCURRENCY": 4,
+                       "COLLECTOR_BATCH_SIZE": 3, "COLLECTOR_DISCOVER": "stock/shares",
+                       "ISS_REFERENCE_CACHE": False}.items():
+        monkeypatch.setitem(app.config, key, value)
+    collector = SnapshotCollector(app, boards=[SHARES[0]])
+    batches = []
+    write_batch = collector._write_batch
+    monkeypatch.setattr(collector, "_write_batch", lambda batch, at: batches.append(len(batch)) or write_batch(batch, at))
+    try:
+        collector.run_once()
+    finally:
+        collector.bulk.close()
+
+    ok = [s["board"] for s in SHARES if s["board"] != "SMAL"]
+    assert sum(batches) == len(ok) and max(batches) <= 3 and len(batches) == 3
+    with app.app_context():
+        repo = MoexRepository()
+        try:
+            rows = repo.session.execute(
+                select(Board.code, Snapshot.created_at).join(Board, Snapshot.board_id == Board.id)
+                .where(Board.code.in_([s["board"] for s in SHARES]))
+            ).all()
+        finally:
+            repo.close()
+    assert sorted(code for code, _ in rows) == sorted(ok)
+    assert len({created_at for _, created_at in rows}) == 1  # у всех снимков цикла одно время
+
+    status = collector.status()["boards"]
+    assert status["SMAL"]["failures"] == 1 and "500" in status["SMAL"]["last_error"]
+    assert all(status[b]["last_ok"] and status[b]["items"] > 0 for b in ok)
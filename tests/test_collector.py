@@ -0,0 +1,66 @@
+# tests/test_collector.py
+"""Жизненный цикл SnapshotCollector: ошибки цикла не останавливают поток, в thread-режиме — один коллектор."""
+import time
+
+import pytest
+
+
+def test_failed_cycle_keeps_thread_running(app, monkeypatch):
+    from app.services.collector import SnapshotCollector
+
+    monkeypatch.setitem(app.config, "COLLECTOR_INTERVAL_TRADING", 0)
+    monkeypatch.setitem(app.config, "COLLECTOR_INTERVAL_OFFHOURS", 0)
+    collector = SnapshotCollector(app, boards=[{"engine": "stock", "market": "shares", "board": "TQBR"}])
+    calls = []
+
+    def _run_once():
+        calls.append(time.monotonic())
+        if len(calls) == 1:
+            raise RuntimeError("boom")
+        collector._cycles += 1
+
+    monkeypatch.setattr(collector, "run_once", _run_once)
+    monkeypatch.setattr(collector, "current_interval", lambda now_utc=None: 0)  # пауза между циклами — 1 с
+    collector.start()
+    try:
+        deadline = time.monotonic() + 5
+        while collector.status()["cycles"] < 1 and time.monotonic() < deadline:
+            time.sleep(0.05)
+        time.sleep(0.05)  # после run_once цикл сбрасывает ошибку
+        status = collector.status()
+        assert len(calls) >= 2
+        assert status["running"] is True
+        assert status["cycle_failures"] == 1
+        assert status["last_cycle_error"] is None  # следующий цикл прошёл
+    finally:
+        collector.stop(timeout=5)
+        collector.bulk.close()
+    assert collector.status()["running"] is False
+
+
+def test_thread_mode_runs_one_collector_per_lock(app, monkeypatch, tmp_path):
+    """Два «воркера» с одним COLLECTOR_LOCK_FILE: поток запускает только первый, второй — standby."""
+    from app.services import collector as collector_mod
+    from app.services.collector import SnapshotCollector
+
+    if collector_mod.fcntl is None:
+        pytest.skip("нет fcntl: на Windows thread-режим — только с одним воркером")
+    monkeypatch.setitem(app.config, "COLLECTOR_LOCK_FILE", str(tmp_path / "collector.lock"))
+    boards = [{"engine": "stock", "market": "shares", "board": "TQBR"}]
+    owner, other = SnapshotCollector(app, boards=boards), SnapshotCollector(app, boards=boards)
+    for c in (owner, other):
+        monkeypatch.setattr(c, "run_once", lambda: None)
+    try:
+        owner.start()
+        other.start()
+        assert owner.status()["running"] and not owner.standby
+        assert other._thread is None and other.standby and not other.status()["running"]
+
+        owner.stop(timeout=5)  # блокировка освободилась — сосед берёт её на следующей попытке
+        other._lock_retry_at = 0.0
+        other.start()
+        assert other.status()["running"] and not other.standby
+    finally:
+        for c in (owner, other):
+            c.stop(timeout=5)
+            c.bulk.close()